@@ -0,0 +1,122 @@
+# Times the graph algorithms on generated workflows of 10^4 to 10^5 steps:
+#   python benchmarks/graph.py [SIZE ...]
+from __future__ import annotations
+
+import sys
+import time
+from collections import deque
+from typing import Callable
+
+from mlflower.entry_point import EntryPoint
+from mlflower.graph import get_waves, transitive_reduction
+from mlflower.graph_utils import get_mermaid_graph, topological_sort
+from mlflower.scheduler import Limits, ReadyQueue
+
+DEFAULT_SIZES = (10_000, 30_000, 100_000)
+ROOT = "main"
+
+
+def chain(size: int) -> dict[str, EntryPoint]:
+    # The deepest possible graph
+    entry_points = {ROOT: EntryPoint()}
+    for i in range(size):
+        entry_points[f"s{i}"] = EntryPoint(depends_on={f"s{i - 1}"} if i else set())
+
+    return entry_points
+
+
+def sweeps(size: int, width: int = 100) -> dict[str, EntryPoint]:
+    # Consecutive sweeps of `width` shards, each waiting on all shards of the previous one
+    entry_points = {ROOT: EntryPoint()}
+    previous: set[str] = set()
+    for i in range(size // (width + 1)):
+        group = f"sweep{i}"
+        entry_points[group] = EntryPoint(depends_on=set(previous), workflow=True)
+        shards = {f"{group}/{j}" for j in range(width)}
+        for shard in shards:
+            entry_points[shard] = EntryPoint(
+                depends_on={group}, parent=group, sweep={"j": shard}
+            )
+        previous = shards
+
+    return entry_points
+
+
+def sweep(size: int) -> dict[str, EntryPoint]:
+    # A single sweep, far wider than the steps that may run at once
+    entry_points = {ROOT: EntryPoint(), "sweep": EntryPoint(workflow=True)}
+    for j in range(size):
+        entry_points[f"sweep/{j}"] = EntryPoint(
+            depends_on={"sweep"}, parent="sweep", sweep={"j": j}
+        )
+
+    return entry_points
+
+
+def drain(entry_points: dict[str, EntryPoint], max_parallel: int | None) -> None:
+    queue = ReadyQueue(
+        {key: ep.depends_on for key, ep in entry_points.items()},
+        done={ROOT},
+        limits=Limits(max_parallel=max_parallel),
+    )
+    while queue:
+        for key in queue.pop_ready():
+            queue.mark_done(key)
+
+
+def drain_blocked(
+    entry_points: dict[str, EntryPoint],
+    max_parallel: int | None = None,
+    cpus: float | None = None,
+) -> None:
+    # Steps finish one at a time, oldest first, so that the others stay blocked
+    queue = ReadyQueue(
+        {key: ep.depends_on for key, ep in entry_points.items()},
+        done={ROOT},
+        limits=Limits(
+            demands={key: {"cpu": 1} for key in entry_points},
+            capacity={"cpu": cpus} if cpus else {},
+            max_parallel=max_parallel,
+        ),
+    )
+    running: deque[str] = deque()
+    while queue:
+        running.extend(queue.pop_ready())
+        queue.mark_done(running.popleft())
+
+
+def timed(function: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main(sizes: list[int]) -> None:
+    operations = {
+        "topological_sort": lambda eps: topological_sort(eps, ROOT),
+        "waves": lambda eps: get_waves({k: ep.depends_on for k, ep in eps.items()}),
+        "transitive_reduction": lambda eps: transitive_reduction(
+            {k: ep.depends_on for k, ep in eps.items()}
+        ),
+        "schedule": lambda eps: drain(eps, None),
+        "schedule (max 8)": lambda eps: drain(eps, 8),
+        "blocked (max 8)": lambda eps: drain_blocked(eps, max_parallel=8),
+        "blocked (8 cpus)": lambda eps: drain_blocked(eps, cpus=8),
+        "mermaid": lambda eps: get_mermaid_graph(eps, ROOT),
+    }
+
+    print(f"{'graph':<8} {'steps':>7} {'edges':>9}  operation              seconds")
+    for size in sizes:
+        for name, generate in (("chain", chain), ("sweeps", sweeps), ("sweep", sweep)):
+            entry_points = generate(size)
+            edges = sum(len(ep.depends_on) for ep in entry_points.values())
+            for operation, function in operations.items():
+                seconds = timed(lambda f=function, eps=entry_points: f(eps))
+                print(
+                    f"{name:<8} {len(entry_points):>7} {edges:>9}  "
+                    f"{operation:<22} {seconds:>7.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main([int(size) for size in sys.argv[1:]] or list(DEFAULT_SIZES))
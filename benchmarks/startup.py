@@ -0,0 +1,59 @@
+# Times the offline commands from a fresh interpreter, and checks they don't import
+# mlflow, so that they stay usable in editors and pre-commit hooks:
+#   python benchmarks/startup.py [PROJECT]
+from __future__ import annotations
+
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+DEFAULT_PROJECT = Path(__file__).parents[1].joinpath("examples", "simple").as_posix()
+COMMANDS = ("validate", "graph", "plan")
+REPEAT = 5
+
+# Runs a command in-process, then reports whether mlflow got imported
+_CHECK_IMPORTS = """
+import contextlib, io, sys
+from mlflower.__main__ import main
+with contextlib.redirect_stdout(io.StringIO()):
+    main(sys.argv[1:], standalone_mode=False)
+print("mlflow" in sys.modules)
+"""
+
+
+def timed(args: list[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(args, check=True, capture_output=True)  # noqa: S603
+    return time.perf_counter() - start
+
+
+def imports_mlflow(command: str, project: str) -> bool:
+    output = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", _CHECK_IMPORTS, command, project],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return output.strip().splitlines()[-1] == "True"
+
+
+def main(project: str) -> None:
+    baseline = min(timed([sys.executable, "-c", "pass"]) for _ in range(REPEAT))
+    print(f"{'command':<9} seconds  imports mlflow")
+    print(f"{'python':<9} {baseline:>7.3f}")
+
+    failed = False
+    for command in COMMANDS:
+        args = [sys.executable, "-m", "mlflower", command, project]
+        seconds = min(timed(args) for _ in range(REPEAT))
+        imported = imports_mlflow(command, project)
+        failed |= imported
+        print(f"{command:<9} {seconds:>7.3f}  {'yes' if imported else 'no'}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PROJECT)
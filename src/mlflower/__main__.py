@@ -1,29 +1,57 @@
 from __future__ import annotations
 
+import contextlib
 import os
+import statistics
 import sys
-from typing import Any
+from pathlib import Path
 
 import click
-import mlflow
-from mlflow import ActiveRun
-from mlflow.entities import RunStatus
-from mlflow.environment_variables import MLFLOW_EXPERIMENT_ID, MLFLOW_EXPERIMENT_NAME
 
-from mlflower.project import load_project
+from mlflower.entry_point import EntryPoint, get_entry_points
+from mlflower.graph_utils import get_mermaid_graph, to_link
+from mlflower.nested import expand_nested_workflows, get_root_entry_point
+from mlflower.scheduler import FAIL_FAST, FAILURE_POLICIES, ReadyQueue, get_limits
+from mlflower.validation import get_validation_errors
 
-from .workflow import Workflow
+DEFAULT_COMMAND = "run"
 
+# mlflow is only imported by the commands that track or submit runs: `validate`,
+# `graph` and `plan` stay fast enough to be used in editors and pre-commit hooks
 
-@click.command()
-@click.argument("uri", type=click.STRING, required=False, default=None)
-@click.option(
+
+class _DefaultCommandGroup(click.Group):
+    def parse_args(self, ctx: click.Context, args: list[str]) -> list[str]:
+        if not args or (
+            args[0] not in self.commands and args[0] not in ctx.help_option_names
+        ):
+            args = [DEFAULT_COMMAND, *args]
+
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=_DefaultCommandGroup)
+def main() -> None:
+    """Lightweight orchestration tool for mlflow projects.
+
+    Without a command, URI is run as a workflow: `mlflower URI` is `mlflower run URI`.
+    """
+
+
+uri_argument = click.argument("uri", type=click.STRING, required=False, default=None)
+entry_point_option = click.option(
     "--entry-point",
     "-e",
     metavar="NAME",
     default=None,
-    help="MLFlower entry point within project. default: root",
+    help="MLFlower entry point within project. default: root, or main when the "
+    "project has no root and main runs its workflow",
 )
+
+
+@main.command()
+@uri_argument
+@entry_point_option
 @click.option(
     "--param-list",
     "-P",
@@ -44,13 +72,13 @@ from .workflow import Workflow
 )
 @click.option(
     "--experiment-name",
-    envvar=MLFLOW_EXPERIMENT_NAME.name,
+    envvar="MLFLOW_EXPERIMENT_NAME",
     help="Name of the experiment under which to launch the run. If not "
     "specified, 'experiment-id' option will be used to launch run.",
 )
 @click.option(
     "--experiment-id",
-    envvar=MLFLOW_EXPERIMENT_ID.name,
+    envvar="MLFLOW_EXPERIMENT_ID",
     type=click.STRING,
     help="ID of the experiment under which to launch the run.",
 )
@@ -60,7 +88,8 @@ from .workflow import Workflow
     metavar="BACKEND",
     default=None,
     help="Execution backend to use for run. Supported values: 'local', 'databricks', "
-    "kubernetes (experimental)",
+    "kubernetes (experimental), 'pool' (steps are queued for `mlflower worker` "
+    'processes, the queue is set with --backend-config \'{"queue": "PATH"}\')',
 )
 @click.option(
     "--backend-config",
@@ -105,6 +134,151 @@ from .workflow import Workflow
     show_default=True,
     help="Whether to run the steps sequentially or in parallel (when possible)",
 )
+@click.option(
+    "--max-parallel",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Maximum number of steps running at the same time. Steps declaring "
+    "`resources` (e.g. `resources: {cpu: 4, memory: 8G}`) are also packed into the "
+    "machine's cpu and memory capacity. default: unbounded",
+)
+@click.option(
+    "--on-failure",
+    type=click.Choice(FAILURE_POLICIES),
+    default=FAIL_FAST,
+    show_default=True,
+    help="What to do when a step fails: cancel every running step (fail-fast), keep "
+    "running the steps that don't depend on it (continue-independent) or run every "
+    "step anyway (best-effort). The workflow run is marked as failed in all cases.",
+)
+@click.option(
+    "--hook",
+    "hooks",
+    metavar="NAME",
+    multiple=True,
+    help="A hook to notify of the workflow's events: the name of a hook installed "
+    "under the `mlflower.hooks` entry point group (e.g. `profile`) or "
+    "`module:factory`.",
+)
+@click.option(
+    "--prewarm/--no-prewarm",
+    default=True,
+    show_default=True,
+    help="Build the virtualenv or conda environments of all steps in parallel, once "
+    "per distinct environment, before running any step. Only used with the local "
+    "backend.",
+)
+@click.option(
+    "--prefetch-artifacts",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Download the artifacts that steps pass to each other as soon as the step "
+    "producing them finishes, into a local cache shared by all workflows, and pass "
+    "steps local paths instead of artifact URIs. Only used with the local backend.",
+)
+@click.option(
+    "--warm-workers",
+    type=int,
+    default=0,
+    show_default=True,
+    help="Run steps whose command only runs a Python script, module or code in this "
+    "many reusable worker processes, instead of a new interpreter each. Only used with "
+    "the local backend and env manager. Steps can opt out with `warm: false`.",
+)
+@click.option(
+    "--warm-import",
+    "warm_imports",
+    metavar="MODULE",
+    multiple=True,
+    help="A module that warm workers import before running steps, e.g. pandas. Can "
+    "be repeated.",
+)
+@click.option(
+    "--warm-max-tasks",
+    type=int,
+    default=100,
+    show_default=True,
+    help="Steps run by a warm worker before it is replaced by a new one.",
+)
+@click.option(
+    "--warm-max-memory",
+    metavar="SIZE",
+    default="2G",
+    show_default=True,
+    help="Memory of a warm worker above which it is replaced by a new one after its "
+    "current step.",
+)
+@click.option(
+    "--capture-logs/--no-capture-logs",
+    default=True,
+    show_default=True,
+    help="Print the output of steps prefixed with their name, upload it to their run "
+    "under mlflower/logs/ and show its last lines when a step fails. Only used with "
+    "the local and pool backends.",
+)
+@click.option(
+    "--cache",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Reuse previous finished runs of steps whose source files, command, parameters "
+    "and upstream runs haven't changed. Source files are the ones git would commit, "
+    "less the ones matching .mlflowerignore. Steps can opt out with `cache: false` or "
+    "tune invalidation with `cache: {ttl: 1d, exclude: [data/*], watch: [...]}`",
+)
+@click.option(
+    "--invalidate",
+    metavar="NAME",
+    multiple=True,
+    help="A step to re-run even if a cached run is available. Only used with --cache",
+)
+@click.option(
+    "--resume",
+    metavar="RUN_ID",
+    default=None,
+    help="ID of a previous workflow run to resume. Steps that already finished are "
+    "reused and only failed or missing steps are submitted again. The project URI and "
+    "entry point default to the ones of the resumed run.",
+)
+@click.option(
+    "--target",
+    "targets",
+    metavar="NAME",
+    multiple=True,
+    help="Only run this step and the steps it depends on. Can be repeated.",
+)
+@click.option(
+    "--from",
+    "from_steps",
+    metavar="NAME",
+    multiple=True,
+    help="Only run this step and the steps depending on it. Can be repeated, and "
+    "combined with --target.",
+)
+@click.option(
+    "--exclude",
+    metavar="NAME",
+    multiple=True,
+    help="Don't run this step. Can be repeated.",
+)
+@click.option(
+    "--reuse",
+    metavar="NAME=RUN_ID",
+    multiple=True,
+    help="Don't run this step, reuse the given run instead. Steps left out by "
+    "--target, --from or --exclude that selected steps depend on reuse their latest "
+    "finished run in a previous run of the same workflow, unless given here.",
+)
+@click.option(
+    "--spawn-nested",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Run entry points that are themselves MLFlower workflows (e.g. "
+    "`command: python -m mlflower .`) in their own process, instead of scheduling "
+    "their steps along with the other steps.",
+)
 @click.option(
     "--build-image",
     is_flag=True,
@@ -116,7 +290,7 @@ from .workflow import Workflow
         "project directory."
     ),
 )
-def main(
+def run(
     uri: str | None,
     entry_point: str | None,
     param_list: list[str] | None,
@@ -130,19 +304,63 @@ def main(
     run_name: str | None,
     build_image: str | None,
     sequential: bool,
+    max_parallel: int | None,
+    on_failure: str,
+    hooks: list[str],
+    prewarm: bool,
+    prefetch_artifacts: bool,
+    warm_workers: int,
+    warm_imports: list[str],
+    warm_max_tasks: int,
+    warm_max_memory: str,
+    capture_logs: bool,
+    cache: bool,
+    invalidate: list[str],
+    resume: str | None,
+    targets: list[str],
+    from_steps: list[str],
+    exclude: list[str],
+    reuse: list[str],
+    spawn_nested: bool,
 ) -> None:
+    """Run the workflow of the project at URI (default: current directory)."""
+    import mlflow
+    from mlflow.entities import RunStatus
+
+    from mlflower.journal import PROJECT_URI_TAG, ROOT_ENTRY_POINT_TAG
+    from mlflower.tracking import get_experiment_id, update_params
+    from mlflower.workflow import Workflow
+
+    if resume:
+        resumed_tags = mlflow.get_run(resume).data.tags
+        uri = uri or resumed_tags.get(PROJECT_URI_TAG)
+        entry_point = entry_point or resumed_tags.get(ROOT_ENTRY_POINT_TAG)
 
     project_uri = uri or os.getcwd()
-    experiment_id = get_experiment_id(project_uri, experiment_id, experiment_name)
+    if resume is None:
+        experiment_id = get_experiment_id(project_uri, experiment_id, experiment_name)
 
     param_dict = _to_dict(param_list)
 
-    with mlflow.start_run(run_name=run_name, experiment_id=experiment_id) as active_run:
+    with mlflow.start_run(
+        run_id=resume, run_name=run_name, experiment_id=experiment_id
+    ) as active_run:
         update_params(active_run, param_dict)
+        experiment_id = active_run.info.experiment_id
+
+        if Path(project_uri).exists():
+            project_uri = Path(project_uri).resolve().as_posix()
 
         workflow = Workflow.from_project_uri(
-            project_uri, active_run, root_entry_point=entry_point
+            project_uri,
+            active_run,
+            root_entry_point=entry_point,
+            inline_workflows=not spawn_nested,
         )
+        if resume:
+            workflow.restore()
+        if targets or from_steps or exclude or reuse:
+            workflow.select(targets, from_steps, exclude, _to_dict(reuse))
 
         workflow.run(
             {
@@ -150,6 +368,18 @@ def main(
                 "env_manager": env_manager,
                 "storage_dir": storage_dir,
                 "sequential": sequential,
+                "max_parallel": max_parallel,
+                "on_failure": on_failure,
+                "hooks": hooks,
+                "prewarm": prewarm,
+                "prefetch_artifacts": prefetch_artifacts,
+                "warm_workers": warm_workers,
+                "warm_imports": warm_imports,
+                "warm_max_tasks": warm_max_tasks,
+                "warm_max_memory": warm_max_memory,
+                "capture_logs": capture_logs,
+                "cache": cache,
+                "invalidate": invalidate,
                 "experiment_id": experiment_id,
                 "backend_config": backend_config,
                 "build_image": build_image,
@@ -161,16 +391,241 @@ def main(
             sys.exit(1)
 
 
-def update_params(active_run: ActiveRun, param_dict: dict[str, Any]) -> None:
-    if not param_dict:
-        return
+@main.command()
+@uri_argument
+@entry_point_option
+def validate(uri: str | None, entry_point: str | None) -> None:
+    """Check the workflow of the project at URI without running it."""
+    entry_points, root = _load_workflow(uri, entry_point)
+    errors = get_validation_errors(entry_points, root)
+
+    for error in errors:
+        click.echo(f"error: {error}", err=True)
 
-    active_run.data.params.update(param_dict)
-    try:
-        for key, value in param_dict.items():
-            mlflow.log_param(key, value)
-    except mlflow.exceptions.MlflowException:
-        pass
+    if errors:
+        sys.exit(1)
+
+    click.echo(f"{len(entry_points)} entry points: OK")
+
+
+@main.command()
+@uri_argument
+@entry_point_option
+@click.option(
+    "--format",
+    "format_",
+    type=click.Choice(["mermaid", "link"]),
+    default="mermaid",
+    show_default=True,
+    help="Print the mermaid flowchart itself or a kroki.io link to its rendering.",
+)
+def graph(uri: str | None, entry_point: str | None, format_: str) -> None:
+    """Print the dependency graph of the project at URI."""
+    entry_points, root = _load_workflow(uri, entry_point)
+    text = get_mermaid_graph(entry_points, root)
+
+    click.echo(to_link(text) if format_ == "link" else text)
+
+
+@main.command()
+@uri_argument
+@entry_point_option
+@click.option(
+    "--max-parallel",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Maximum number of steps running at the same time. default: unbounded",
+)
+@click.option(
+    "--estimate",
+    is_flag=True,
+    default=False,
+    show_default=True,
+    help="Also predict the workflow's wall-clock time and peak parallelism, with "
+    "the median duration of each step's latest finished runs in the experiment, "
+    "sequentially, with increasing --max-parallel values and unbounded.",
+)
+@click.option(
+    "--experiment-name",
+    envvar="MLFLOW_EXPERIMENT_NAME",
+    help="Name of the experiment to take previous runs from. Only used with "
+    "--estimate. default: the project's name",
+)
+@click.option(
+    "--experiment-id",
+    envvar="MLFLOW_EXPERIMENT_ID",
+    type=click.STRING,
+    help="ID of the experiment to take previous runs from. Only used with --estimate.",
+)
+def plan(
+    uri: str | None,
+    entry_point: str | None,
+    max_parallel: int | None,
+    estimate: bool,
+    experiment_name: str | None,
+    experiment_id: str | None,
+) -> None:
+    """Print the order in which the steps of the project at URI would be submitted."""
+    entry_points, root = _load_workflow(uri, entry_point)
+    queue = ReadyQueue(
+        {key: ep.depends_on for key, ep in entry_points.items()},
+        done={root},
+        priorities={key: ep.priority for key, ep in entry_points.items()},
+        limits=get_limits(entry_points, max_parallel),
+    )
+
+    wave = 0
+    while queue:
+        ready = queue.pop_ready()
+        if not ready:
+            raise click.ClickException(f"Unreachable steps: {sorted(queue.pending)}")
+
+        wave += 1
+        click.echo(f"{wave}: {', '.join(ready)}")
+        for key in ready:
+            queue.mark_done(key)
+
+    if estimate:
+        from mlflower.tracking import get_experiment_id
+
+        project_uri = uri or os.getcwd()
+        experiment_id = get_experiment_id(project_uri, experiment_id, experiment_name)
+        _print_estimates(entry_points, root, experiment_id, max_parallel)
+
+
+def _print_estimates(
+    entry_points: dict[str, EntryPoint],
+    root: str | None,
+    experiment_id: str | None,
+    max_parallel: int | None,
+) -> None:
+    from mlflower.estimate import format_duration, get_step_durations, simulate
+    from mlflower.tracking import Tracker
+
+    steps = [
+        key
+        for key, ep in entry_points.items()
+        if key != root and not ep.workflow and ep.command is not None
+    ]
+    durations = get_step_durations(Tracker(), [experiment_id or "0"], steps)
+    # Steps that never ran are assumed to take as long as the typical step
+    unknown = [key for key in steps if key not in durations]
+    default = statistics.median(durations.values()) if durations else 0.0
+    durations.update(dict.fromkeys(unknown, default))
+
+    def _simulate(limit: int | None) -> tuple[str, int]:
+        schedule = simulate(
+            entry_points, durations, root, get_limits(entry_points, limit)
+        )
+        return format_duration(schedule.makespan), schedule.peak_parallelism
+
+    unbounded = _simulate(None)
+    limits = {max_parallel} if max_parallel else set()
+    limits.update(2**i for i in range(unbounded[1].bit_length()) if 2**i < unbounded[1])
+
+    click.echo(
+        f"\nEstimated from previous runs of {len(steps) - len(unknown)} of "
+        f"{len(steps)} steps"
+    )
+    if unknown:
+        click.echo(
+            f"No finished run of {', '.join(unknown)}: assumed to take "
+            f"{format_duration(default)} each"
+        )
+    click.echo(f"{'max-parallel':>14}  {'wall-clock':>10}  {'peak':>4}")
+    for limit in sorted(limits):
+        makespan, peak = _simulate(limit)
+        label = f"{limit} (sequential)" if limit == 1 else str(limit)
+        click.echo(f"{label:>14}  {makespan:>10}  {peak:>4}")
+    click.echo(f"{'unbounded':>14}  {unbounded[0]:>10}  {unbounded[1]:>4}")
+
+
+@main.command()
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=5050, show_default=True)
+@click.option(
+    "--max-steps",
+    type=int,
+    default=None,
+    help="Steps running at once across all workflows. Each experiment gets a fair "
+    "share of them, workflows with a higher priority first. Default: number of CPUs",
+)
+@click.option(
+    "--max-workflows",
+    type=int,
+    default=None,
+    help="Workflows running at once. Others wait in the queue by priority, then "
+    "submission order. Unlimited by default.",
+)
+def serve(
+    host: str, port: int, max_steps: int | None, max_workflows: int | None
+) -> None:
+    """Run workflows submitted over HTTP, under one step budget.
+
+    POST /workflows with a JSON object like {"uri": ".", "entry_point": "main",
+    "parameters": {}, "experiment_name": null, "priority": 0, "run_args":
+    {"env_manager": "local"}} to queue a workflow, GET /workflows[/ID] for its
+    status and POST /workflows/ID/cancel to cancel it.
+    """
+    from mlflower.server import WorkflowService
+    from mlflower.server import serve as serve_forever
+
+    service = WorkflowService(max_steps or os.cpu_count() or 1, max_workflows)
+    click.echo(f"Serving on http://{host}:{port}")
+    serve_forever(service, host, port)
+
+
+@main.command()
+@click.option(
+    "--queue",
+    metavar="PATH",
+    default=None,
+    help="SQLite database of the work queue, shared with the workflows using the "
+    "'pool' backend. Default: $MLFLOWER_POOL_QUEUE, or a database in the cache "
+    "directory.",
+)
+@click.option(
+    "--slots", type=int, default=1, show_default=True, help="Steps run at once."
+)
+@click.option("--worker-id", default=None, help="Default: HOSTNAME-PID")
+@click.option(
+    "--capture-logs/--no-capture-logs",
+    default=True,
+    show_default=True,
+    help="Print the output of steps prefixed with their name, and upload it to their "
+    "run under mlflower/logs/.",
+)
+def worker(
+    queue: str | None, slots: int, worker_id: str | None, capture_logs: bool
+) -> None:
+    """Run steps of workflows using the 'pool' backend, taken from a work queue.
+
+    Workers on other machines share the queue through a shared filesystem, along
+    with the project sources: the filesystem must support file locks, as NFSv4 does.
+    Steps preferably run on the worker that ran the steps they depend on.
+    """
+    import signal
+
+    from mlflower.pool import Worker, WorkQueue
+
+    pool_worker = Worker(WorkQueue(queue), slots, worker_id, capture_logs)
+    # Running steps go back to the queue when the worker is stopped
+    signal.signal(signal.SIGTERM, lambda *_: pool_worker.stop())
+    with contextlib.suppress(KeyboardInterrupt):
+        pool_worker.run()
+
+
+def _load_workflow(
+    uri: str | None, entry_point: str | None
+) -> tuple[dict[str, EntryPoint], str]:
+    # The same steps as `run` would submit
+    project_uri = uri or os.getcwd()
+    entry_points = get_entry_points(project_uri)
+    if entry_point is not None and entry_point not in entry_points:
+        raise click.BadParameter(f"Unknown entry point: {entry_point}")
+
+    root = get_root_entry_point(entry_points, project_uri, entry_point)
+    return expand_nested_workflows(entry_points, root, project_uri), root
 
 
 def _to_dict(arguments: list[str], allow_flags: bool = False) -> dict[str]:
@@ -189,25 +644,5 @@ def _to_dict(arguments: list[str], allow_flags: bool = False) -> dict[str]:
     return user_dict
 
 
-def get_experiment_id(
-    project_uri: str,
-    experiment_id: str | None = None,
-    experiment_name: str | None = None,
-) -> str | None:
-    if experiment_id:
-        return experiment_id
-
-    experiment_name = experiment_name or load_project(project_uri).get("name")
-
-    if experiment_name is None:
-        return None
-
-    experiment = mlflow.get_experiment_by_name(experiment_name)
-    if experiment is None:
-        return mlflow.create_experiment(experiment_name)
-
-    return experiment.experiment_id
-
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable
+from urllib.parse import urlparse
+
+from .cache import hash_path
+from .entry_point import EntryPoint
+from .project import (
+    SOURCE_COLLECT_KEY,
+    SOURCE_CONTENT_KEY,
+    SOURCE_ID_KEY,
+    SOURCE_TYPE_KEY,
+)
+from .scheduler import parse_memory
+from .settings import get_cache_dir
+from .sweep import get_shards
+
+_logger = logging.getLogger(__name__)
+
+MLFLOWER_ARTIFACT_CACHE_SIZE = "MLFLOWER_ARTIFACT_CACHE_SIZE"
+DEFAULT_ARTIFACT_CACHE_SIZE = "10G"
+
+PREFETCH_WORKERS = 4
+
+
+# Artifacts are stored under a digest of their content, so identical artifacts of
+# different runs are stored once. Refs map a run's artifact to its content: finished
+# runs' artifacts never change, so a ref stays valid as long as its object exists.
+class ArtifactCache:
+    def __init__(
+        self, root: str | Path | None = None, max_size: str | int | None = None
+    ):
+        self.root = Path(root) if root is not None else get_cache_dir("artifacts")
+        max_size = max_size or os.environ.get(
+            MLFLOWER_ARTIFACT_CACHE_SIZE, DEFAULT_ARTIFACT_CACHE_SIZE
+        )
+        self.max_size = int(parse_memory(max_size))
+        self._objects = self.root / "objects"
+        self._refs = self.root / "refs"
+        self._objects.mkdir(parents=True, exist_ok=True)
+        self._refs.mkdir(parents=True, exist_ok=True)
+
+        self._in_use: set[Path] = set()
+        # Sizes of the objects, each measured once, from the first store on
+        self._sizes: dict[Path, int] | None = None
+        self._lock = threading.Lock()
+
+    def get(self, run_id: str, path: str) -> Path | None:
+        ref = self._get_ref(run_id, path)
+        try:
+            local_path = self._objects / ref.read_text()
+        except OSError:
+            return None
+
+        if not local_path.exists():
+            return None
+
+        self._use(local_path)
+        return local_path
+
+    def fetch(self, run_id: str, path: str) -> Path:
+        local_path = self.get(run_id, path)
+        if local_path is not None:
+            return local_path
+
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.root, prefix=".tmp-"))
+        try:
+            downloaded = _download(run_id, path, tmp_dir)
+            local_path = self._store(downloaded)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        _write_atomic(
+            self._get_ref(run_id, path), local_path.relative_to(self._objects)
+        )
+        self._use(local_path)
+        self._track(local_path.parent)
+        return local_path
+
+    def _store(self, downloaded: Path) -> Path:
+        name = downloaded.name
+        digest = hashlib.sha256(f"{name}:{hash_path(downloaded)}".encode()).hexdigest()
+        object_dir = self._objects / digest
+        if not object_dir.exists():
+            _make_read_only(downloaded)
+            staging_dir = downloaded.parent / digest
+            staging_dir.mkdir()
+            downloaded.rename(staging_dir / name)
+            try:
+                staging_dir.rename(object_dir)
+            except OSError:
+                # Stored by another step or workflow in the meantime
+                if not object_dir.exists():
+                    raise
+
+        return object_dir / name
+
+    def _get_ref(self, run_id: str, path: str) -> Path:
+        return self._refs / hashlib.sha256(f"{run_id}/{path}".encode()).hexdigest()
+
+    def _use(self, local_path: Path) -> None:
+        with self._lock:
+            self._in_use.add(local_path.parent)
+        os.utime(local_path.parent)
+
+    def _track(self, object_dir: Path) -> None:
+        # The cache is only swept once over its size
+        with self._lock:
+            if self._sizes is None:
+                self._sizes = {}
+                self._refresh()
+            elif object_dir not in self._sizes:
+                self._sizes[object_dir] = _get_size(object_dir)
+
+            if sum(self._sizes.values()) > self.max_size:
+                self._evict()
+
+    def _refresh(self) -> None:
+        # Other workflows share the cache: objects they stored are measured, objects
+        # they evicted are forgotten
+        objects = set(self._objects.iterdir())
+        for path in self._sizes.keys() - objects:
+            del self._sizes[path]
+        for path in objects - self._sizes.keys():
+            self._sizes[path] = _get_size(path)
+
+    def _evict(self) -> None:
+        # Least recently used objects go first, except the ones handed out to this
+        # workflow's steps
+        self._refresh()
+        size = sum(self._sizes.values())
+        for path in sorted(self._sizes, key=_get_mtime):
+            if size <= self.max_size:
+                break
+            if path in self._in_use:
+                continue
+
+            _logger.debug("Evicting artifact %s", path)
+            shutil.rmtree(path, ignore_errors=True)
+            size -= self._sizes.pop(path)
+
+
+# Downloads run in the background from the moment a step finishes, while the scheduler
+# goes on with other steps: steps consuming an artifact only wait for what's left.
+class ArtifactPrefetcher:
+    def __init__(
+        self, cache: ArtifactCache | None = None, max_workers: int = PREFETCH_WORKERS
+    ):
+        self.cache = cache or ArtifactCache()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="mlflower-prefetch"
+        )
+        self._futures: dict[tuple[str, str], Future[Path]] = {}
+
+    def prefetch(self, run_id: str, paths: Iterable[str]) -> None:
+        for path in paths:
+            if (run_id, path) not in self._futures:
+                self._futures[run_id, path] = self._executor.submit(
+                    self.cache.fetch, run_id, path
+                )
+
+    def get_path(self, run_id: str, path: str) -> str | None:
+        self.prefetch(run_id, [path])
+        try:
+            return self._futures[run_id, path].result().as_posix()
+        except Exception:
+            # Steps get the artifact URI instead, as without prefetching
+            _logger.exception("Failed to fetch artifact %s of run %s", path, run_id)
+            return None
+
+    def close(self) -> None:
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=False)
+
+
+def get_declared_artifacts(entry_points: dict[str, EntryPoint]) -> dict[str, set[str]]:
+    declared: dict[str, set[str]] = {}
+    for entry_point in entry_points.values():
+        for param in entry_point.workflow_parameters.values():
+            source_type = param[SOURCE_TYPE_KEY]
+            if source_type == "collect":
+                source_type = param.get(SOURCE_COLLECT_KEY, "artifact")
+            if source_type != "artifact":
+                continue
+
+            key = param[SOURCE_ID_KEY]
+            for step in get_shards(entry_points, key) or [key]:
+                declared.setdefault(step, set()).add(param[SOURCE_CONTENT_KEY])
+
+    return declared
+
+
+def _download(run_id: str, path: str, dst_dir: Path) -> Path:
+    from mlflow.artifacts import download_artifacts
+    from mlflow.tracking.artifact_utils import get_artifact_uri
+
+    artifact_uri = get_artifact_uri(run_id, path)
+    local_path = _get_local_path(artifact_uri)
+    if local_path is None:
+        return Path(download_artifacts(artifact_uri=artifact_uri, dst_path=dst_dir))
+
+    # Local artifact stores: hard links instead of copies, where the filesystem allows
+    target = dst_dir / local_path.name
+    if local_path.is_dir():
+        shutil.copytree(local_path, target, copy_function=_link)
+    else:
+        _link(local_path, target)
+
+    return target
+
+
+def _get_local_path(artifact_uri: str) -> Path | None:
+    parsed = urlparse(artifact_uri)
+    if parsed.scheme not in ("", "file") or parsed.netloc:
+        return None
+
+    return Path(parsed.path)
+
+
+def _link(src: str | Path, dst: str | Path) -> None:
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _make_read_only(path: Path) -> None:
+    # Steps share cached files: a step writing to its input would change it for every
+    # other step. Hard links share their mode with the artifact store's file, which is
+    # left alone: only copies are made read-only.
+    for file in path.rglob("*") if path.is_dir() else [path]:
+        if file.is_file():
+            stat = file.stat()
+            if stat.st_nlink == 1:
+                file.chmod(stat.st_mode & ~0o222)
+
+
+def _get_mtime(path: Path) -> float:
+    try:
+        return path.stat().st_mtime
+    except OSError:
+        return 0.0
+
+
+def _get_size(path: Path) -> int:
+    return sum(file.stat().st_size for file in path.rglob("*") if file.is_file())
+
+
+def _write_atomic(path: Path, content: Path) -> None:
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_text(content.as_posix())
+    tmp_path.replace(path)
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import fnmatch
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+from mlflow.entities import Run, RunStatus
+
+from .entry_point import EntryPoint
+from .settings import parse_duration
+from .tracking import Tracker
+
+CACHE_KEY_TAG = "mlflower.cache_key"
+CACHE_HIT_TAG_PREFIX = "mlflower.cache_hit."
+
+CACHE_TTL_KEY = "ttl"
+CACHE_EXCLUDE_KEY = "exclude"
+CACHE_WATCH_KEY = "watch"
+
+DEFAULT_EXCLUDE = (".*", "*/.*", "mlruns/*", "__pycache__/*", "*/__pycache__/*")
+# Patterns of a project's files left out of its key, one per line, as in `exclude`
+IGNORE_FILE = ".mlflowerignore"
+
+
+class StepCache:
+    def __init__(
+        self, experiment_id: str, tracker: Tracker, invalidate: Iterable[str] = ()
+    ):
+        self.experiment_id = experiment_id
+        self.invalidate = set(invalidate)
+
+        self._tracker = tracker
+        self._fingerprints: dict[tuple[str, tuple[str, ...], bool], str] = {}
+
+    def get_key(
+        self,
+        entry_point: EntryPoint,
+        parameters: dict[str, Any],
+        upstream_run_ids: Iterable[str],
+        run_args: dict[str, Any],
+    ) -> str | None:
+        options = _get_options(entry_point)
+        if options is None:
+            return None
+
+        exclude = (*DEFAULT_EXCLUDE, *options.get(CACHE_EXCLUDE_KEY, ()))
+        payload = {
+            "source": self._fingerprint(entry_point.source, exclude, project=True),
+            "watch": [
+                self._fingerprint(Path(entry_point.source, path).as_posix(), exclude)
+                for path in options.get(CACHE_WATCH_KEY, ())
+            ],
+            "entry": entry_point.entry,
+            "command": entry_point.command,
+            "parameters": parameters,
+            "upstream": sorted(upstream_run_ids),
+            "backend": run_args.get("backend"),
+            "env_manager": run_args.get("env_manager"),
+        }
+        content = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def lookup(self, name: str, entry_point: EntryPoint, cache_key: str) -> Run | None:
+        if name in self.invalidate:
+            return None
+
+        filters = [
+            f"tags.`{CACHE_KEY_TAG}` = '{cache_key}'",
+            f"attributes.status = '{RunStatus.to_string(RunStatus.FINISHED)}'",
+        ]
+        ttl = _get_options(entry_point).get(CACHE_TTL_KEY)
+        if ttl is not None:
+            min_start_time = int((time.time() - parse_duration(ttl)) * 1000)
+            filters.append(f"attributes.start_time > {min_start_time}")
+
+        runs = self._tracker.search_runs(
+            [self.experiment_id],
+            filter_string=" and ".join(filters),
+            order_by=["attributes.start_time DESC"],
+            max_results=1,
+        )
+        return runs[0] if runs else None
+
+    def record(self, run_id: str, cache_key: str) -> None:
+        self._tracker.set_tag(run_id, CACHE_KEY_TAG, cache_key)
+
+    def _fingerprint(
+        self, source: str, exclude: tuple[str, ...], project: bool = False
+    ) -> str:
+        key = (source, exclude, project)
+        if key not in self._fingerprints:
+            hash_function = hash_project if project else hash_path
+            self._fingerprints[key] = hash_function(source, exclude)
+
+        return self._fingerprints[key]
+
+
+def hash_path(path: str, exclude: Iterable[str] = ()) -> str:
+    root = Path(path)
+    if not root.exists():
+        # Remote sources (e.g. git URIs) are identified by their URI
+        return path
+
+    files = [root] if root.is_file() else _iter_files(root, tuple(exclude))
+    return _hash_files(root, files)
+
+
+def hash_project(path: str, exclude: Iterable[str] = ()) -> str:
+    # Only the project's own files: the ones git would commit, in a work tree, less the
+    # ones matching its ignore file. Outputs, data and local tracking databases written
+    # next to the code don't change the key.
+    root = Path(path)
+    if not root.is_dir():
+        return hash_path(path, exclude)
+
+    exclude = (*exclude, *_read_ignore_file(root))
+    listed = _list_git_files(root)
+    if listed is None:
+        return _hash_files(root, _iter_files(root, exclude))
+
+    return _hash_files(
+        root,
+        (
+            root / relative_path
+            for relative_path in listed
+            if not _is_excluded(relative_path, exclude)
+            and root.joinpath(relative_path).is_file()
+        ),
+    )
+
+
+def _hash_files(root: Path, files: Iterable[Path]) -> str:
+    digest = hashlib.sha256()
+    for file in sorted(files):
+        digest.update(file.relative_to(root).as_posix().encode("utf-8"))
+        with file.open("rb") as f:
+            while chunk := f.read(2**20):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _iter_files(root: Path, exclude: tuple[str, ...]) -> Iterable[Path]:
+    for dir_path, dir_names, file_names in os.walk(root):
+        relative_dir = Path(dir_path).relative_to(root)
+        dir_names[:] = [
+            name
+            for name in dir_names
+            if not _is_excluded((relative_dir / name / "*").as_posix(), exclude)
+        ]
+        for name in file_names:
+            relative_path = (relative_dir / name).as_posix()
+            if not _is_excluded(relative_path, exclude):
+                yield root / relative_path
+
+
+def _list_git_files(root: Path) -> list[str] | None:
+    # Tracked files, and untracked ones that aren't ignored, relative to `root`
+    try:
+        import git
+    except ImportError:
+        return None
+
+    try:
+        output = git.Git(root).ls_files(
+            "-z", "--cached", "--others", "--exclude-standard"
+        )
+    except git.exc.GitCommandError:
+        return None
+
+    return [path for path in output.split("\0") if path]
+
+
+def _read_ignore_file(root: Path) -> list[str]:
+    try:
+        lines = root.joinpath(IGNORE_FILE).read_text().splitlines()
+    except OSError:
+        return []
+
+    patterns = [line.strip() for line in lines]
+    return [
+        pattern.rstrip("/") + "/*" if pattern.endswith("/") else pattern
+        for pattern in patterns
+        if pattern and not pattern.startswith("#")
+    ]
+
+
+def _is_excluded(relative_path: str, exclude: tuple[str, ...]) -> bool:
+    return any(fnmatch.fnmatch(relative_path, pattern) for pattern in exclude)
+
+
+def _get_options(entry_point: EntryPoint) -> dict[str, Any] | None:
+    if entry_point.cache is False:
+        return None
+
+    if entry_point.cache is True:
+        return {}
+
+    return entry_point.cache
@@ -4,16 +4,28 @@ from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
 
-from .project import PARAM_DEFAULT_KEY, get_raw_entry_points
+from .project import PARAM_DEFAULT_KEY, compile_entry_points
 
 
 @dataclass
 class EntryPoint:
     source: str | None = None
     entry: str = "main"
+    command: str | None = None
     parameters: dict[str] = field(default_factory=dict)
     workflow_parameters: dict[str] = field(default_factory=dict)
     depends_on: set[str] = field(default_factory=set)
+    resources: dict[str, Any] = field(default_factory=dict)
+    priority: int = 0
+    cache: bool | dict[str, Any] = True
+    retries: int = 0
+    retry_backoff: str | float = 0
+    timeout: str | float | None = None
+    warm: bool = True
+    workflow: bool = False
+    parent: str | None = None
+    max_parallel: int | None = None
+    sweep: dict[str, Any] | None = None
 
     @property
     def defaults(self) -> dict[str, Any]:
@@ -24,7 +36,7 @@ class EntryPoint:
         }
 
 
-def get_entry_points(path: str | Path) -> dict[str, EntryPoint]:
-    entry_points = get_raw_entry_points(path)
+def get_entry_points(path: str | Path, use_cache: bool = True) -> dict[str, EntryPoint]:
+    entry_points = compile_entry_points(path, use_cache=use_cache)
 
     return {key: EntryPoint(**entry) for key, entry in entry_points.items()}
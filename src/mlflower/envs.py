@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable
+
+from mlflow.exceptions import MlflowException
+from mlflow.projects import _project_spec, env_type
+
+_logger = logging.getLogger(__name__)
+
+CONDA = "conda"
+VIRTUALENV = "virtualenv"
+UV = "uv"
+ENV_MANAGERS = (CONDA, VIRTUALENV, UV)
+
+
+@dataclass(frozen=True)
+class Environment:
+    manager: str
+    source: str
+    config_path: str | None
+    env_type: str
+    name: str
+
+    def build(self) -> None:
+        if self.manager == CONDA:
+            from mlflow.utils.conda import get_or_create_conda_env
+
+            get_or_create_conda_env(self.config_path)
+            return
+
+        from mlflow.utils.virtualenv import (
+            _create_virtualenv,
+            _get_mlflow_virtualenv_root,
+        )
+
+        _create_virtualenv(
+            local_model_path=Path(self.source),
+            python_env=_get_python_env(self.env_type, self.config_path),
+            env_dir=Path(_get_mlflow_virtualenv_root(), self.name),
+            env_manager=self.manager,
+        )
+
+
+# mlflow names environments after a hash of their spec and reuses existing ones, so
+# once built here, an environment is reused by every step and workflow run sharing it.
+def prewarm_environments(
+    sources: Iterable[str], env_manager: str | None, max_workers: int | None = None
+) -> list[Environment]:
+    environments = {}
+    for source in dict.fromkeys(sources):
+        environment = get_environment(source, env_manager)
+        if environment is not None:
+            environments.setdefault(
+                (environment.manager, environment.name), environment
+            )
+
+    if not environments:
+        return []
+
+    max_workers = max_workers or min(len(environments), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(environment.build): environment
+            for environment in environments.values()
+        }
+        for future in as_completed(futures):
+            environment = futures[future]
+            try:
+                future.result()
+            except Exception:
+                # The step will try again when it's submitted, and fail there if it must
+                _logger.exception(
+                    "Failed to pre-warm environment of %s", environment.source
+                )
+
+    return list(environments.values())
+
+
+def get_environment(source: str, env_manager: str | None) -> Environment | None:
+    if not Path(source).is_dir():
+        return None
+
+    try:
+        project = _project_spec.load_project(source)
+    except (MlflowException, OSError):
+        return None
+
+    if project.env_type == env_type.DOCKER:
+        return None
+
+    manager = env_manager or (
+        CONDA if project.env_type == env_type.CONDA else VIRTUALENV
+    )
+    if manager not in ENV_MANAGERS or (
+        manager == CONDA and project.env_type != env_type.CONDA
+    ):
+        return None
+
+    if manager == CONDA:
+        content = Path(project.env_config_path).read_bytes()
+        name = hashlib.sha256(content).hexdigest()
+    else:
+        from mlflow.utils.virtualenv import _get_virtualenv_name
+
+        python_env = _get_python_env(project.env_type, project.env_config_path)
+        name = _get_virtualenv_name(python_env, Path(source))
+
+    return Environment(manager, source, project.env_config_path, project.env_type, name)
+
+
+def _get_python_env(env_type_: str, config_path: str | None) -> Any:
+    from mlflow.utils.environment import _PythonEnv
+
+    if env_type_ == env_type.CONDA:
+        return _PythonEnv.from_conda_yaml(config_path)
+
+    return _PythonEnv.from_yaml(config_path) if config_path else _PythonEnv()
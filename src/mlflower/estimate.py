@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import heapq
+import statistics
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+from .scheduler import Limits, ReadyQueue
+
+if TYPE_CHECKING:
+    from .entry_point import EntryPoint
+    from .tracking import Tracker
+
+RUN_NAME_TAG = "mlflow.runName"
+
+# Durations are the median of each step's latest finished runs
+HISTORY_SIZE = 5
+MAX_HISTORY_RUNS = 5000
+
+
+@dataclass
+class Schedule:
+    makespan: float = 0.0
+    peak_parallelism: int = 0
+    spans: dict[str, tuple[float, float]] = field(default_factory=dict)
+
+
+def get_step_durations(
+    tracker: Tracker, experiment_ids: list[str], keys: Iterable[str]
+) -> dict[str, float]:
+    # Steps are run under their own name: one search covers all of them
+    keys = set(keys)
+    history: dict[str, list[float]] = {}
+    runs = tracker.search_runs(
+        experiment_ids,
+        filter_string="attributes.status = 'FINISHED'",
+        order_by=["attributes.start_time DESC"],
+        max_results=MAX_HISTORY_RUNS,
+    )
+    for run in runs:
+        key = run.data.tags.get(RUN_NAME_TAG)
+        if key not in keys or run.info.end_time is None:
+            continue
+
+        durations = history.setdefault(key, [])
+        if len(durations) < HISTORY_SIZE:
+            durations.append((run.info.end_time - run.info.start_time) / 1000)
+
+    return {key: statistics.median(durations) for key, durations in history.items()}
+
+
+def simulate(
+    entry_points: Mapping[str, EntryPoint],
+    durations: Mapping[str, float],
+    root: str | None = None,
+    limits: Limits | None = None,
+) -> Schedule:
+    # Replays the scheduler with the given durations: same order, same limits
+    queue = ReadyQueue(
+        {key: ep.depends_on for key, ep in entry_points.items()},
+        done={root} if root else (),
+        priorities={key: ep.priority for key, ep in entry_points.items()},
+        limits=limits,
+    )
+
+    schedule = Schedule()
+    now, running = 0.0, []
+    while queue:
+        for key in queue.pop_ready():
+            end = now + durations.get(key, 0.0)
+            schedule.spans[key] = (now, end)
+            heapq.heappush(running, (end, key))
+        # Workflows and steps without a duration don't take a slot for long
+        parallelism = sum(end > now for end, _ in running)
+        schedule.peak_parallelism = max(schedule.peak_parallelism, parallelism)
+
+        if not running:
+            raise ValueError(f"Unreachable steps: {sorted(queue.pending)}")
+
+        now, key = heapq.heappop(running)
+        queue.mark_done(key)
+        while running and running[0][0] <= now:
+            queue.mark_done(heapq.heappop(running)[1])
+
+    schedule.makespan = now
+    return schedule
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+
+    return f"{seconds}s"
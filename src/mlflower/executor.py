@@ -0,0 +1,426 @@
+from __future__ import annotations
+
+import contextlib
+import importlib
+import logging
+import multiprocessing
+import os
+import queue
+import runpy
+import shlex
+import sys
+import threading
+import traceback
+from concurrent.futures import CancelledError, Future
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from mlflow.entities import RunStatus
+from mlflow.projects import SubmittedRun
+
+from .scheduler import parse_memory
+from .tracking import terminate_run
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TASKS = 100
+DEFAULT_MAX_MEMORY = "2G"
+# Imported by every worker before its first step, on top of the requested modules
+PRELOADED_MODULES = ("mlflow",)
+
+PYTHON_NAMES = {"python", "python3", Path(sys.executable).name}
+# Commands running these modules are workflows themselves: they stay in subprocesses
+EXCLUDED_MODULES = {"mlflower"}
+SHELL_OPERATORS = set("();<>|&")
+# Left as they are by shlex, where the shell would expand them
+SHELL_EXPANSIONS = set("$`~*?[")
+
+# Exit code of steps whose worker died or was killed while running them
+KILLED_EXIT_CODE = -9
+
+
+# Steps of the local backend and env manager, whose command only runs a Python script,
+# module or code, run in warm worker processes instead of a new interpreter each. Workers
+# import heavy modules once, and are replaced after `max_tasks` steps or once their
+# memory goes over `max_memory`, so that leaks of the steps don't pile up.
+class WarmPool:
+    def __init__(
+        self,
+        workers: int,
+        modules: Iterable[str] = (),
+        max_tasks: int = DEFAULT_MAX_TASKS,
+        max_memory: str | int = DEFAULT_MAX_MEMORY,
+    ):
+        self.modules = [*PRELOADED_MODULES, *modules]
+        self.max_tasks = max_tasks
+        self.max_memory = int(parse_memory(max_memory))
+        self.closed = False
+        self.tasks: queue.Queue[tuple[dict[str, Any], Future[int]] | None] = (
+            queue.Queue()
+        )
+        self._slots = [_Slot(self) for _ in range(workers)]
+        for slot in self._slots:
+            slot.start()
+
+    def submit(
+        self,
+        source: str,
+        entry_point: str,
+        parameters: dict[str, Any],
+        run_args: dict[str, Any],
+        log_path: Path | None = None,
+    ) -> SubmittedRun | None:
+        from mlflow import MlflowClient
+        from mlflow.projects import _resolve_experiment_id
+        from mlflow.projects.utils import (
+            _create_run,
+            get_entry_point_command,
+            get_run_env_vars,
+            load_project,
+        )
+        from mlflow.utils.mlflow_tags import (
+            MLFLOW_PROJECT_BACKEND,
+            MLFLOW_PROJECT_ENV,
+            MLFLOW_RUN_NAME,
+        )
+
+        project = load_project(source)
+        command = " && ".join(
+            get_entry_point_command(
+                project, entry_point, parameters, run_args.get("storage_dir")
+            )
+        )
+        program = get_program(command)
+        if program is None:
+            return None
+
+        experiment_id = _resolve_experiment_id(
+            experiment_id=run_args.get("experiment_id")
+        )
+        run = _create_run(source, experiment_id, source, None, entry_point, parameters)
+        run_id = run.info.run_id
+        tags = {MLFLOW_PROJECT_BACKEND: "local", MLFLOW_PROJECT_ENV: "local"}
+        if run_args.get("run_name"):
+            tags[MLFLOW_RUN_NAME] = run_args["run_name"]
+        client = MlflowClient()
+        for key, value in tags.items():
+            client.set_tag(run_id, key, value)
+
+        _logger.info("Running command '%s' in warm run %s", command, run_id)
+        future: Future[int] = Future()
+        task = {
+            "program": program,
+            "work_dir": source,
+            "env": get_run_env_vars(run_id, experiment_id),
+            "log_path": log_path,
+        }
+        self.tasks.put((task, future))
+        submitted_run = WarmSubmittedRun(self, run_id, future)
+        if run_args.get("synchronous"):
+            submitted_run.wait()
+
+        return submitted_run
+
+    def cancel(self, future: Future[int]) -> None:
+        if future.cancel():
+            return
+
+        for slot in self._slots:
+            if slot.future is future:
+                slot.kill()
+
+    def close(self) -> None:
+        # Steps still running are killed and queued ones cancelled, and the workers
+        # aren't replaced
+        self.closed = True
+        with contextlib.suppress(queue.Empty):
+            while True:
+                item = self.tasks.get_nowait()
+                if item is not None:
+                    item[1].cancel()
+        for _ in self._slots:
+            self.tasks.put(None)
+        for slot in self._slots:
+            slot.kill()
+
+
+class WarmSubmittedRun(SubmittedRun):
+    # Completion is polled from the future, which is cheap
+    max_poll_interval = 0.1
+
+    def __init__(self, pool: WarmPool, run_id: str, future: Future[int]):
+        self.pool = pool
+        self.future = future
+        self._run_id = run_id
+        future.add_done_callback(self._terminate)
+
+    @property
+    def run_id(self) -> str:
+        return self._run_id
+
+    def wait(self) -> bool:
+        with contextlib.suppress(CancelledError):
+            self.future.result()
+
+        return self.get_status() == RunStatus.FINISHED
+
+    def get_status(self) -> RunStatus:
+        if not self.future.done():
+            return RunStatus.RUNNING
+        if self.future.cancelled() or self.future.result() == KILLED_EXIT_CODE:
+            return RunStatus.KILLED
+        if self.future.result() != 0:
+            return RunStatus.FAILED
+
+        return RunStatus.FINISHED
+
+    def cancel(self) -> None:
+        self.pool.cancel(self.future)
+        self.wait()
+
+    def _terminate(self, _: Future[int]) -> None:
+        # As `mlflow run` does for its subprocess: the exit code decides, even if the
+        # step ended its run itself
+        status = RunStatus.to_string(self.get_status())
+        terminate_run(self._run_id, status, overwrite=True)
+
+
+# A worker process, and the thread feeding it steps from the pool's queue
+class _Slot(threading.Thread):
+    def __init__(self, pool: WarmPool):
+        super().__init__(name="mlflower-warm", daemon=True)
+        self.pool = pool
+        self.future: Future[int] | None = None
+        self._process: multiprocessing.process.BaseProcess | None = None
+        self._conn: Connection | None = None
+        self._tasks_run = 0
+        self._lock = threading.Lock()
+
+    def run(self) -> None:
+        self._spawn()
+        while True:
+            item = self.pool.tasks.get()
+            if item is None:
+                return
+
+            task, future = item
+            if self.pool.closed:
+                future.cancel()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            self.future = future
+            exit_code, retire = self._execute(task)
+            self.future = None
+            future.set_result(exit_code)
+
+            self._tasks_run += 1
+            if self.pool.closed:
+                return
+            if retire or self._tasks_run >= self.pool.max_tasks:
+                self.kill()
+                self._spawn()
+
+    def _execute(self, task: dict[str, Any]) -> tuple[int, bool]:
+        if self._conn is None:
+            self._spawn()
+        with self._lock:
+            conn = self._conn
+        if conn is None:
+            return KILLED_EXIT_CODE, True
+        try:
+            conn.send(task)
+            return conn.recv()
+        except (EOFError, OSError):
+            # Killed, or crashed along with its step
+            return KILLED_EXIT_CODE, True
+
+    def _spawn(self) -> None:
+        # Spawned rather than forked: the orchestrator runs threads
+        if self.pool.closed:
+            return
+
+        context = multiprocessing.get_context("spawn")
+        conn, child_conn = context.Pipe()
+        process = context.Process(
+            target=_serve,
+            args=(child_conn, self.pool.modules, self.pool.max_memory),
+            name="mlflower-warm-worker",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        self._tasks_run = 0
+        with self._lock:
+            # Unless the pool was closed meanwhile, after killing the previous worker
+            if not self.pool.closed:
+                self._process, self._conn = process, conn
+                return
+
+        process.kill()
+        process.join()
+        conn.close()
+
+    def kill(self) -> None:
+        with self._lock:
+            process, conn = self._process, self._conn
+            self._process = self._conn = None
+        if process is not None:
+            process.kill()
+            process.join()
+        if conn is not None:
+            conn.close()
+
+
+def get_program(command: str) -> tuple[str, str, list[str]] | None:
+    # ("path", script, args), ("module", name, args) or ("code", code, args), for
+    # commands that are nothing but a Python invocation
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    argv = list(lexer)
+    if len(argv) < 2 or Path(argv[0]).name not in PYTHON_NAMES:  # noqa: PLR2004
+        return None
+    if any(set(arg) <= SHELL_OPERATORS or set(arg) & SHELL_EXPANSIONS for arg in argv):
+        return None
+
+    option, *args = argv[1:]
+    if option in ("-m", "-c") and args:
+        target, *args = args
+        if option == "-m" and target.split(".")[0] in EXCLUDED_MODULES:
+            return None
+        return ("module" if option == "-m" else "code"), target, args
+    if option.startswith("-"):
+        return None
+
+    return "path", option, args
+
+
+def _serve(conn: Connection, modules: list[str], max_memory: int) -> None:
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            traceback.print_exc()
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+
+        with _redirect_output(task["log_path"]):
+            exit_code = _run_task(task)
+        conn.send((exit_code, _get_memory() > max_memory))
+
+
+@contextlib.contextmanager
+def _redirect_output(path: str | Path | None) -> Iterator[None]:
+    # The worker process runs one step at a time: its own output is the step's
+    if path is None:
+        yield
+        return
+
+    with open(path, "ab") as log:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved = [os.dup(1), os.dup(2)]
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for fd, saved_fd in enumerate(saved, start=1):
+                os.dup2(saved_fd, fd)
+                os.close(saved_fd)
+
+
+def _run_task(task: dict[str, Any]) -> int:
+    kind, target, args = task["program"]
+    work_dir = Path(task["work_dir"]).resolve()
+    environ, cwd, argv, path = dict(os.environ), os.getcwd(), sys.argv, list(sys.path)
+    modules = set(sys.modules)
+
+    os.environ.update(task["env"])
+    os.chdir(work_dir)
+    sys.argv = [target if kind == "path" else f"-{kind[0]}", *args]
+    script_dir = work_dir.joinpath(target).parent if kind == "path" else work_dir
+    sys.path.insert(0, str(script_dir))
+    exit_code = 1
+    try:
+        if kind == "path":
+            runpy.run_path(target, run_name="__main__")
+        elif kind == "module":
+            runpy.run_module(target, run_name="__main__", alter_sys=True)
+        else:
+            code = compile(target, "<string>", "exec")
+            exec(code, {"__name__": "__main__"})  # noqa: S102
+        exit_code = 0
+    except SystemExit as e:
+        exit_code = _get_exit_code(e.code)
+    except Exception as e:  # noqa: BLE001
+        # Reported as the interpreter would, without this frame, and the worker goes on
+        traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+    finally:
+        _end_runs(exit_code)
+        _reset_mlflow()
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.environ.clear()
+        os.environ.update(environ)
+        os.chdir(cwd)
+        sys.argv, sys.path[:] = argv, path
+        # The project's own modules go, the libraries it imported stay warm
+        for name in set(sys.modules) - modules:
+            file = getattr(sys.modules[name], "__file__", None)
+            if file is not None and work_dir in Path(file).resolve().parents:
+                del sys.modules[name]
+
+    return exit_code
+
+
+def _end_runs(exit_code: int) -> None:
+    # Runs the step left open end as they would with its process
+    import mlflow
+
+    status = RunStatus.FINISHED if exit_code == 0 else RunStatus.FAILED
+    while mlflow.active_run() is not None:
+        mlflow.end_run(RunStatus.to_string(status))
+
+
+def _reset_mlflow() -> None:
+    # The tracking URI, experiment and autologging a step sets would stay set in the
+    # worker for the steps after it
+    import mlflow
+    from mlflow.tracking import fluent
+    from mlflow.utils.autologging_utils import (
+        AUTOLOGGING_INTEGRATIONS,
+        autologging_is_disabled,
+    )
+
+    mlflow.set_tracking_uri(None)
+    fluent._active_experiment_id = None
+    if not all(map(autologging_is_disabled, list(AUTOLOGGING_INTEGRATIONS))):
+        mlflow.autolog(disable=True, silent=True)
+
+
+def _get_exit_code(code: Any) -> int:
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _get_memory() -> int:
+    # Resident memory, where /proc is available. Elsewhere, only `max_tasks` applies.
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0
+
+    return pages * os.sysconf("SC_PAGE_SIZE")
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Iterable, Mapping
+
+# Graphs map each node to the nodes it depends on. Dependencies that aren't nodes of the
+# graph are ignored. Everything here is iterative and linear in the graph's size, except
+# for the transitive reduction.
+Graph = Mapping[str, Iterable[str]]
+
+
+class CycleError(ValueError):
+    def __init__(self, path: list[str]):
+        self.path = path
+        super().__init__(f"Dependency cycle: {' -> '.join(path)}")
+
+
+def get_dependencies(graph: Graph) -> dict[str, set[str]]:
+    return {
+        key: {dependency for dependency in dependencies if dependency in graph}
+        for key, dependencies in graph.items()
+    }
+
+
+def get_dependents(graph: Graph) -> dict[str, list[str]]:
+    dependents: dict[str, list[str]] = {key: [] for key in graph}
+    for key, dependencies in get_dependencies(graph).items():
+        for dependency in dependencies:
+            dependents[dependency].append(key)
+
+    return dependents
+
+
+def topological_order(graph: Graph) -> list[str]:
+    order, cyclic = _sort(graph)
+    if cyclic:
+        raise CycleError(find_cycle(graph, cyclic))
+
+    return order
+
+
+def find_cycle(graph: Graph, nodes: Iterable[str]) -> list[str]:
+    # Every node left over by a topological sort depends on another left over node:
+    # walking dependencies from any of them must come back to one already visited.
+    # The path is returned in execution order, each node running before the next.
+    nodes = set(nodes)
+    node = next(key for key in graph if key in nodes)
+    visited: dict[str, int] = {}
+    path = []
+    while node not in visited:
+        visited[node] = len(path)
+        path.append(node)
+        node = min(dependency for dependency in graph[node] if dependency in nodes)
+
+    return [node, *reversed(path[visited[node] :])]
+
+
+def get_levels(graph: Graph) -> dict[str, int]:
+    # The wave of each node when running everything as soon as possible, from 0
+    dependencies = get_dependencies(graph)
+    levels: dict[str, int] = {}
+    for key in topological_order(graph):
+        levels[key] = 1 + max((levels[dep] for dep in dependencies[key]), default=-1)
+
+    return levels
+
+
+def get_waves(graph: Graph) -> list[list[str]]:
+    waves: list[list[str]] = []
+    for key, level in get_levels(graph).items():
+        if level == len(waves):
+            waves.append([])
+        waves[level].append(key)
+
+    return waves
+
+
+def bottom_levels(graph: Graph) -> dict[str, int]:
+    # Length of the longest chain of dependents of each node, itself included. Nodes on
+    # or behind a cycle get 1 rather than an error: the scheduler reports them itself.
+    dependents = get_dependents(graph)
+    order, _ = _sort(graph)
+
+    levels = dict.fromkeys(graph, 1)
+    for key in reversed(order):
+        levels[key] = 1 + max((levels[d] for d in dependents[key]), default=0)
+
+    return levels
+
+
+def get_ancestors(graph: Graph, keys: Iterable[str]) -> set[str]:
+    ancestors, stack = set(), list(keys)
+    while stack:
+        for dependency in graph.get(stack.pop(), ()):
+            if dependency not in ancestors:
+                ancestors.add(dependency)
+                stack.append(dependency)
+
+    return ancestors
+
+
+def get_descendants(graph: Graph, keys: Iterable[str]) -> set[str]:
+    return get_ancestors(get_dependents(graph), keys)
+
+
+def transitive_reduction(graph: Graph) -> dict[str, set[str]]:
+    # A dependency is redundant when another dependency already depends on it. Searches
+    # only go back as far as the earliest direct dependency in topological order: nodes
+    # before it can't lead to any of them.
+    dependencies = get_dependencies(graph)
+    position = {key: i for i, key in enumerate(topological_order(graph))}
+
+    reduced = {}
+    for key, direct in dependencies.items():
+        if len(direct) <= 1:
+            reduced[key] = set(direct)
+            continue
+
+        earliest = min(position[dependency] for dependency in direct)
+        reachable: set[str] = set()
+        stack = [dep for dependency in direct for dep in dependencies[dependency]]
+        while stack:
+            node = stack.pop()
+            if node in reachable or position[node] < earliest:
+                continue
+
+            reachable.add(node)
+            stack.extend(dependencies[node])
+
+        reduced[key] = direct - reachable
+
+    return reduced
+
+
+def _sort(graph: Graph) -> tuple[list[str], list[str]]:
+    # Kahn's algorithm, ties broken by the graph's order. Also returns the nodes that
+    # couldn't be sorted, being on or behind a cycle.
+    dependents = get_dependents(graph)
+    remaining = {key: len(deps) for key, deps in get_dependencies(graph).items()}
+
+    order = []
+    queue = deque(key for key, count in remaining.items() if count == 0)
+    while queue:
+        key = queue.popleft()
+        order.append(key)
+        for dependent in dependents[key]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                queue.append(dependent)
+
+    cyclic = [key for key, count in remaining.items() if count > 0]
+    return order, cyclic
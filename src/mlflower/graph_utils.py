@@ -1,22 +1,14 @@
 from __future__ import annotations
 
-from typing import Iterable
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, Iterable, Mapping
 
-from .entry_point import EntryPoint
+from .graph import topological_order, transitive_reduction
 
-
-def _topological_sort_rec(
-    node: str,
-    nodes: dict[str, EntryPoint],
-    unseen: dict[str, bool],
-    sorted_nodes: list[str],
-) -> list[str]:
-    unseen[node] = False
-
-    for n in filter(unseen.get, nodes[node].depends_on):
-        sorted_nodes = _topological_sort_rec(n, nodes, unseen, sorted_nodes)
-
-    return [*sorted_nodes, node]
+if TYPE_CHECKING:
+    from .entry_point import EntryPoint
+    from .tracing import Span
 
 
 def topological_sort(
@@ -27,13 +19,8 @@ def topological_sort(
             f"Root cannot have dependencies: {root} -> {nodes[root].depends_on}"
         )
 
-    unseen = {key: key != root for key in nodes}
-
-    sorted_nodes = []
-    for node in filter(unseen.get, nodes):
-        sorted_nodes = _topological_sort_rec(node, nodes, unseen, sorted_nodes)
-
-    return sorted_nodes
+    graph = {key: node.depends_on for key, node in nodes.items()}
+    return [key for key in topological_order(graph) if key != root]
 
 
 # -- mermaid visualisation--
@@ -42,35 +29,53 @@ def _get_line(
 ) -> str:
     if edge_type == "artifact":
         arrow = "--o"
+    elif edge_type == "collect":
+        arrow = "==>"
     elif edge_type == "parameter":
         arrow = "-->"
     else:
         arrow = "-.->"
 
     edge = f"{arrow}|{edge}|" if edge else arrow
-    source = source.replace(" ", "-")
-    target = target.replace(" ", "-")
-    return f"{source} {edge} {target}"
+    return f"{_get_node_id(source)} {edge} {_get_node_id(target)}"
+
+
+def _get_node_id(node_name: str) -> str:
+    return re.sub(r"[^\w-]", "-", node_name)
 
 
-def _get_node_names(graph: Iterable[str], root: str | None = None) -> list[str]:
+def _get_node_names(
+    graph: Iterable[str], root: str | None = None, sweeps: Counter[str] | None = None
+) -> list[str]:
+    sweeps = sweeps or Counter()
     text = []
     for node_name in graph:
         if node_name == root:
             continue
 
-        node_id = node_name.replace(" ", "-")
-        text.append(f"{node_id}([{node_name}])")
+        label = (
+            f"{node_name} x{sweeps[node_name]}" if node_name in sweeps else node_name
+        )
+        text.append(f"{_get_node_id(node_name)}([{label}])")
     return text
 
 
 def get_mermaid_graph(graph: dict[str, EntryPoint], root: str | None = None) -> str:
     text = ["flowchart TD"]
 
-    text.extend(_get_node_names(graph, root))
+    # Shards are drawn as their sweep: a single node labelled with their count
+    sweeps = Counter(node.parent for node in graph.values() if node.sweep is not None)
+    nodes = [node_name for node_name, node in graph.items() if node.sweep is None]
+    text.extend(_get_node_names(nodes, root, sweeps))
+
+    # Ordering edges implied by other paths aren't drawn
+    dependencies = transitive_reduction(_get_drawn_dependencies(graph, root))
 
     keys = ("id", "type")
     for node_name, node in graph.items():
+        if node.sweep is not None:
+            continue
+
         param_dependencies = {root}
         for key, parameter in node.workflow_parameters.items():
             source, edge_type = map(parameter.get, keys)
@@ -81,15 +86,82 @@ def get_mermaid_graph(graph: dict[str, EntryPoint], root: str | None = None) ->
             text.append(_get_line(source, node_name, key, edge_type))
             param_dependencies.add(source)
 
-        for dependency in node.depends_on:
-            if dependency in param_dependencies:
-                continue
+        for dependency in dependencies[node_name]:
+            if dependency not in param_dependencies:
+                text.append(_get_line(dependency, node_name))
 
-            text.append(_get_line(dependency, node_name))
+    return "\n".join(text)
+
+
+def _get_drawn_dependencies(
+    graph: dict[str, EntryPoint], root: str | None = None
+) -> dict[str, set[str]]:
+    # Dependencies on shards are drawn as dependencies on their sweep
+    drawn = {}
+    for node_name, node in graph.items():
+        if node.sweep is not None:
+            continue
+
+        drawn[node_name] = {
+            graph[dependency].parent if graph[dependency].sweep else dependency
+            for dependency in node.depends_on
+            if dependency in graph
+            and dependency != root
+            and not _is_nested_dependency(node_name, dependency, node.depends_on)
+        } - {node_name}
+
+    return drawn
+
+
+def _is_nested_dependency(
+    node_name: str, dependency: str, depends_on: Iterable[str]
+) -> bool:
+    # Waiting on every step of a nested workflow is implied by the edge to the workflow
+    return any(
+        dependency.startswith(f"{workflow}/")
+        and not node_name.startswith(f"{workflow}/")
+        for workflow in depends_on
+    )
+
+
+def get_mermaid_gantt(
+    spans: Iterable[Span],
+    critical_path: Iterable[str] = (),
+    phases: Iterable[str] = (),
+    sweeps: Mapping[str, str] | None = None,
+) -> str:
+    spans, critical_path = list(spans), set(critical_path)
+    text = ["gantt", "dateFormat x", "axisFormat %H:%M:%S"]
+
+    for phase in phases:
+        text.append(f"section {phase}")
+        bars = _get_bars([span for span in spans if span.name == phase], sweeps or {})
+        for name, (start, end, keys) in bars.items():
+            tags = "crit, " if keys & critical_path else ""
+            label = f"{name} x{len(keys)}" if name in (sweeps or {}).values() else name
+            label = re.sub(r"[:;#]", "-", label)
+            start_ms, end_ms = int(start * 1000), int(end * 1000)
+            text.append(f"{label} :{tags}{start_ms}, {max(end_ms, start_ms + 1)}")
 
     return "\n".join(text)
 
 
+def _get_bars(
+    spans: Iterable[Span], sweeps: Mapping[str, str]
+) -> dict[str, tuple[float, float, set[str]]]:
+    # Shards are drawn as their sweep: a single bar, from the first start to the last end
+    bars: dict[str, tuple[float, float, set[str]]] = {}
+    for span in spans:
+        if span.key is None:
+            continue
+
+        name = sweeps.get(span.key, span.key)
+        start, end, keys = bars.get(name, (span.start, span.end, set()))
+        bars[name] = (min(start, span.start), max(end, span.end), {*keys, span.key})
+
+    return bars
+
+
 def to_link(
     text: str, format_: str = "svg", alt_text: str = "Graph Representation"
 ) -> str:
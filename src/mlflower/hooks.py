@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import importlib
+import logging
+import time
+from importlib import metadata
+from typing import TYPE_CHECKING, Any, Callable, Iterable
+
+if TYPE_CHECKING:
+    from mlflow.entities import RunStatus
+
+    from .workflow import Workflow
+
+_logger = logging.getLogger(__name__)
+
+HOOKS_GROUP = "mlflower.hooks"
+
+SETUP_DONE = "setup_done"
+PLAN_BUILT = "plan_built"
+STEP_READY = "step_ready"
+STEP_SUBMITTED = "step_submitted"
+STEP_FINISHED = "step_finished"
+STEP_FAILED = "step_failed"
+PARAM_RESOLVED = "param_resolved"
+WORKFLOW_ENDED = "workflow_ended"
+EVENTS = (
+    SETUP_DONE,
+    PLAN_BUILT,
+    STEP_READY,
+    STEP_SUBMITTED,
+    STEP_FINISHED,
+    STEP_FAILED,
+    PARAM_RESOLVED,
+    WORKFLOW_ENDED,
+)
+
+
+# A hook is any object with `on_<event>` methods, e.g. `on_step_submitted`: only the
+# events it implements are dispatched to it, and events nobody listens to cost a lookup.
+class HookRegistry:
+    def __init__(self, hooks: Iterable[Any] = ()):
+        self._callbacks: dict[str, list[Callable[..., None]]] = {}
+        for hook in hooks:
+            self.register(hook)
+
+    def __bool__(self) -> bool:
+        return bool(self._callbacks)
+
+    def register(self, hook: Any) -> None:
+        for event in EVENTS:
+            callback = getattr(hook, f"on_{event}", None)
+            if callback is not None:
+                self._callbacks.setdefault(event, []).append(callback)
+
+    def emit(self, event: str, **kwargs: Any) -> None:
+        for callback in self._callbacks.get(event, ()):
+            try:
+                callback(**kwargs)
+            except Exception:
+                _logger.exception("Hook %r failed on %s", callback, event)
+
+
+def load_hook(name: str) -> Any:
+    # Hooks are installed under the `mlflower.hooks` entry point group, or given as
+    # `module:attribute`. Either way they point to a factory, usually the hook class.
+    if ":" in name:
+        module_name, attribute = name.split(":", 1)
+        factory = getattr(importlib.import_module(module_name), attribute)
+        return factory()
+
+    for entry_point in _get_entry_points(HOOKS_GROUP):
+        if entry_point.name == name:
+            return entry_point.load()()
+
+    raise ValueError(f"Unknown hook: {name!r}")
+
+
+def get_hook_names() -> list[str]:
+    return sorted(entry_point.name for entry_point in _get_entry_points(HOOKS_GROUP))
+
+
+def _get_entry_points(group: str) -> Iterable[metadata.EntryPoint]:
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        return entry_points.select(group=group)
+
+    return entry_points.get(group, ())
+
+
+class ProfilingHook:
+    def __init__(self):
+        self.setup_time = 0.0
+        self.overhead = 0.0
+        self.runtime = 0.0
+        # Hooks are loaded as the workflow's setup starts
+        self._started_at = time.perf_counter()
+        self._cpu_started_at = time.process_time()
+        self._ready_at: dict[str, float] = {}
+        self._submitted_at: dict[str, float] = {}
+
+    def on_setup_done(self, workflow: Workflow) -> None:
+        # Environments, warm workers and logs are set up: overhead is counted from now on
+        now = time.perf_counter()
+        self.setup_time = now - self._started_at
+        self._started_at = now
+        self._cpu_started_at = time.process_time()
+
+    def on_plan_built(self, workflow: Workflow) -> None:
+        self.overhead += time.perf_counter() - self._started_at
+
+    def on_step_ready(self, workflow: Workflow, key: str) -> None:
+        self._ready_at[key] = time.perf_counter()
+
+    def on_step_submitted(self, workflow: Workflow, key: str, run_id: str) -> None:
+        now = time.perf_counter()
+        self.overhead += now - self._ready_at.pop(key, now)
+        self._submitted_at[key] = now
+
+    def on_step_finished(self, workflow: Workflow, key: str, run_id: str) -> None:
+        self._end_step(key)
+
+    def on_step_failed(self, workflow: Workflow, key: str, run_id: str) -> None:
+        self._end_step(key)
+
+    def on_workflow_ended(self, workflow: Workflow, status: RunStatus) -> None:
+        cpu_time = time.process_time() - self._cpu_started_at
+        _logger.info(
+            "Setup: %.2fs, orchestrator overhead: %.2fs (%.2fs cpu), "
+            "cumulative step runtime: %.2fs",
+            self.setup_time,
+            self.overhead,
+            cpu_time,
+            self.runtime,
+        )
+        workflow.tracker.log_metric(
+            workflow.run_id, "mlflower.profile.setup_time", self.setup_time
+        )
+        workflow.tracker.log_metric(
+            workflow.run_id, "mlflower.profile.orchestrator_overhead", self.overhead
+        )
+        workflow.tracker.log_metric(
+            workflow.run_id, "mlflower.profile.orchestrator_cpu_time", cpu_time
+        )
+        workflow.tracker.log_metric(
+            workflow.run_id, "mlflower.profile.step_runtime", self.runtime
+        )
+
+    def _end_step(self, key: str) -> None:
+        now = time.perf_counter()
+        self.runtime += now - self._submitted_at.pop(key, now)
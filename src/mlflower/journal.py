@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+import json
+from typing import Iterable
+
+from mlflow.entities import RunStatus
+
+from .tracking import Tracker
+
+JOURNAL_TAG_PREFIX = "mlflower.journal."
+PROJECT_URI_TAG = "mlflower.project_uri"
+ROOT_ENTRY_POINT_TAG = "mlflower.root_entry_point"
+
+
+class Journal:
+    def __init__(self, run_id: str, tracker: Tracker):
+        self.run_id = run_id
+        self._tracker = tracker
+
+    def record(self, key: str, run_id: str, status: RunStatus) -> None:
+        entry = {"run_id": run_id, "status": RunStatus.to_string(status)}
+        self._tracker.set_tag(self.run_id, JOURNAL_TAG_PREFIX + key, json.dumps(entry))
+
+    def load(self) -> dict[str, dict[str, str]]:
+        tags = self._tracker.get_run(self.run_id).data.tags
+        return {
+            key[len(JOURNAL_TAG_PREFIX) :]: json.loads(value)
+            for key, value in tags.items()
+            if key.startswith(JOURNAL_TAG_PREFIX)
+        }
+
+
+def find_latest_run_ids(
+    tracker: Tracker,
+    experiment_ids: list[str],
+    keys: Iterable[str],
+    tags: dict[str, str],
+    exclude_run_id: str | None = None,
+) -> dict[str, str]:
+    # The latest finished run of each step, in the journals of previous workflow runs
+    # sharing the given tags (e.g. the same project and root entry point)
+    filters = [
+        f"tags.`{key}` = '{value}'" for key, value in tags.items() if value is not None
+    ]
+    finished = RunStatus.to_string(RunStatus.FINISHED)
+
+    run_ids = {}
+    for key in keys:
+        workflow_runs = tracker.search_runs(
+            experiment_ids,
+            filter_string=" and ".join(
+                [*filters, f"tags.`{JOURNAL_TAG_PREFIX}{key}` LIKE '%{finished}%'"]
+            ),
+            order_by=["attributes.start_time DESC"],
+            max_results=2,
+        )
+        for workflow_run in workflow_runs:
+            if workflow_run.info.run_id != exclude_run_id:
+                entry = json.loads(workflow_run.data.tags[JOURNAL_TAG_PREFIX + key])
+                run_ids[key] = entry["run_id"]
+                break
+
+    return run_ids
@@ -0,0 +1,284 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+from mlflow import MlflowClient
+
+_logger = logging.getLogger(__name__)
+
+LOG_ARTIFACT_DIR = "mlflower/logs"
+
+DEFAULT_TAIL_LINES = 50
+DEFAULT_CHUNK_SIZE = 2**20
+DEFAULT_FLUSH_INTERVAL = 10.0
+POLL_INTERVAL = 0.1
+READ_SIZE = 2**16
+# Reads of a log per round, so that a chatty step doesn't hold the others back
+MAX_READS = 16
+MAX_LINE_LENGTH = 4096
+
+# The log file of the step this thread is starting, if any
+_starting = threading.local()
+
+
+@contextlib.contextmanager
+def redirect_output(path: str | Path | None) -> Iterator[None]:
+    # Steps started in the block by mlflow's local backend write their stdout and stderr
+    # to the file: files never block writers, as a full pipe would. Only the step's
+    # process is redirected, not this one's output, nor steps other threads start.
+    if path is None:
+        yield
+        return
+
+    _patch_local_backend()
+    with open(path, "ab") as log:
+        _starting.log = log
+        try:
+            yield
+        finally:
+            _starting.log = None
+
+
+# Stands in for the subprocess module in mlflow's local backend, which starts steps
+# (`mlflow run` or the entry point's command) with this process' stdout and stderr
+class _Subprocess:
+    def __getattr__(self, name: str) -> Any:
+        return getattr(subprocess, name)
+
+    @staticmethod
+    def Popen(*args: Any, **kwargs: Any) -> subprocess.Popen:  # noqa: N802
+        log = getattr(_starting, "log", None)
+        if log is not None:
+            kwargs.setdefault("stdout", log)
+            kwargs.setdefault("stderr", log)
+        return subprocess.Popen(*args, **kwargs)  # noqa: S603
+
+
+def _patch_local_backend() -> None:
+    from mlflow.projects.backend import local
+
+    if not isinstance(local.subprocess, _Subprocess):
+        local.subprocess = _Subprocess()
+
+
+# A byte range of a step's log, uploaded to its run as one file
+@dataclass
+class LogChunk:
+    run_id: str
+    index: int
+    start: int
+    end: int
+
+    @property
+    def name(self) -> str:
+        return f"part-{self.index:05d}.log"
+
+
+# The output of a step, read back from its file: only its last lines stay in memory
+class StepLog:
+    def __init__(self, label: str, path: Path, tail_lines: int = DEFAULT_TAIL_LINES):
+        self.label = label
+        self.path = path
+        self.run_id: str | None = None
+        self.tail: deque[str] = deque(maxlen=tail_lines)
+        self.closed = False
+        self._file: IO[bytes] = open(path, "rb")  # noqa: SIM115
+        self._partial = b""
+        self._offset = 0
+        self._chunk_start = 0
+        self._chunk_started_at = time.monotonic()
+        self._chunks = 0
+
+    def read(self, max_reads: int | None = None) -> list[str]:
+        lines, reads = [], 0
+        while max_reads is None or reads < max_reads:
+            data = self._file.read(READ_SIZE)
+            if not data:
+                break
+
+            reads += 1
+            self._offset += len(data)
+            *complete, self._partial = (self._partial + data).split(b"\n")
+            if len(self._partial) > MAX_LINE_LENGTH:
+                complete.append(self._partial)
+                self._partial = b""
+            lines.extend(_decode(line) for line in complete)
+
+        self.tail.extend(lines)
+        return lines
+
+    def finish(self) -> list[str]:
+        lines = self.read()
+        if self._partial:
+            lines.append(_decode(self._partial))
+            self.tail.append(lines[-1])
+            self._partial = b""
+
+        self._file.close()
+        self.closed = True
+        return lines
+
+    def cut(self, chunk_size: int, flush_interval: float) -> LogChunk | None:
+        # The next chunk to upload. Chunks end on a line boundary, and are cut once large
+        # or old enough, or once the step ended.
+        end = self._offset - len(self._partial)
+        if self.run_id is None or end <= self._chunk_start:
+            return None
+        if (
+            not self.closed
+            and end - self._chunk_start < chunk_size
+            and time.monotonic() - self._chunk_started_at < flush_interval
+        ):
+            return None
+
+        chunk = LogChunk(self.run_id, self._chunks, self._chunk_start, end)
+        self._chunks += 1
+        self._chunk_start = end
+        self._chunk_started_at = time.monotonic()
+        return chunk
+
+
+# Steps write their output to files, which a single thread tails: lines are echoed
+# prefixed with the step's key, and chunks of each log are uploaded by another thread
+# to the step's run, under mlflower/logs/. Memory use doesn't grow with the output.
+class LogMultiplexer:
+    def __init__(
+        self,
+        tail_lines: int = DEFAULT_TAIL_LINES,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+    ):
+        self.tail_lines = tail_lines
+        self.chunk_size = chunk_size
+        self.flush_interval = flush_interval
+        self._dir = Path(tempfile.mkdtemp(prefix="mlflower-logs-"))
+        self._out = _get_output()
+        self._logs: list[StepLog] = []
+        self._lock = threading.Lock()
+        self._uploads: queue.Queue[tuple[StepLog, LogChunk | None, bool] | None] = (
+            queue.Queue()
+        )
+        self._stop = threading.Event()
+        self._threads = [
+            threading.Thread(target=target, name=name, daemon=True)
+            for target, name in (
+                (self._tail, "mlflower-logs"),
+                (self._upload, "mlflower-log-upload"),
+            )
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def open(self, label: str) -> StepLog:
+        path = self._dir.joinpath(f"{uuid.uuid4().hex}.log")
+        path.touch()
+        step_log = StepLog(label, path, self.tail_lines)
+        with self._lock:
+            self._logs.append(step_log)
+
+        return step_log
+
+    def close(self, step_log: StepLog) -> list[str]:
+        # The last lines of the log, once all of it is read
+        with self._lock:
+            if not step_log.closed:
+                self._logs.remove(step_log)
+                self._echo(step_log, step_log.finish())
+                self._out.flush()
+                chunk = step_log.cut(self.chunk_size, self.flush_interval)
+                self._uploads.put((step_log, chunk, True))
+
+        return list(step_log.tail)
+
+    def shutdown(self) -> None:
+        # Waits for the remaining chunks to be uploaded
+        self._stop.set()
+        self._threads[0].join()
+        for step_log in list(self._logs):
+            self.close(step_log)
+        self._uploads.put(None)
+        self._threads[1].join()
+
+        shutil.rmtree(self._dir, ignore_errors=True)
+        if self._out is not sys.stdout:
+            self._out.close()
+
+    def _tail(self) -> None:
+        while not self._stop.wait(POLL_INTERVAL):
+            with self._lock:
+                for step_log in self._logs:
+                    self._echo(step_log, step_log.read(MAX_READS))
+                    chunk = step_log.cut(self.chunk_size, self.flush_interval)
+                    if chunk is not None:
+                        self._uploads.put((step_log, chunk, False))
+                self._out.flush()
+
+    def _echo(self, step_log: StepLog, lines: list[str]) -> None:
+        for line in lines:
+            self._out.write(f"[{step_log.label}] {line}\n")
+
+    def _upload(self) -> None:
+        client = MlflowClient()
+        while True:
+            item = self._uploads.get()
+            if item is None:
+                return
+
+            step_log, chunk, last = item
+            if chunk is not None:
+                try:
+                    _upload_chunk(client, step_log.path, chunk)
+                except Exception:
+                    _logger.exception("Failed to upload the log of %s", step_log.label)
+            if last:
+                step_log.path.unlink()
+
+
+def _upload_chunk(client: MlflowClient, path: Path, chunk: LogChunk) -> None:
+    chunk_dir = Path(tempfile.mkdtemp(dir=path.parent))
+    try:
+        chunk_path = chunk_dir.joinpath(chunk.name)
+        with open(path, "rb") as src, open(chunk_path, "wb") as dst:
+            src.seek(chunk.start)
+            remaining = chunk.end - chunk.start
+            while remaining > 0:
+                data = src.read(min(READ_SIZE, remaining))
+                if not data:
+                    break
+                dst.write(data)
+                remaining -= len(data)
+
+        client.log_artifact(chunk.run_id, str(chunk_path), LOG_ARTIFACT_DIR)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+
+
+def _get_output() -> IO[str]:
+    # A copy of stdout, which keeps going to the terminal while it is redirected
+    try:
+        return os.fdopen(os.dup(sys.stdout.fileno()), "w", errors="replace")
+    except (AttributeError, OSError, ValueError):
+        return sys.stdout
+
+
+def _decode(line: bytes) -> str:
+    # Progress bars redraw their line: only its last state is kept
+    text = line.decode(errors="replace").rstrip("\r").rsplit("\r", 1)[-1]
+    if len(text) > MAX_LINE_LENGTH:
+        return text[:MAX_LINE_LENGTH] + "..."
+
+    return text
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import dataclasses
+import re
+import shlex
+from pathlib import Path
+
+from .entry_point import EntryPoint, get_entry_points
+from .project import SOURCE_ID_KEY
+
+NAMESPACE_SEPARATOR = "/"
+DEFAULT_ROOT = "root"
+# The entry point `mlflow run` runs when none is given
+MLFLOW_DEFAULT_ENTRY_POINT = "main"
+
+_MLFLOWER_COMMAND = re.compile(
+    r"^\s*(?:python[\d.]*\s+-m\s+mlflower|mlflower)(?:\s+run)?(?P<args>(?:\s.*)?)$"
+)
+_ENTRY_POINT_OPTIONS = ("-e", "--entry-point")
+
+
+def get_nested_workflow(entry_point: EntryPoint) -> tuple[str, str] | None:
+    if entry_point.command is None or entry_point.source is None:
+        return None
+
+    match = _MLFLOWER_COMMAND.match(entry_point.command)
+    if match is None:
+        return None
+
+    parsed = _parse_args(match["args"], entry_point.entry)
+    if parsed is None:
+        return None
+
+    uri, root = parsed
+    path = Path(entry_point.source, uri)
+    if "{" in uri or "{" in root or not path.is_dir():
+        return None
+
+    return path.resolve().as_posix(), root
+
+
+def get_root_entry_point(
+    entry_points: dict[str, EntryPoint],
+    project_uri: str,
+    entry_point: str | None = None,
+) -> str:
+    # The "root" entry point by default. Projects written for `mlflow run` may have none,
+    # and a "main" entry point running their workflow: the workflow is rooted there.
+    if entry_point is not None:
+        return entry_point
+
+    main = entry_points.get(MLFLOW_DEFAULT_ENTRY_POINT)
+    if DEFAULT_ROOT not in entry_points and main is not None:
+        own_workflow = (_resolve(project_uri), MLFLOW_DEFAULT_ENTRY_POINT)
+        if get_nested_workflow(main) == own_workflow:
+            return MLFLOW_DEFAULT_ENTRY_POINT
+
+    return DEFAULT_ROOT
+
+
+def _parse_args(args: str, root: str) -> tuple[str, str] | None:
+    uri = "."
+    try:
+        args = iter(shlex.split(args))
+    except ValueError:
+        return None
+
+    for arg in args:
+        if arg in _ENTRY_POINT_OPTIONS:
+            root = next(args, root)
+        elif arg.startswith("--entry-point="):
+            root = arg.split("=", 1)[1]
+        elif arg.startswith("-") or uri != ".":
+            # Any other option may change how the workflow runs: keep it in its own process
+            return None
+        else:
+            uri = arg
+
+    return uri, root
+
+
+def expand_nested_workflows(
+    entry_points: dict[str, EntryPoint],
+    root: str | None = None,
+    project_uri: str | None = None,
+    ancestors: frozenset[tuple[str, str]] = frozenset(),
+) -> dict[str, EntryPoint]:
+    if project_uri is not None:
+        # The workflow being expanded is the outermost of its ancestors
+        ancestors |= {(_resolve(project_uri), root)}
+
+    expanded = {}
+    for key, entry_point in entry_points.items():
+        nested = None if key == root else get_nested_workflow(entry_point)
+        if nested is None or nested in ancestors:
+            # Workflows running themselves are left to their own process
+            expanded[key] = entry_point
+            continue
+
+        uri, nested_root = nested
+        nested_entry_points = expand_nested_workflows(
+            get_entry_points(uri), nested_root, ancestors=ancestors | {nested}
+        )
+        nested_entry_points.pop(nested_root, None)
+
+        expanded[key] = dataclasses.replace(entry_point, workflow=True)
+        for nested_key, nested_entry_point in nested_entry_points.items():
+            expanded[_rename(nested_key, key, nested_root)] = _namespace(
+                nested_entry_point, key, nested_root
+            )
+
+    _wait_for_members(expanded)
+    return expanded
+
+
+def _wait_for_members(entry_points: dict[str, EntryPoint]) -> None:
+    # Steps depending on a nested workflow wait for all of its steps
+    for key, entry_point in entry_points.items():
+        for dependency in list(entry_point.depends_on):
+            if dependency not in entry_points or not entry_points[dependency].workflow:
+                continue
+
+            if not key.startswith(dependency + NAMESPACE_SEPARATOR):
+                entry_point.depends_on.update(get_members(entry_points, dependency))
+
+
+def get_members(entry_points: dict[str, EntryPoint], workflow_key: str) -> set[str]:
+    prefix = workflow_key + NAMESPACE_SEPARATOR
+    return {key for key in entry_points if key.startswith(prefix)}
+
+
+def _namespace(entry_point: EntryPoint, namespace: str, root: str) -> EntryPoint:
+    workflow_parameters = {
+        key: {**param, SOURCE_ID_KEY: _rename(param[SOURCE_ID_KEY], namespace, root)}
+        for key, param in entry_point.workflow_parameters.items()
+    }
+    depends_on = {_rename(key, namespace, root) for key in entry_point.depends_on}
+
+    return dataclasses.replace(
+        entry_point,
+        workflow_parameters=workflow_parameters,
+        depends_on={*depends_on, namespace},
+        parent=(
+            _rename(entry_point.parent, namespace, root)
+            if entry_point.parent
+            else namespace
+        ),
+    )
+
+
+def _resolve(uri: str) -> str:
+    path = Path(uri)
+    return path.resolve().as_posix() if path.is_dir() else uri
+
+
+def _rename(key: str, namespace: str, root: str) -> str:
+    if key == root:
+        return namespace
+
+    return f"{namespace}{NAMESPACE_SEPARATOR}{key}"
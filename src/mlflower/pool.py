@@ -0,0 +1,525 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from mlflow.entities import RunStatus
+from mlflow.projects import SubmittedRun
+
+from .logs import LogMultiplexer, StepLog, redirect_output
+from .settings import get_cache_dir
+from .tracking import terminate_run
+
+_logger = logging.getLogger(__name__)
+
+POOL_BACKEND = "pool"
+MLFLOWER_POOL_QUEUE = "MLFLOWER_POOL_QUEUE"
+
+# Workers renew their leases on every heartbeat: a worker silent for a whole lease is
+# considered dead, and its steps go back to the queue
+HEARTBEAT_INTERVAL = 5.0
+LEASE_DURATION = 30.0
+MAX_ATTEMPTS = 3
+# How long a step waits for a worker that ran one of its upstream steps, before any
+# worker can take it
+LOCALITY_WAIT = 10.0
+POLL_INTERVAL = 1.0
+
+SCHEDULED = RunStatus.to_string(RunStatus.SCHEDULED)
+RUNNING = RunStatus.to_string(RunStatus.RUNNING)
+FINISHED = RunStatus.to_string(RunStatus.FINISHED)
+FAILED = RunStatus.to_string(RunStatus.FAILED)
+KILLED = RunStatus.to_string(RunStatus.KILLED)
+
+# Arguments of `mlflow.run` that workers use as is
+WORKER_RUN_ARGS = ("env_manager", "storage_dir", "docker_args", "build_image")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    run_id TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    entry_point TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    run_args TEXT NOT NULL,
+    preferred TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    queued_at REAL NOT NULL,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, queued_at);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    slots INTEGER NOT NULL,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class Task:
+    run_id: str
+    source: str
+    entry_point: str
+    parameters: dict[str, Any]
+    run_args: dict[str, Any]
+
+
+# Steps waiting for, or running on, workers. Every process opens its own connections to
+# the same SQLite database: claims are transactions, so a step goes to a single worker.
+# The database keeps a rollback journal: WAL needs memory shared by all processes, so a
+# single host. Across hosts, the shared filesystem must support file locks (e.g. NFSv4).
+class WorkQueue:
+    def __init__(self, path: str | Path | None = None):
+        path = path or os.environ.get(MLFLOWER_POOL_QUEUE)
+        self.path = Path(path) if path else get_cache_dir("pool") / "queue.db"
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode = DELETE")
+            conn.executescript(_SCHEMA)
+
+    def put(self, task: Task, preferred: Iterable[str] = ()) -> None:
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO tasks (run_id, source, entry_point, parameters, run_args,"
+                " preferred, state, queued_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    task.run_id,
+                    task.source,
+                    task.entry_point,
+                    json.dumps(task.parameters),
+                    json.dumps(task.run_args),
+                    json.dumps(sorted(set(preferred))),
+                    SCHEDULED,
+                    time.time(),
+                ),
+            )
+
+    def claim(self, worker_id: str) -> Task | None:
+        with self._transaction() as conn:
+            now = time.time()
+            ended = self._expire(conn, now)
+            alive = {
+                row[0]
+                for row in conn.execute(
+                    "SELECT id FROM workers WHERE heartbeat_at >= ?",
+                    (now - LEASE_DURATION,),
+                )
+            }
+            run_id = _choose(
+                conn.execute(
+                    "SELECT run_id, preferred, queued_at FROM tasks WHERE state = ?"
+                    " ORDER BY queued_at",
+                    (SCHEDULED,),
+                ),
+                worker_id,
+                alive,
+                now,
+            )
+            if run_id is not None:
+                conn.execute(
+                    "UPDATE tasks SET state = ?, worker = ?, attempts = attempts + 1,"
+                    " lease_expires_at = ? WHERE run_id = ?",
+                    (RUNNING, worker_id, now + LEASE_DURATION, run_id),
+                )
+                row = conn.execute(
+                    "SELECT run_id, source, entry_point, parameters, run_args"
+                    " FROM tasks WHERE run_id = ?",
+                    (run_id,),
+                ).fetchone()
+
+        for ended_run_id, state in ended:
+            terminate_run(ended_run_id, state)
+        if run_id is None:
+            return None
+
+        return Task(row[0], row[1], row[2], json.loads(row[3]), json.loads(row[4]))
+
+    def heartbeat(self, worker_id: str, slots: int, run_ids: Iterable[str]) -> set[str]:
+        # Renews the worker's leases, and returns the steps it must stop: cancelled
+        # ones, and the ones handed to another worker after its lease expired
+        run_ids = list(run_ids)
+        with self._transaction() as conn:
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (id, host, slots, heartbeat_at)"
+                " VALUES (?, ?, ?, ?)",
+                (worker_id, socket.gethostname(), slots, now),
+            )
+            if not run_ids:
+                return set()
+
+            conn.executemany(
+                "UPDATE tasks SET lease_expires_at = ? WHERE run_id = ? AND worker = ?"
+                " AND state = ?",
+                [
+                    (now + LEASE_DURATION, run_id, worker_id, RUNNING)
+                    for run_id in run_ids
+                ],
+            )
+            owned = {
+                run_id
+                for run_id in run_ids
+                if conn.execute(
+                    "SELECT 1 FROM tasks WHERE run_id = ? AND worker = ? AND state = ?"
+                    " AND cancel_requested = 0",
+                    (run_id, worker_id, RUNNING),
+                ).fetchone()
+            }
+
+        return set(run_ids) - owned
+
+    def finish(self, worker_id: str, run_id: str, state: str) -> None:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET state = ?, lease_expires_at = NULL"
+                " WHERE run_id = ? AND worker = ? AND state = ?",
+                (state, run_id, worker_id, RUNNING),
+            )
+        if cursor.rowcount:
+            terminate_run(run_id, state)
+
+    def release(self, worker_id: str, run_ids: Iterable[str] = ()) -> None:
+        # A worker shutting down gives its steps back, without counting an attempt
+        with self._transaction() as conn:
+            for run_id in run_ids:
+                conn.execute(
+                    "UPDATE tasks SET state = ?, worker = NULL, attempts = attempts - 1,"
+                    " lease_expires_at = NULL WHERE run_id = ? AND worker = ?"
+                    " AND state = ?",
+                    (SCHEDULED, run_id, worker_id, RUNNING),
+                )
+            conn.execute("DELETE FROM workers WHERE id = ?", (worker_id,))
+
+    def cancel(self, run_id: str) -> None:
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE tasks SET state = ? WHERE run_id = ? AND state = ?",
+                (KILLED, run_id, SCHEDULED),
+            )
+            conn.execute(
+                "UPDATE tasks SET cancel_requested = 1 WHERE run_id = ?", (run_id,)
+            )
+        if cursor.rowcount:
+            terminate_run(run_id, KILLED)
+
+    def get_state(self, run_id: str) -> str:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT state, lease_expires_at FROM tasks WHERE run_id = ?", (run_id,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(run_id)
+
+        state, lease_expires_at = row
+        if state == RUNNING and lease_expires_at < time.time():
+            # Leases also expire when no worker is left to claim steps
+            self.expire()
+            return self.get_state(run_id)
+
+        return state
+
+    def get_workers(self, run_ids: Iterable[str]) -> set[str]:
+        with self._connect() as conn:
+            rows = [
+                conn.execute(
+                    "SELECT worker FROM tasks WHERE run_id = ?", (run_id,)
+                ).fetchone()
+                for run_id in run_ids
+            ]
+
+        return {row[0] for row in rows if row is not None and row[0] is not None}
+
+    def expire(self) -> None:
+        with self._transaction() as conn:
+            ended = self._expire(conn, time.time())
+        for run_id, state in ended:
+            terminate_run(run_id, state)
+
+    def _expire(self, conn: sqlite3.Connection, now: float) -> list[tuple[str, str]]:
+        # Steps of dead workers run again elsewhere, unless cancelled or out of attempts
+        expired = conn.execute(
+            "SELECT run_id, attempts, cancel_requested FROM tasks"
+            " WHERE state = ? AND lease_expires_at < ?",
+            (RUNNING, now),
+        ).fetchall()
+        ended = []
+        for run_id, attempts, cancel_requested in expired:
+            if cancel_requested or attempts >= MAX_ATTEMPTS:
+                state = KILLED if cancel_requested else FAILED
+                ended.append((run_id, state))
+            else:
+                state = SCHEDULED
+            _logger.warning("Lease of step run %s expired: %s", run_id, state)
+            conn.execute(
+                "UPDATE tasks SET state = ?, worker = NULL, lease_expires_at = NULL"
+                " WHERE run_id = ?",
+                (state, run_id),
+            )
+
+        return ended
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+
+class PooledSubmittedRun(SubmittedRun):
+    # Completion is polled from the queue, which is cheap
+    max_poll_interval = POLL_INTERVAL
+
+    def __init__(self, queue: WorkQueue, run_id: str):
+        self.queue = queue
+        self._run_id = run_id
+
+    @property
+    def run_id(self) -> str:
+        return self._run_id
+
+    def wait(self) -> bool:
+        while not RunStatus.is_terminated(self.get_status()):
+            time.sleep(POLL_INTERVAL)
+
+        return self.get_status() == RunStatus.FINISHED
+
+    def get_status(self) -> RunStatus:
+        return RunStatus.from_string(self.queue.get_state(self._run_id))
+
+    def cancel(self) -> None:
+        # Waits for the worker to stop the step, or for its lease to expire
+        self.queue.cancel(self._run_id)
+        deadline = time.monotonic() + HEARTBEAT_INTERVAL + LEASE_DURATION
+        while not RunStatus.is_terminated(self.get_status()):
+            if time.monotonic() >= deadline:
+                _logger.warning("Step run %s didn't stop in time", self._run_id)
+                return
+            time.sleep(POLL_INTERVAL)
+
+
+def get_work_queue(backend_config: str | dict | None = None) -> WorkQueue:
+    # `--backend-config` may name the queue: {"queue": "/shared/mlflower/queue.db"}
+    if isinstance(backend_config, str):
+        if backend_config.endswith(".json"):
+            backend_config = Path(backend_config).read_text()
+        backend_config = json.loads(backend_config)
+
+    return WorkQueue((backend_config or {}).get("queue"))
+
+
+def submit(
+    source: str,
+    entry_point: str,
+    parameters: dict[str, Any],
+    run_args: dict[str, Any],
+    upstream_run_ids: Iterable[str] = (),
+) -> PooledSubmittedRun:
+    from mlflow import MlflowClient
+    from mlflow.projects import _resolve_experiment_id
+    from mlflow.projects.utils import _create_run
+    from mlflow.utils.mlflow_tags import MLFLOW_PROJECT_BACKEND, MLFLOW_RUN_NAME
+
+    # The run is created here, under the workflow's run, and workers run the step in it
+    queue = get_work_queue(run_args.get("backend_config"))
+    experiment_id = _resolve_experiment_id(experiment_id=run_args.get("experiment_id"))
+    run = _create_run(source, experiment_id, source, None, entry_point, parameters)
+    run_id = run.info.run_id
+    client = MlflowClient()
+    client.set_tag(run_id, MLFLOW_PROJECT_BACKEND, POOL_BACKEND)
+    if run_args.get("run_name"):
+        client.set_tag(run_id, MLFLOW_RUN_NAME, run_args["run_name"])
+
+    worker_args = {key: run_args[key] for key in WORKER_RUN_ARGS if key in run_args}
+    worker_args["experiment_id"] = experiment_id
+    queue.put(
+        Task(run_id, source, entry_point, parameters, worker_args),
+        preferred=queue.get_workers(upstream_run_ids),
+    )
+
+    submitted_run = PooledSubmittedRun(queue, run_id)
+    if run_args.get("synchronous"):
+        submitted_run.wait()
+
+    return submitted_run
+
+
+# Runs up to `slots` steps at once, taken from the queue. Heartbeats have their own
+# thread, so that slow environment builds don't let leases expire.
+class Worker:
+    def __init__(
+        self,
+        queue: WorkQueue,
+        slots: int = 1,
+        worker_id: str | None = None,
+        capture_logs: bool = True,
+    ):
+        self.queue = queue
+        self.slots = slots
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.logs = LogMultiplexer() if capture_logs else None
+        self._step_logs: dict[str, StepLog] = {}
+        self._running: dict[str, SubmittedRun | None] = {}
+        self._revoked: set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self) -> None:
+        _logger.info("Worker %s started with %s slots", self.id, self.slots)
+        self._heartbeat()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop, name="mlflower-heartbeat", daemon=True
+        )
+        heartbeat.start()
+        try:
+            while not self._stop.is_set():
+                self._reap()
+                self._fill()
+                self._stop.wait(POLL_INTERVAL)
+        finally:
+            self._stop.set()
+            self._shutdown()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _fill(self) -> None:
+        while len(self._running) < self.slots:
+            task = self.queue.claim(self.id)
+            if task is None:
+                return
+
+            with self._lock:
+                self._running[task.run_id] = None
+            _logger.info("Running %s in run %s", task.entry_point, task.run_id)
+            try:
+                submitted_run = _start(task, self._open_log(task))
+            except Exception:
+                _logger.exception("Failed to start run %s", task.run_id)
+                with self._lock:
+                    del self._running[task.run_id]
+                self._close_log(task.run_id, succeeded=False)
+                self.queue.finish(self.id, task.run_id, FAILED)
+                continue
+
+            with self._lock:
+                self._running[task.run_id] = submitted_run
+
+    def _reap(self) -> None:
+        with self._lock:
+            running = [(key, run) for key, run in self._running.items() if run]
+            revoked = self._revoked & {run_id for run_id, _ in running}
+
+        for run_id, submitted_run in running:
+            if run_id in revoked:
+                submitted_run.cancel()
+            elif submitted_run.command_proc.poll() is None:
+                continue
+
+            succeeded = submitted_run.wait()
+            with self._lock:
+                del self._running[run_id]
+                self._revoked.discard(run_id)
+            self._close_log(run_id, succeeded or run_id in revoked)
+            state = FINISHED if succeeded else (KILLED if run_id in revoked else FAILED)
+            self.queue.finish(self.id, run_id, state)
+
+    def _open_log(self, task: Task) -> Path | None:
+        if self.logs is None:
+            return None
+
+        step_log = self._step_logs[task.run_id] = self.logs.open(task.entry_point)
+        step_log.run_id = task.run_id
+        return step_log.path
+
+    def _close_log(self, run_id: str, succeeded: bool) -> None:
+        step_log = self._step_logs.pop(run_id, None)
+        if step_log is None:
+            return
+
+        tail = self.logs.close(step_log)
+        if not succeeded and tail:
+            _logger.error(
+                "Run %s failed, last lines of its output:\n%s", run_id, "\n".join(tail)
+            )
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self._heartbeat()
+            except sqlite3.Error:
+                _logger.exception("Heartbeat failed")
+
+    def _heartbeat(self) -> None:
+        with self._lock:
+            run_ids = list(self._running)
+        revoked = self.queue.heartbeat(self.id, self.slots, run_ids)
+        with self._lock:
+            self._revoked |= revoked
+
+    def _shutdown(self) -> None:
+        # Running steps are cancelled and go back to the queue for other workers
+        with self._lock:
+            running = dict(self._running)
+        for submitted_run in running.values():
+            if submitted_run is not None:
+                submitted_run.cancel()
+        self.queue.release(self.id, running)
+        if self.logs is not None:
+            self.logs.shutdown()
+        _logger.info("Worker %s stopped", self.id)
+
+
+def _start(task: Task, log_path: Path | None = None) -> SubmittedRun:
+    import mlflow
+
+    with redirect_output(log_path):
+        return mlflow.run(
+            task.source,
+            task.entry_point,
+            parameters=task.parameters,
+            backend="local",
+            run_id=task.run_id,
+            synchronous=False,
+            **task.run_args,
+        )
+
+
+def _choose(
+    tasks: Iterable[tuple[str, str, float]], worker_id: str, alive: set[str], now: float
+) -> str | None:
+    # Oldest step that prefers this worker first. Other steps are only taken once their
+    # preferred workers had time to take them, or when none of them is alive.
+    fallback = None
+    for run_id, preferred_json, queued_at in tasks:
+        preferred = set(json.loads(preferred_json)) & alive
+        if worker_id in preferred:
+            return run_id
+        if fallback is None and (not preferred or now - queued_at >= LOCALITY_WAIT):
+            fallback = run_id
+
+    return fallback
@@ -1,18 +1,57 @@
 from __future__ import annotations
 
+import contextlib
+import copy
+import hashlib
+import itertools
+import json
+import os
 from pathlib import Path
 from typing import Any
 
 import yaml
 
+from .settings import get_cache_dir
+from .sources import SourceCache, is_pinned, is_remote_source
+
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 ENTRY_POINTS_KEY = "entry_points"
 
 PROJECT_KEY = "source"
+VERSION_KEY = "version"
 ENTRY_KEY = "entry"
 COMMAND_KEY = "command"
 DEPENDS_ON_KEY = "depends_on"
 PARAMS_KEY = "parameters"
 PARAM_SOURCE_KEY = "workflow_parameters"
+RESOURCES_KEY = "resources"
+PRIORITY_KEY = "priority"
+CACHE_KEY = "cache"
+FOREACH_KEY = "foreach"
+MATRIX_KEY = "matrix"
+MAX_PARALLEL_KEY = "max_parallel"
+RETRIES_KEY = "retries"
+RETRY_BACKOFF_KEY = "retry_backoff"
+TIMEOUT_KEY = "timeout"
+WARM_KEY = "warm"
+WORKFLOW_KEYS = (
+    RESOURCES_KEY,
+    PRIORITY_KEY,
+    CACHE_KEY,
+    FOREACH_KEY,
+    MATRIX_KEY,
+    MAX_PARALLEL_KEY,
+    RETRIES_KEY,
+    RETRY_BACKOFF_KEY,
+    TIMEOUT_KEY,
+    WARM_KEY,
+)
+
+WORKFLOW_KEY = "workflow"
+PARENT_KEY = "parent"
+SWEEP_KEY = "sweep"
+SHARD_SEPARATOR = "/"
 
 PARAM_TYPE_KEY = "type"
 PARAM_DEFAULT_KEY = "default"
@@ -20,37 +59,110 @@ PARAM_DEFAULT_KEY = "default"
 SOURCE_TYPE_KEY = "type"
 SOURCE_ID_KEY = "id"
 SOURCE_CONTENT_KEY = "key"
+SOURCE_COLLECT_KEY = "of"
+SOURCE_TYPES = ("artifact", "parameter", "collect", "stream")
 
 MLFLOWER_FILENAME = "MLFlower"
 MLRPOJECT_FILENAME = "MLProject"
+PROJECT_FILENAMES = (MLFLOWER_FILENAME, MLRPOJECT_FILENAME)
+
+PLAN_CACHE_VERSION = 2
+
+
+class ProjectLoader:
+    def __init__(self, sources: SourceCache | None = None):
+        self._files: dict[str, Path | None] = {}
+        self._projects: dict[Path, dict[str, Any]] = {}
+        self._sources = sources
+        self.remote_sources: dict[str, str | None] = {}
+
+    @property
+    def files(self) -> dict[str, Path | None]:
+        return self._files
+
+    def find_project_file(self, path: str | Path) -> Path | None:
+        path = Path(path).as_posix()
+        if path not in self._files:
+            self._files[path] = _get_file(path, *PROJECT_FILENAMES)
+
+        return self._files[path]
+
+    def load_project(self, path: str | Path) -> dict[str, Any]:
+        project_path = self.find_project_file(path)
+
+        if project_path is None:
+            return {}
+
+        if project_path not in self._projects:
+            content = project_path.read_text()
+            project = yaml.load(content, SafeLoader)  # noqa: S506
+            self._projects[project_path] = project or {}
+
+        # Entries get consolidated in place: callers always get their own copy
+        return copy.deepcopy(self._projects[project_path])
+
+    def materialize(self, source: str, version: str | None = None) -> str:
+        if self._sources is None:
+            self._sources = SourceCache()
 
+        self.remote_sources[source] = version
+        return self._sources.materialize(source, version)
 
-def get_raw_entry_points(path: str, entry_key: str | None = None) -> dict[str, Any]:
-    project = load_project(path)
+
+def get_raw_entry_points(
+    path: str, entry_key: str | None = None, loader: ProjectLoader | None = None
+) -> dict[str, Any]:
+    loader = loader or ProjectLoader()
+    project = loader.load_project(path)
     steps = project.get(ENTRY_POINTS_KEY, {})
 
     if entry_key is not None:
-        return _load_entry(steps[entry_key], entry_key, path)
+        return _load_entry(steps[entry_key], entry_key, path, loader)
 
     return _consolidate_dependency(
-        {key: _load_entry(entry_point, key, path) for key, entry_point in steps.items()}
+        _expand_sweeps(
+            {
+                key: _load_entry(entry_point, key, path, loader)
+                for key, entry_point in steps.items()
+            }
+        )
     )
 
 
-def load_project(path: str | Path) -> dict[str, Any]:
-    project_path = _get_file(path, MLFLOWER_FILENAME, MLRPOJECT_FILENAME)
+def compile_entry_points(path: str | Path, use_cache: bool = True) -> dict[str, Any]:
+    path = Path(path).resolve().as_posix()
+    if not use_cache:
+        return get_raw_entry_points(path)
 
-    if project_path is None:
-        return {}
+    plan_path = get_cache_dir("plans") / (
+        hashlib.sha256(path.encode("utf-8")).hexdigest() + ".json"
+    )
+    entry_points = _read_plan(plan_path)
+    if entry_points is not None:
+        return entry_points
 
-    content = project_path.read_text()
-    return yaml.load(content, yaml.SafeLoader)
+    loader = ProjectLoader()
+    entry_points = get_raw_entry_points(path, loader=loader)
+    if not all(map(is_pinned, loader.remote_sources.values())):
+        # Branches and tags may move: they are resolved again on each run
+        return entry_points
 
+    with contextlib.suppress(OSError, TypeError):
+        # Plans holding non-JSON YAML content (e.g. dates) are simply not cached
+        _write_plan(plan_path, entry_points, loader)
 
-def _load_entry(entry_point: dict[str], key: str, path: str) -> dict[str, Any]:
-    source = entry_point.get(PROJECT_KEY, None)
+    return entry_points
+
+
+def load_project(path: str | Path) -> dict[str, Any]:
+    return ProjectLoader().load_project(path)
+
+
+def _load_entry(
+    entry_point: dict[str], key: str, path: str, loader: ProjectLoader
+) -> dict[str, Any]:
+    source = entry_point.get(PROJECT_KEY)
     entry = entry_point.setdefault(ENTRY_KEY, key)
-    entry_point.pop(COMMAND_KEY, None)
     entry_point[PARAMS_KEY] = _get_consolidate_params(entry_point)
 
     # Consolidate depend_on
@@ -58,14 +170,19 @@ def _load_entry(entry_point: dict[str], key: str, path: str) -> dict[str, Any]:
     if isinstance(depends_on, str):
         entry_point[DEPENDS_ON_KEY] = {depends_on}
 
+    version = entry_point.pop(VERSION_KEY, None)
     if source is None:
         entry_point[PROJECT_KEY] = path
         return entry_point
 
-    if not Path(source).is_absolute():
+    if is_remote_source(source):
+        source = loader.materialize(source, version)
+    elif version is not None:
+        raise ValueError(f"A version can only be set for remote sources: {key}")
+    elif not Path(source).is_absolute():
         source = Path(path).joinpath(source).resolve().as_posix()
 
-    new_entry_point = get_raw_entry_points(source, entry)
+    new_entry_point = get_raw_entry_points(source, entry, loader)
     new_entry_point.setdefault(PARAMS_KEY, {}).update(entry_point.get(PARAMS_KEY, {}))
     new_entry_point.setdefault(PARAM_SOURCE_KEY, {}).update(
         entry_point.get(PARAM_SOURCE_KEY, {})
@@ -74,6 +191,10 @@ def _load_entry(entry_point: dict[str], key: str, path: str) -> dict[str, Any]:
         entry_point.get(DEPENDS_ON_KEY, set())
     )
 
+    for workflow_key in WORKFLOW_KEYS:
+        if workflow_key in entry_point:
+            new_entry_point[workflow_key] = entry_point[workflow_key]
+
     new_entry_point[PROJECT_KEY] = source
     new_entry_point[ENTRY_KEY] = entry
 
@@ -93,21 +214,150 @@ def _get_consolidate_params(
     return entry_point_params
 
 
+def _expand_sweeps(entry_points: dict[str]) -> dict[str]:
+    expanded = {}
+    for key, entry_point in entry_points.items():
+        sweep = _get_sweep(
+            entry_point.pop(FOREACH_KEY, None), entry_point.pop(MATRIX_KEY, None)
+        )
+        if sweep is None:
+            expanded[key] = entry_point
+            continue
+
+        # The sweep itself becomes a group run, parent of one run per shard
+        max_parallel = entry_point.pop(MAX_PARALLEL_KEY, None)
+        expanded[key] = {
+            **entry_point,
+            COMMAND_KEY: None,
+            WORKFLOW_KEY: True,
+            MAX_PARALLEL_KEY: max_parallel,
+        }
+        for i, values in enumerate(sweep):
+            shard = copy.deepcopy(entry_point)
+            shard[DEPENDS_ON_KEY].add(key)
+            shard[PARENT_KEY] = key
+            shard[SWEEP_KEY] = values
+            expanded[f"{key}{SHARD_SEPARATOR}{i}"] = shard
+
+    return expanded
+
+
+def _get_sweep(
+    foreach: list[dict[str]] | None, matrix: dict[str, list] | None
+) -> list[dict[str]] | None:
+    if foreach is None and matrix is None:
+        return None
+
+    matrix = {
+        name: values if isinstance(values, list) else [values]
+        for name, values in (matrix or {}).items()
+    }
+    combinations = [
+        dict(zip(matrix, values)) for values in itertools.product(*matrix.values())
+    ]
+    return [
+        {**item, **combination}
+        for item in (foreach if foreach is not None else [{}])
+        for combination in combinations
+    ]
+
+
 def _consolidate_dependency(entry_points: dict[str]) -> dict[str]:
+    shards = {}
+    for key, entry_point in entry_points.items():
+        if SWEEP_KEY in entry_point:
+            shards.setdefault(entry_point[PARENT_KEY], set()).add(key)
+
     for entry_point in entry_points.values():
         depend_on = entry_point.setdefault(DEPENDS_ON_KEY, set())
         for param in entry_point.get(PARAM_SOURCE_KEY, {}).values():
             param_type = param.get(SOURCE_TYPE_KEY, "parameter")
-            if param_type not in ("artifact", "parameter"):
+            if param_type not in SOURCE_TYPES:
                 continue
             depend_on.add(param[SOURCE_ID_KEY])
 
+        # Steps depending on a sweep wait for all of its shards
+        for dependency in depend_on & shards.keys():
+            if entry_point.get(PARENT_KEY) != dependency:
+                depend_on.update(shards[dependency])
+
+    return entry_points
+
+
+def _read_plan(plan_path: Path) -> dict[str, Any] | None:
+    try:
+        plan = json.loads(plan_path.read_text())
+    except (OSError, ValueError):
+        return None
+
+    if plan.get("version") != PLAN_CACHE_VERSION:
+        return None
+
+    loader = ProjectLoader()
+    sources = SourceCache()
+    for directory, file_name in plan["directories"].items():
+        sources.touch(directory)
+        try:
+            project_path = loader.find_project_file(directory)
+        except OSError:
+            # e.g. an evicted checkout of a remote source: the plan is compiled again
+            return None
+
+        if (project_path.name if project_path else None) != file_name:
+            return None
+
+    if not all(_is_unchanged(*file) for file in plan["files"]):
+        return None
+
+    entry_points = plan["entry_points"]
+    for entry_point in entry_points.values():
+        entry_point[DEPENDS_ON_KEY] = set(entry_point[DEPENDS_ON_KEY])
+
     return entry_points
 
 
-def _get_file(path: str | Path, *alternatives: str) -> Path:
-    file_name, *alternatives = alternatives
+def _write_plan(
+    plan_path: Path, entry_points: dict[str, Any], loader: ProjectLoader
+) -> None:
+    project_files = [p for p in loader.files.values() if p is not None]
+    plan = {
+        "version": PLAN_CACHE_VERSION,
+        "directories": {
+            directory: path.name if path else None
+            for directory, path in loader.files.items()
+        },
+        "files": [_get_signature(path) for path in project_files],
+        "entry_points": entry_points,
+    }
+
+    content = json.dumps(plan, default=sorted)
+
+    # Write then rename, so concurrent invocations never read a partial plan
+    tmp_path = plan_path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_text(content)
+    tmp_path.replace(plan_path)
+
+
+def _get_signature(path: Path) -> tuple[str, int, int, str]:
+    stat = path.stat()
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    return path.as_posix(), stat.st_mtime_ns, stat.st_size, digest
+
+
+def _is_unchanged(path: str, mtime_ns: int, size: int, digest: str) -> bool:
+    try:
+        stat = Path(path).stat()
+    except OSError:
+        return False
+
+    if stat.st_mtime_ns == mtime_ns and stat.st_size == size:
+        return True
+
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest() == digest
+
+
+def _get_file(path: str | Path, *alternatives: str) -> Path | None:
+    files = {p.name.upper(): p for p in Path(path).iterdir()}
     return next(
-        (p for p in Path(path).iterdir() if p.name.upper() == file_name.upper()),
-        _get_file(path, *alternatives) if alternatives else None,
+        (files[name.upper()] for name in alternatives if name.upper() in files), None
     )
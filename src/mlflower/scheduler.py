@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import contextlib
+import heapq
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Mapping
+
+from .graph import bottom_levels
+from .sweep import get_sweep_limits
+
+if TYPE_CHECKING:
+    from .entry_point import EntryPoint
+
+FAIL_FAST = "fail-fast"
+CONTINUE_INDEPENDENT = "continue-independent"
+BEST_EFFORT = "best-effort"
+FAILURE_POLICIES = (FAIL_FAST, CONTINUE_INDEPENDENT, BEST_EFFORT)
+
+MEMORY_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+_MEMORY_PATTERN = re.compile(r"^\s*([\d.]+)\s*([KMGT]?)i?B?\s*$", re.IGNORECASE)
+
+
+# What steps may run at once: resources they ask for out of a capacity, a number of
+# steps, and slots shared with other workflows
+@dataclass
+class Limits:
+    demands: Mapping[str, Mapping[str, float]] = field(default_factory=dict)
+    capacity: Mapping[str, float] = field(default_factory=dict)
+    max_parallel: int | None = None
+    budget: BudgetShare | None = None
+
+
+class ReadyQueue:
+    def __init__(
+        self,
+        graph: Mapping[str, Iterable[str]],
+        done: Iterable[str] = (),
+        *,
+        priorities: Mapping[str, int] | None = None,
+        limits: Limits | None = None,
+        streams: Mapping[str, Iterable[str]] | None = None,
+    ):
+        done = set(done)
+        self._waiting_on = {
+            key: {dep for dep in deps if dep in graph and dep not in done}
+            for key, deps in graph.items()
+            if key not in done
+        }
+
+        self._dependents: dict[str, set[str]] = {}
+        for key, deps in self._waiting_on.items():
+            for dep in deps:
+                self._dependents.setdefault(dep, set()).add(key)
+
+        levels = bottom_levels(self._waiting_on)
+        priorities = priorities or {}
+        order = {key: i for i, key in enumerate(graph)}
+        self._rank = {
+            key: (-priorities.get(key, 0), -levels[key], order[key])
+            for key in self._waiting_on
+        }
+
+        limits = limits or Limits()
+        self._demands = limits.demands
+        self._available = dict(limits.capacity)
+        self._max_parallel = limits.max_parallel
+        self._budget = limits.budget
+        # Steps that may start as soon as these dependencies of theirs are streaming
+        self._streams = {
+            key: set(producers) for key, producers in (streams or {}).items()
+        }
+
+        # Ready steps are kept in a heap, by rank
+        self._ready = [
+            (self._rank[key], key) for key, deps in self._waiting_on.items() if not deps
+        ]
+        heapq.heapify(self._ready)
+        # Ready steps that didn't fit, by the resource they lacked: they are only looked
+        # at again once some of it is released
+        self._parked: dict[str, list[tuple[tuple[int, int, int], str]]] = {}
+        self._running: set[str] = set()
+
+    def __bool__(self) -> bool:
+        return bool(self._waiting_on)
+
+    @property
+    def running(self) -> set[str]:
+        return self._running
+
+    @property
+    def pending(self) -> set[str]:
+        return set(self._waiting_on)
+
+    def pop_ready(self) -> list[str]:
+        if self._budget is not None:
+            self._budget.withdraw()
+
+        selected = []
+        while self._ready and not self._is_full():
+            item = heapq.heappop(self._ready)
+            resource = self._get_lacking(item[1])
+            if resource is not None:
+                heapq.heappush(self._parked.setdefault(resource, []), item)
+                continue
+
+            if self._budget is not None and not self._budget.acquire():
+                heapq.heappush(self._ready, item)
+                break
+
+            self._acquire(item[1])
+            selected.append(item[1])
+
+        return selected
+
+    def mark_done(self, key: str) -> list[str]:
+        if key in self._running:
+            self._release(key)
+        self._waiting_on.pop(key, None)
+
+        dependents = self._dependents.pop(key, ())
+        return [dependent for dependent in dependents if self._satisfy(dependent, key)]
+
+    def mark_streaming(self, key: str) -> list[str]:
+        # The running step `key` published its first partition
+        dependents = self._dependents.get(key, set())
+        streaming = {
+            dependent
+            for dependent in dependents
+            if key in self._streams.get(dependent, ())
+        }
+        dependents -= streaming
+        return [dependent for dependent in streaming if self._satisfy(dependent, key)]
+
+    def _satisfy(self, dependent: str, key: str) -> bool:
+        waiting_on = self._waiting_on.get(dependent)
+        if waiting_on is None:
+            return False
+
+        waiting_on.discard(key)
+        if waiting_on:
+            return False
+
+        heapq.heappush(self._ready, (self._rank[dependent], dependent))
+        return True
+
+    def skip(self, key: str) -> list[str]:
+        # Drops a step along with everything downstream of it
+        if key in self._running:
+            self._release(key)
+
+        skipped, stack = [], [key]
+        while stack:
+            node = stack.pop()
+            if self._waiting_on.pop(node, None) is None:
+                continue
+
+            skipped.append(node)
+            stack.extend(self._dependents.pop(node, ()))
+
+        for items in (self._ready, *self._parked.values()):
+            items[:] = [item for item in items if item[1] in self._waiting_on]
+            heapq.heapify(items)
+        return [node for node in skipped if node != key]
+
+    def _is_full(self) -> bool:
+        return bool(self._max_parallel) and len(self._running) >= self._max_parallel
+
+    def _get_lacking(self, key: str) -> str | None:
+        if not self._running:
+            # Always let one step through, even if it asks for more than the machine has
+            return None
+
+        for resource, amount in self._demands.get(key, {}).items():
+            if resource in self._available and amount > self._available[resource]:
+                return resource
+
+        return None
+
+    def _acquire(self, key: str) -> None:
+        self._running.add(key)
+        for resource, amount in self._demands.get(key, {}).items():
+            if resource in self._available:
+                self._available[resource] -= amount
+
+    def _release(self, key: str) -> None:
+        self._running.discard(key)
+        if self._budget is not None:
+            self._budget.release()
+        for resource, amount in self._demands.get(key, {}).items():
+            if resource in self._available:
+                self._available[resource] += amount
+                self._unpark(resource)
+        if not self._running:
+            for resource in list(self._parked):
+                self._unpark(resource, everything=True)
+
+    def _unpark(self, resource: str, everything: bool = False) -> None:
+        # Parked steps go back to the ready ones by rank, as long as they may fit
+        parked = self._parked.get(resource, [])
+        available = self._available[resource]
+        while parked and (everything or available >= 0):
+            item = heapq.heappop(parked)
+            available -= self._demands[item[1]][resource]
+            heapq.heappush(self._ready, item)
+
+
+# Steps of several workflows share one budget of slots. A free slot goes to the waiting
+# workflow with the highest priority, then to the group (e.g. the experiment) running the
+# fewest steps, so that a busy group can't starve the others, then first come first served.
+class FairShareBudget:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._running: Counter[str] = Counter()
+        self._waiting: dict[BudgetShare, None] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def share(
+        self,
+        group: str,
+        priority: int = 0,
+        on_release: Callable[[], None] | None = None,
+    ) -> BudgetShare:
+        return BudgetShare(self, group, priority, on_release)
+
+    def acquire(self, share: BudgetShare) -> bool:
+        with self._lock:
+            candidates = [*self._waiting, share]
+            first = min(candidates, key=lambda s: (-s.priority, self._running[s.group]))
+            if self.running >= self.capacity or first is not share:
+                self._waiting[share] = None
+                return False
+
+            self._waiting.pop(share, None)
+            self._running[share.group] += 1
+            share.running += 1
+            return True
+
+    def release(self, share: BudgetShare) -> None:
+        with self._lock:
+            self._running[share.group] -= 1
+            share.running -= 1
+            waiting = list(self._waiting)
+
+        # Waiting workflows try again, the one entitled to the slot takes it
+        for waiting_share in waiting:
+            if waiting_share.on_release is not None:
+                waiting_share.on_release()
+
+    def withdraw(self, share: BudgetShare) -> None:
+        with self._lock:
+            self._waiting.pop(share, None)
+
+
+class BudgetShare:
+    def __init__(
+        self,
+        budget: FairShareBudget,
+        group: str,
+        priority: int = 0,
+        on_release: Callable[[], None] | None = None,
+    ):
+        self.budget = budget
+        self.group = group
+        self.priority = priority
+        self.on_release = on_release
+        self.running = 0
+
+    def acquire(self) -> bool:
+        return self.budget.acquire(self)
+
+    def release(self) -> None:
+        self.budget.release(self)
+
+    def withdraw(self) -> None:
+        # Until the next denied `acquire`, this share isn't waiting for a slot anymore
+        self.budget.withdraw(self)
+
+    def close(self) -> None:
+        self.withdraw()
+        while self.running:
+            self.release()
+
+
+def critical_path(
+    graph: Mapping[str, Iterable[str]], spans: Mapping[str, tuple[float, float]]
+) -> list[str]:
+    if not spans:
+        return []
+
+    node = max(spans, key=lambda key: spans[key][1])
+    path = [node]
+    while True:
+        finished_deps = [dep for dep in graph.get(node, ()) if dep in spans]
+        if not finished_deps:
+            break
+
+        node = max(finished_deps, key=lambda key: spans[key][1])
+        path.append(node)
+
+    return path[::-1]
+
+
+def get_limits(
+    entry_points: Mapping[str, EntryPoint],
+    max_parallel: int | None = None,
+    budget: BudgetShare | None = None,
+) -> Limits:
+    # The resources steps ask for, out of the machine's, and the sweeps' own limits
+    sweep_demands, sweep_capacity = get_sweep_limits(entry_points)
+    return Limits(
+        demands={
+            key: {**parse_resources(ep.resources), **sweep_demands.get(key, {})}
+            for key, ep in entry_points.items()
+        },
+        capacity={**machine_capacity(), **sweep_capacity},
+        max_parallel=max_parallel,
+        budget=budget,
+    )
+
+
+def parse_resources(resources: Mapping[str, Any]) -> dict[str, float]:
+    parsed = {}
+    for resource, amount in resources.items():
+        if resource == "memory":
+            parsed[resource] = parse_memory(amount)
+        else:
+            parsed[resource] = float(amount)
+
+    return parsed
+
+
+def parse_memory(amount: str | float) -> float:
+    if isinstance(amount, (int, float)):
+        return float(amount)
+
+    match = _MEMORY_PATTERN.match(str(amount))
+    if match is None:
+        raise ValueError(f"Invalid memory amount: {amount!r}")
+
+    value, unit = match.groups()
+    return float(value) * MEMORY_UNITS[unit.upper()]
+
+
+def machine_capacity() -> dict[str, float]:
+    capacity = {"cpu": float(os.cpu_count() or 1)}
+    # sysconf is not available on Windows: memory is left unconstrained
+    with contextlib.suppress(AttributeError, ValueError, OSError):
+        capacity["memory"] = float(
+            os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        )
+
+    return capacity
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from typing import Iterable, Mapping
+
+from .entry_point import EntryPoint
+from .graph import get_ancestors, get_descendants
+from .nested import get_members
+from .project import SOURCE_ID_KEY
+from .sweep import get_shards
+
+
+def select_steps(
+    entry_points: Mapping[str, EntryPoint],
+    root: str,
+    targets: Iterable[str] = (),
+    from_steps: Iterable[str] = (),
+    exclude: Iterable[str] = (),
+) -> set[str]:
+    targets, from_steps, exclude = set(targets), set(from_steps), set(exclude)
+    unknown = (targets | from_steps | exclude) - entry_points.keys()
+    if unknown:
+        raise ValueError(f"Unknown steps: {', '.join(sorted(unknown))}")
+
+    graph = {key: entry_point.depends_on for key, entry_point in entry_points.items()}
+    selected = set(entry_points)
+    if targets:
+        # Selecting a workflow (a sweep or a nested workflow) selects all of its steps
+        targets |= _get_all_members(entry_points, targets)
+        selected = targets | get_ancestors(graph, targets)
+    if from_steps:
+        selected &= from_steps | get_descendants(graph, from_steps)
+
+    selected -= exclude | _get_all_members(entry_points, exclude)
+
+    # Steps of a workflow are started under the workflow's run
+    selected |= {
+        key
+        for key, entry_point in entry_points.items()
+        if entry_point.workflow and get_members(entry_points, key) & selected
+    }
+    selected.discard(root)
+
+    return selected
+
+
+def get_boundary(
+    entry_points: Mapping[str, EntryPoint], selected: set[str], root: str
+) -> set[str]:
+    # Steps that are not selected, but that selected steps depend on
+    return {
+        dependency
+        for key in selected
+        for dependency in entry_points[key].depends_on
+        if dependency not in selected and dependency != root
+    }
+
+
+def get_referenced(
+    entry_points: Mapping[str, EntryPoint], selected: set[str]
+) -> set[str]:
+    # Steps whose runs selected steps take parameters or artifacts from
+    referenced = set()
+    for key in selected:
+        for param in entry_points[key].workflow_parameters.values():
+            source = param[SOURCE_ID_KEY]
+            referenced.update(get_shards(entry_points, source) or [source])
+
+    return referenced
+
+
+def _get_all_members(
+    entry_points: Mapping[str, EntryPoint], keys: Iterable[str]
+) -> set[str]:
+    return {member for key in keys for member in get_members(entry_points, key)}
@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field, fields
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Mapping
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from .scheduler import BudgetShare, FairShareBudget
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5050
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+FINISHED = "FINISHED"
+FAILED = "FAILED"
+KILLED = "KILLED"
+TERMINAL_STATUSES = (FINISHED, FAILED, KILLED)
+
+DEFAULT_GROUP = "default"
+
+_JOB_PATH = re.compile(r"/workflows/(?P<id>[^/]+)")
+_CANCEL_PATH = re.compile(r"/workflows/(?P<id>[^/]+)/cancel")
+
+# Fields of a submission, and the `mlflower run` options it may set
+SUBMIT_FIELDS = {
+    "uri",
+    "entry_point",
+    "parameters",
+    "experiment_id",
+    "experiment_name",
+    "run_name",
+    "priority",
+    "run_args",
+}
+RUN_ARGS = {
+    "backend",
+    "backend_config",
+    "env_manager",
+    "storage_dir",
+    "max_parallel",
+    "on_failure",
+    "hooks",
+    "prewarm",
+    "prefetch_artifacts",
+    "warm_workers",
+    "warm_imports",
+    "warm_max_tasks",
+    "warm_max_memory",
+    "capture_logs",
+    "cache",
+    "invalidate",
+}
+
+
+@dataclass
+class Job:
+    id: str
+    uri: str
+    entry_point: str | None = None
+    parameters: dict[str, Any] = field(default_factory=dict)
+    run_args: dict[str, Any] = field(default_factory=dict)
+    experiment_id: str | None = None
+    run_name: str | None = None
+    priority: int = 0
+    status: str = QUEUED
+    run_id: str | None = None
+    error: str | None = None
+    cancel_requested: bool = False
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    ended_at: float | None = None
+    workflow: Any = field(default=None, repr=False)
+
+    @property
+    def group(self) -> str:
+        return self.experiment_id or DEFAULT_GROUP
+
+    def to_dict(self) -> dict[str, Any]:
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.repr}
+
+
+# Workflows run in threads of a single process, and steps of all workflows take slots of
+# one budget: each experiment gets its fair share of them, higher priorities first.
+# Workflows start in order of priority then submission, up to `max_workflows` at once.
+class WorkflowService:
+    def __init__(self, max_steps: int, max_workflows: int | None = None):
+        self.budget = FairShareBudget(max_steps)
+        self.max_workflows = max_workflows
+        self._jobs: dict[str, Job] = {}
+        self._queue: list[tuple[int, int, str]] = []
+        self._running: set[str] = set()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, request: Mapping[str, Any]) -> Job:
+        from .tracking import get_experiment_id
+
+        unknown = set(request) - SUBMIT_FIELDS
+        unknown |= {f"run_args.{arg}" for arg in request.get("run_args", {})} - {
+            f"run_args.{arg}" for arg in RUN_ARGS
+        }
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        if not request.get("uri"):
+            raise ValueError("Missing field: uri")
+
+        uri = request["uri"]
+        if Path(uri).exists():
+            uri = Path(uri).resolve().as_posix()
+
+        job = Job(
+            id=uuid.uuid4().hex,
+            uri=uri,
+            entry_point=request.get("entry_point"),
+            parameters=dict(request.get("parameters") or {}),
+            run_args=dict(request.get("run_args") or {}),
+            experiment_id=get_experiment_id(
+                uri, request.get("experiment_id"), request.get("experiment_name")
+            ),
+            run_name=request.get("run_name"),
+            priority=int(request.get("priority") or 0),
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            heapq.heappush(self._queue, (-job.priority, next(self._sequence), job.id))
+
+        _logger.info("Queued workflow %s (%s)", job.id, job.uri)
+        self._dispatch()
+        return job
+
+    def get(self, job_id: str) -> Job:
+        if job_id not in self._jobs:
+            raise KeyError(job_id)
+
+        return self._jobs[job_id]
+
+    def list(self) -> list[Job]:
+        return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Job:
+        job = self.get(job_id)
+        with self._lock:
+            if job.status == QUEUED:
+                job.status, job.ended_at = KILLED, time.time()
+                return job
+
+            job.cancel_requested = True
+            workflow = job.workflow
+
+        # Until its workflow exists, the job's thread cancels it itself
+        if workflow is not None and job.status == RUNNING:
+            workflow.request_cancel()
+
+        return job
+
+    def _dispatch(self) -> None:
+        started = []
+        with self._lock:
+            while self._queue and (
+                self.max_workflows is None or len(self._running) < self.max_workflows
+            ):
+                job = self._jobs[heapq.heappop(self._queue)[2]]
+                if job.status != QUEUED:
+                    continue
+
+                job.status, job.started_at = RUNNING, time.time()
+                self._running.add(job.id)
+                started.append(job)
+
+        for job in started:
+            threading.Thread(
+                target=self._run, args=(job,), name=f"mlflower-{job.id}", daemon=True
+            ).start()
+
+    def _run(self, job: Job) -> None:
+        from mlflow.entities import RunStatus
+
+        share = None
+        try:
+            share = self._start(job)
+            run_args = {**job.run_args, "experiment_id": job.experiment_id}
+            job.workflow.run({**run_args, "budget": share})
+            job.status = RunStatus.to_string(job.workflow.get_status())
+        except Exception as e:
+            _logger.exception("Workflow %s failed", job.id)
+            job.status, job.error = FAILED, str(e)
+            if job.workflow is not None:
+                job.workflow.fail()
+        finally:
+            if share is not None:
+                share.close()
+            self._end(job)
+
+    def _start(self, job: Job) -> BudgetShare:
+        from mlflow import MlflowClient
+        from mlflow.projects import _resolve_experiment_id
+        from mlflow.tracking.context import registry
+        from mlflow.utils.mlflow_tags import MLFLOW_PROJECT_ENTRY_POINT
+
+        from .tracking import update_params
+        from .workflow import Workflow
+
+        # Not mlflow's active run, which older mlflow versions share between threads:
+        # the run is passed to the workflow, which makes it the parent of its steps
+        tags = {MLFLOW_PROJECT_ENTRY_POINT: job.entry_point} if job.entry_point else {}
+        active_run = MlflowClient().create_run(
+            _resolve_experiment_id(experiment_id=job.experiment_id),
+            tags=registry.resolve_tags(tags),
+            run_name=job.run_name,
+        )
+        job.run_id = active_run.info.run_id
+        update_params(active_run, job.parameters)
+
+        workflow = Workflow.from_project_uri(job.uri, active_run, job.entry_point)
+        with self._lock:
+            job.workflow = workflow
+            cancel_requested = job.cancel_requested
+        if cancel_requested:
+            workflow.request_cancel()
+
+        return self.budget.share(job.group, job.priority, workflow.watcher.interrupt)
+
+    def _end(self, job: Job) -> None:
+        from .tracking import terminate_run
+
+        if job.run_id is not None:
+            status = job.status if job.status in TERMINAL_STATUSES else FAILED
+            terminate_run(job.run_id, status)
+
+        with self._lock:
+            job.ended_at = time.time()
+            self._running.discard(job.id)
+
+        _logger.info("Workflow %s ended: %s", job.id, job.status)
+        self._dispatch()
+
+
+def serve(
+    service: WorkflowService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT
+) -> None:
+    server = make_server(service, host, port)
+    _logger.info("Serving on http://%s:%s", *server.server_address[:2])
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def make_server(
+    service: WorkflowService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT
+) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+# POST /workflows                submit a workflow, returns its job
+# GET  /workflows                all jobs
+# GET  /workflows/<id>           one job
+# POST /workflows/<id>/cancel    cancel a queued or running job
+# GET  /budget                   slots of the step budget in use
+class _Handler(BaseHTTPRequestHandler):
+    service: WorkflowService
+
+    def do_GET(self) -> None:
+        job = _JOB_PATH.fullmatch(self.path)
+        if self.path == "/workflows":
+            self._respond(lambda: [job.to_dict() for job in self.service.list()])
+        elif job is not None:
+            self._respond(lambda: self.service.get(job["id"]).to_dict())
+        elif self.path == "/budget":
+            budget = self.service.budget
+            self._respond(
+                lambda: {"capacity": budget.capacity, "running": budget.running}
+            )
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self) -> None:
+        cancel = _CANCEL_PATH.fullmatch(self.path)
+        if self.path == "/workflows":
+            self._respond(
+                lambda: self.service.submit(self._read()).to_dict(), HTTPStatus.CREATED
+            )
+        elif cancel is not None:
+            self._respond(lambda: self.service.cancel(cancel["id"]).to_dict())
+        else:
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"Unknown path: {self.path}"})
+
+    def _read(self) -> dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON: {e}") from e
+        if not isinstance(request, dict):
+            raise ValueError("Expected a JSON object")
+
+        return request
+
+    def _respond(self, get_body: Any, status: HTTPStatus = HTTPStatus.OK) -> None:
+        try:
+            body = get_body()
+        except KeyError as e:
+            self._send(
+                HTTPStatus.NOT_FOUND, {"error": f"Unknown workflow: {e.args[0]}"}
+            )
+        except ValueError as e:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+        else:
+            self._send(status, body)
+
+    def _send(self, status: HTTPStatus, body: Any) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        _logger.debug(format, *args)
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        self.status = status
+        super().__init__(f"{status}: {message}")
+
+
+# A minimal client of the service, with the standard library only
+class ServiceClient:
+    def __init__(self, url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"):
+        self.url = url.rstrip("/")
+
+    def submit(
+        self,
+        uri: str,
+        entry_point: str | None = None,
+        parameters: Mapping[str, Any] | None = None,
+        **options: Any,
+    ) -> dict[str, Any]:
+        request = {"uri": uri, "entry_point": entry_point, **options}
+        if parameters:
+            request["parameters"] = dict(parameters)
+
+        return self._request("POST", "/workflows", request)
+
+    def get(self, job_id: str) -> dict[str, Any]:
+        return self._request("GET", f"/workflows/{job_id}")
+
+    def list(self) -> list[dict[str, Any]]:
+        return self._request("GET", "/workflows")
+
+    def cancel(self, job_id: str) -> dict[str, Any]:
+        return self._request("POST", f"/workflows/{job_id}/cancel")
+
+    def wait(
+        self, job_id: str, timeout: float | None = None, interval: float = 1.0
+    ) -> dict[str, Any]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job["status"] in TERMINAL_STATUSES:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Workflow {job_id} is still {job['status']}")
+
+            time.sleep(interval)
+
+    def _request(self, method: str, path: str, body: Any = None) -> Any:
+        data = None if body is None else json.dumps(body).encode()
+        request = Request(  # noqa: S310
+            self.url + path,
+            data=data,
+            method=method,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urlopen(request) as response:  # noqa: S310
+                return json.loads(response.read())
+        except HTTPError as e:
+            message = json.loads(e.read() or b"{}").get("error", e.reason)
+            raise ServiceError(e.code, message) from e
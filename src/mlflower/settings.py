@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+MLFLOWER_CACHE_DIR = "MLFLOWER_CACHE_DIR"
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def get_cache_dir(*parts: str) -> Path:
+    root = os.environ.get(MLFLOWER_CACHE_DIR)
+    if root is None:
+        xdg_cache = os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache")
+        root = Path(xdg_cache, "mlflower")
+
+    cache_dir = Path(root, *parts)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def parse_duration(duration: str | float) -> float:
+    if isinstance(duration, (int, float)):
+        return float(duration)
+
+    unit = duration[-1].lower()
+    if unit in DURATION_UNITS:
+        return float(duration[:-1]) * DURATION_UNITS[unit]
+
+    return float(duration)
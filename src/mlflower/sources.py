@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from .settings import get_cache_dir, parse_duration
+
+_logger = logging.getLogger(__name__)
+
+MLFLOWER_SOURCE_CACHE_TTL = "MLFLOWER_SOURCE_CACHE_TTL"
+DEFAULT_SOURCE_CACHE_TTL = "7d"
+
+SUBDIRECTORY_SEPARATOR = "#"
+
+_REMOTE_SOURCE = re.compile(r"^(?:[a-z][\w+.-]*://|[\w.-]+@[\w.-]+:)", re.IGNORECASE)
+_COMMIT = re.compile(r"^[0-9a-f]{40}$")
+
+
+def is_remote_source(source: str) -> bool:
+    return _REMOTE_SOURCE.match(source) is not None
+
+
+def is_pinned(version: str | None) -> bool:
+    return version is not None and _COMMIT.match(version) is not None
+
+
+# Remote git sources are checked out once per workflow, into a cache shared by all
+# workflows: checkouts are named after their commit, so they never change once created
+# and concurrent workflows can use them without locking.
+class SourceCache:
+    def __init__(self, root: str | Path | None = None, ttl: str | float | None = None):
+        self.root = Path(root) if root is not None else get_cache_dir("sources")
+        self.ttl = parse_duration(
+            ttl or os.environ.get(MLFLOWER_SOURCE_CACHE_TTL, DEFAULT_SOURCE_CACHE_TTL)
+        )
+
+        self._checkouts: dict[tuple[str, str | None], Path] = {}
+        self._locks: dict[tuple[str, str | None], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def materialize(self, source: str, version: str | None = None) -> str:
+        uri, _, subdirectory = source.partition(SUBDIRECTORY_SEPARATOR)
+        key = (uri, version)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key not in self._checkouts:
+                self._checkouts[key] = self._checkout(uri, version)
+                self._evict(keep=self._checkouts[key])
+
+        path = self._checkouts[key].joinpath(subdirectory).resolve()
+        if not path.is_dir():
+            raise FileNotFoundError(f"No directory {subdirectory!r} in {uri}")
+
+        return path.as_posix()
+
+    def touch(self, path: str | Path) -> None:
+        # Plans reused from the plan cache skip `materialize`: the checkouts they point
+        # to are marked as used all the same, so that they aren't evicted
+        try:
+            relative = Path(path).resolve().relative_to(self.root.resolve())
+        except ValueError:
+            return
+
+        if len(relative.parts) > 1:
+            with contextlib.suppress(OSError):
+                os.utime(self.root.joinpath(*relative.parts[:2]))
+
+    def _checkout(self, uri: str, version: str | None) -> Path:
+        repo_dir = self.root / hashlib.sha256(uri.encode("utf-8")).hexdigest()[:16]
+        repo_dir.mkdir(parents=True, exist_ok=True)
+
+        commit = _resolve_commit(uri, version)
+        if commit is not None and repo_dir.joinpath(commit).is_dir():
+            _logger.debug("Using cached checkout of %s at %s", uri, commit)
+            os.utime(repo_dir / commit)
+            return repo_dir / commit
+
+        from mlflow.projects.utils import _fetch_git_repo
+
+        _logger.info("Fetching %s at %s", uri, version or "HEAD")
+        tmp_dir = Path(tempfile.mkdtemp(dir=repo_dir, prefix=".tmp-"))
+        try:
+            _fetch_git_repo(uri, version, tmp_dir.as_posix())
+            commit = _get_head_commit(tmp_dir)
+            target = repo_dir / commit
+            try:
+                # Another workflow may have checked out the same commit in the meantime
+                tmp_dir.rename(target)
+            except OSError:
+                if not target.is_dir():
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        return target
+
+    def _evict(self, keep: Path) -> None:
+        # Checkouts unused for longer than the TTL are removed, as are leftovers of
+        # interrupted fetches
+        min_time = time.time() - self.ttl
+        for checkout in self.root.glob("*/*"):
+            if checkout == keep or checkout in self._checkouts.values():
+                continue
+
+            try:
+                if checkout.stat().st_mtime < min_time:
+                    _logger.debug("Evicting checkout %s", checkout)
+                    shutil.rmtree(checkout)
+            except OSError:
+                continue
+
+
+def _resolve_commit(uri: str, version: str | None) -> str | None:
+    if is_pinned(version):
+        return version
+
+    import git
+
+    try:
+        output = git.cmd.Git().ls_remote(uri, version or "HEAD")
+    except git.exc.GitCommandError:
+        return None
+
+    # Tags are listed twice when annotated: the dereferenced commit comes last
+    commits = [line.split()[0] for line in output.splitlines() if line.strip()]
+    return commits[-1] if commits else None
+
+
+def _get_head_commit(path: Path) -> str:
+    import git
+
+    return git.Repo(path).head.commit.hexsha
@@ -0,0 +1,238 @@
+from __future__ import annotations
+
+import contextlib
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
+
+from .project import SOURCE_CONTENT_KEY, SOURCE_ID_KEY, SOURCE_TYPE_KEY
+from .settings import get_cache_dir
+
+if TYPE_CHECKING:
+    from .entry_point import EntryPoint
+
+STREAMS_DIR = "streams"
+
+PARTITION_PREFIX = "part-"
+SUCCESS_MARKER = "_SUCCESS"
+FAILURE_MARKER = "_FAILED"
+READERS_DIR = "_readers"
+
+DEFAULT_MAX_PENDING = 8
+POLL_INTERVAL = 0.1
+
+
+class StreamError(Exception):
+    pass
+
+
+# A directory of numbered partitions, each renamed into place once complete, ended by a
+# success or failure marker. Each reader records how many partitions it has consumed.
+class Channel:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    @classmethod
+    def of(cls, run_id: str, key: str) -> Channel:
+        return cls(get_cache_dir(STREAMS_DIR, run_id).joinpath(key))
+
+    def partitions(self) -> list[Path]:
+        return sorted(self.path.glob(PARTITION_PREFIX + "*"))
+
+    @property
+    def has_data(self) -> bool:
+        return next(self.path.glob(PARTITION_PREFIX + "*"), None) is not None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.path.joinpath(SUCCESS_MARKER).exists()
+
+    @property
+    def closed(self) -> bool:
+        return self.succeeded or self.get_error() is not None
+
+    def get_error(self) -> str | None:
+        try:
+            return self.path.joinpath(FAILURE_MARKER).read_text()
+        except FileNotFoundError:
+            return None
+
+    def close(self) -> None:
+        if not self.closed:
+            _write(self.path.joinpath(SUCCESS_MARKER), "")
+
+    def fail(self, message: str) -> None:
+        if not self.closed:
+            _write(self.path.joinpath(FAILURE_MARKER), message)
+
+    def ack(self, reader_id: str, count: int) -> None:
+        _write(self.path.joinpath(READERS_DIR, reader_id), str(count))
+
+    def get_acked(self) -> list[int]:
+        acked = []
+        with contextlib.suppress(FileNotFoundError):
+            for path in self.path.joinpath(READERS_DIR).iterdir():
+                # Readers may leave at any time
+                with contextlib.suppress(FileNotFoundError, ValueError):
+                    acked.append(int(path.read_text()))
+
+        return acked
+
+    def remove_reader(self, reader_id: str) -> None:
+        with contextlib.suppress(FileNotFoundError):
+            self.path.joinpath(READERS_DIR, reader_id).unlink()
+
+    def delete(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+# Used by producers, in place of logging one big artifact:
+#
+#     with open_stream("partitions") as stream:
+#         for chunk in chunks:
+#             with stream.partition(".csv") as path:
+#                 chunk.to_csv(path)
+#
+# Writing blocks while a running reader is `max_pending` partitions behind. Readers that
+# haven't started don't hold the producer back, so that it can't wait on them forever.
+class StreamWriter:
+    def __init__(
+        self,
+        key: str,
+        run_id: str | None = None,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.channel = Channel.of(run_id or _get_run_id(), key)
+        self.channel.path.mkdir(parents=True, exist_ok=True)
+        self.max_pending = max_pending
+        self.count = len(self.channel.partitions())
+
+    def write(self, data: bytes | str, suffix: str = "") -> None:
+        if isinstance(data, str):
+            data = data.encode()
+        with self.partition(suffix) as path:
+            path.write_bytes(data)
+
+    @contextlib.contextmanager
+    def partition(self, suffix: str = "") -> Iterator[Path]:
+        # A file or directory, visible to readers once the block exits
+        self._wait_for_readers()
+        name = f"{PARTITION_PREFIX}{self.count:08d}{suffix}"
+        tmp_path = self.channel.path.joinpath(f".{name}.{uuid.uuid4().hex}.tmp")
+        try:
+            yield tmp_path
+            os.replace(tmp_path, self.channel.path.joinpath(name))
+        finally:
+            if tmp_path.is_dir():
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            elif tmp_path.exists():
+                tmp_path.unlink()
+
+        self.count += 1
+
+    def close(self) -> None:
+        self.channel.close()
+
+    def _wait_for_readers(self) -> None:
+        while True:
+            acked = self.channel.get_acked()
+            if not acked or self.count - min(acked) < self.max_pending:
+                return
+
+            time.sleep(POLL_INTERVAL)
+
+
+# Used by consumers, given the parameter of a `stream` source:
+#
+#     for path in StreamReader(args.partitions):
+#         train_on(pd.read_csv(path))
+#
+# Partitions are yielded as they land, and acknowledged when the next one is asked for.
+# Iteration ends once the producer closed the stream, and raises if it failed.
+class StreamReader:
+    def __init__(self, path: str | Path, reader_id: str | None = None):
+        self.channel = Channel(path)
+        self.reader_id = (
+            reader_id or os.environ.get("MLFLOW_RUN_ID") or uuid.uuid4().hex
+        )
+        self.count = 0
+
+    def __iter__(self) -> Iterator[Path]:
+        self.channel.ack(self.reader_id, self.count)
+        try:
+            while True:
+                # Partitions are all in place before the marker is
+                closed = self.channel.closed
+                partitions = self.channel.partitions()[self.count :]
+                for partition in partitions:
+                    yield partition
+                    self.count += 1
+                    self.channel.ack(self.reader_id, self.count)
+
+                if partitions:
+                    continue
+                error = self.channel.get_error()
+                if error is not None:
+                    raise StreamError(f"Stream {self.channel.path} failed: {error}")
+                if closed:
+                    return
+
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self.channel.remove_reader(self.reader_id)
+
+
+@contextlib.contextmanager
+def open_stream(
+    key: str, run_id: str | None = None, max_pending: int = DEFAULT_MAX_PENDING
+) -> Iterator[StreamWriter]:
+    # Closed when the block exits, and failed if it raises
+    stream = StreamWriter(key, run_id, max_pending)
+    try:
+        yield stream
+    except BaseException as e:
+        stream.channel.fail(f"{type(e).__name__}: {e}")
+        raise
+
+    stream.close()
+
+
+def get_streams(entry_points: dict[str, EntryPoint]) -> dict[str, dict[str, set[str]]]:
+    # For each consumer, the keys of the streams it reads from each producer
+    streams: dict[str, dict[str, set[str]]] = {}
+    for key, entry_point in entry_points.items():
+        for param in entry_point.workflow_parameters.values():
+            if param.get(SOURCE_TYPE_KEY) == "stream":
+                producers = streams.setdefault(key, {})
+                producers.setdefault(param[SOURCE_ID_KEY], set()).add(
+                    param[SOURCE_CONTENT_KEY]
+                )
+
+    return streams
+
+
+def delete_streams(run_id: str) -> None:
+    shutil.rmtree(get_cache_dir(STREAMS_DIR).joinpath(run_id), ignore_errors=True)
+
+
+def _get_run_id() -> str:
+    run_id = os.environ.get("MLFLOW_RUN_ID")
+    if run_id is None:
+        import mlflow
+
+        active_run = mlflow.active_run()
+        if active_run is None:
+            raise StreamError("Streams are written from within a run")
+        run_id = active_run.info.run_id
+
+    return run_id
+
+
+def _write(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp_path.write_text(content)
+    os.replace(tmp_path, path)
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+from typing import Mapping
+
+from .entry_point import EntryPoint
+
+SWEEP_RESOURCE_PREFIX = "sweep:"
+
+
+def get_shards(entry_points: Mapping[str, EntryPoint], key: str) -> list[str]:
+    return [
+        shard_key
+        for shard_key, entry_point in entry_points.items()
+        if entry_point.sweep is not None and entry_point.parent == key
+    ]
+
+
+def get_sweep_limits(
+    entry_points: Mapping[str, EntryPoint]
+) -> tuple[dict[str, dict[str, float]], dict[str, float]]:
+    # A sweep's `max_parallel` is a resource of its own, shared by its shards
+    capacity = {
+        SWEEP_RESOURCE_PREFIX + key: float(entry_point.max_parallel)
+        for key, entry_point in entry_points.items()
+        if entry_point.workflow and entry_point.max_parallel
+    }
+    demands = {
+        key: {SWEEP_RESOURCE_PREFIX + entry_point.parent: 1.0}
+        for key, entry_point in entry_points.items()
+        if entry_point.sweep is not None
+        and SWEEP_RESOURCE_PREFIX + entry_point.parent in capacity
+    }
+
+    return demands, capacity
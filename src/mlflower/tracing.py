@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import contextlib
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Iterable, Iterator
+
+QUEUE_SPAN = "queue_wait"
+RESOLVE_SPAN = "resolve_params"
+SUBMIT_SPAN = "submit"
+RUN_SPAN = "run"
+FETCH_SPAN = "fetch_runs"
+PREWARM_SPAN = "prewarm_environments"
+
+ORCHESTRATOR_LANE = "mlflower"
+
+
+@dataclass(frozen=True)
+class Span:
+    name: str
+    start: float
+    end: float
+    key: str | None = None
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+# Spans use wall-clock times (seconds since the epoch), as they are exported to tools
+# displaying absolute times. Steps are spans with a key, the orchestrator's have none.
+class Tracer:
+    def __init__(self):
+        self.origin = time.time()
+        self.spans: list[Span] = []
+        self._finished: dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def span(self, name: str, key: str | None = None) -> Iterator[None]:
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.time(), key)
+
+    def add(self, name: str, start: float, end: float, key: str | None = None) -> None:
+        self.spans.append(Span(name, start, end, key))
+        if name == RUN_SPAN and key is not None:
+            self._finished[key] = end
+
+    def add_queue_wait(self, key: str, dependencies: Iterable[str]) -> None:
+        # A step is ready once its last dependency finished
+        ready_at = max(
+            (self._finished[dep] for dep in dependencies if dep in self._finished),
+            default=self.origin,
+        )
+        self.add(QUEUE_SPAN, ready_at, time.time(), key)
+
+    def get_durations(self) -> dict[str, float]:
+        durations = Counter()
+        for span in self.spans:
+            durations[span.name] += span.duration
+            if span.key is not None:
+                durations[f"{span.key}.{span.name}"] += span.duration
+
+        return dict(durations)
+
+
+def get_parallelism(spans: Iterable[Span]) -> list[tuple[float, int]]:
+    changes = sorted(
+        (time_, change)
+        for span in spans
+        if span.name == RUN_SPAN
+        for time_, change in ((span.start, 1), (span.end, -1))
+    )
+
+    running, timeline = 0, []
+    for time_, change in changes:
+        running += change
+        timeline.append((time_, running))
+
+    return timeline
+
+
+def to_chrome_trace(
+    spans: Iterable[Span], critical_path: Iterable[str] = ()
+) -> dict[str, Any]:
+    spans = list(spans)
+    critical_path = set(critical_path)
+    lanes = {ORCHESTRATOR_LANE: 0}
+    for span in spans:
+        if span.key is not None:
+            lanes.setdefault(span.key, len(lanes))
+
+    events = [
+        {"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}}
+        for lane, tid in lanes.items()
+    ]
+    for span in spans:
+        event = {
+            "name": span.name,
+            "cat": "step" if span.key is not None else "orchestrator",
+            "ph": "X",
+            "ts": span.start * 1e6,
+            "dur": span.duration * 1e6,
+            "pid": 1,
+            "tid": lanes[span.key or ORCHESTRATOR_LANE],
+            "args": {"step": span.key, "critical": span.key in critical_path},
+        }
+        if span.key in critical_path and span.name == RUN_SPAN:
+            event["cname"] = "terrible"
+        events.append(event)
+
+    events.extend(
+        {
+            "name": "parallelism",
+            "ph": "C",
+            "pid": 1,
+            "ts": time_ * 1e6,
+            "args": {"running": running},
+        }
+        for time_, running in get_parallelism(spans)
+    )
+
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
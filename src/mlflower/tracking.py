@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+from collections import Counter
+from typing import Any, Iterable
+
+import mlflow
+from mlflow import MlflowClient
+from mlflow.entities import Metric, Param, Run, RunStatus, RunTag
+from mlflow.exceptions import MlflowException
+from mlflow.utils.time import get_current_time_millis
+
+from .project import load_project
+
+_logger = logging.getLogger(__name__)
+
+# Limits of a single `log_batch` request
+MAX_PARAMS_PER_BATCH = 100
+MAX_ENTITIES_PER_BATCH = 1000
+MAX_RUN_IDS_PER_SEARCH = 100
+
+REQUEST_COUNT_METRIC = "mlflower.tracking_requests"
+
+
+# Params, tags and metrics are buffered per run and sent with one `log_batch` per run on
+# `flush`. Terminated runs are fetched in bulk and kept, since they can't change anymore.
+# All requests go through the same client, hence the same store and HTTP session.
+class Tracker:
+    def __init__(self, client: MlflowClient | None = None):
+        self.client = client or MlflowClient()
+        self.request_counts: Counter[str] = Counter()
+
+        self._params: dict[str, dict[str, str]] = {}
+        self._tags: dict[str, dict[str, str]] = {}
+        self._metrics: dict[str, list[Metric]] = {}
+        self._runs: dict[str, Run] = {}
+
+    def log_params(self, run_id: str, params: dict[str, Any]) -> None:
+        self._params.setdefault(run_id, {}).update(
+            (key, str(value)) for key, value in params.items()
+        )
+
+    def set_tag(self, run_id: str, key: str, value: str) -> None:
+        self._tags.setdefault(run_id, {})[key] = str(value)
+
+    def set_tags(self, run_id: str, tags: dict[str, str]) -> None:
+        for key, value in tags.items():
+            self.set_tag(run_id, key, value)
+
+    def log_metric(
+        self,
+        run_id: str,
+        key: str,
+        value: float,
+        timestamp: int | None = None,
+        step: int = 0,
+    ) -> None:
+        timestamp = timestamp or get_current_time_millis()
+        self._metrics.setdefault(run_id, []).append(Metric(key, value, timestamp, step))
+
+    def log_text(self, run_id: str, text: str, artifact_file: str) -> None:
+        self._count("log_artifact")
+        self.client.log_text(run_id, text, artifact_file)
+
+    def flush(self) -> None:
+        run_ids = [*self._params, *self._tags, *self._metrics]
+        for run_id in dict.fromkeys(run_ids):
+            self._flush_run(run_id)
+
+    def _flush_run(self, run_id: str) -> None:
+        params = [Param(k, v) for k, v in self._params.pop(run_id, {}).items()]
+        tags = [RunTag(k, v) for k, v in self._tags.pop(run_id, {}).items()]
+        metrics = self._metrics.pop(run_id, [])
+
+        while params or tags or metrics:
+            batch_params, params = (
+                params[:MAX_PARAMS_PER_BATCH],
+                params[MAX_PARAMS_PER_BATCH:],
+            )
+            size = MAX_ENTITIES_PER_BATCH - len(batch_params)
+            batch_tags, tags = tags[:size], tags[size:]
+            size -= len(batch_tags)
+            batch_metrics, metrics = metrics[:size], metrics[size:]
+
+            self._count("log_batch")
+            self.client.log_batch(
+                run_id, metrics=batch_metrics, params=batch_params, tags=batch_tags
+            )
+
+    def get_run(self, run_id: str) -> Run:
+        if run_id in self._runs:
+            return self._runs[run_id]
+
+        self._count("get_run")
+        return self._keep(self.client.get_run(run_id))
+
+    def get_runs(
+        self, run_ids: Iterable[str], experiment_ids: Iterable[str]
+    ) -> dict[str, Run]:
+        missing = [
+            run_id for run_id in dict.fromkeys(run_ids) if run_id not in self._runs
+        ]
+        experiment_ids = list(dict.fromkeys(experiment_ids))
+
+        for i in range(0, len(missing), MAX_RUN_IDS_PER_SEARCH):
+            chunk = missing[i : i + MAX_RUN_IDS_PER_SEARCH]
+            quoted = ", ".join(f"'{run_id}'" for run_id in chunk)
+            for run in self.search_runs(
+                experiment_ids,
+                filter_string=f"attributes.run_id IN ({quoted})",
+                max_results=len(chunk),
+            ):
+                self._keep(run)
+
+        # Runs from other experiments (e.g. reused ones) are fetched one by one
+        return {run_id: self.get_run(run_id) for run_id in dict.fromkeys(run_ids)}
+
+    def search_runs(self, experiment_ids: list[str], **kwargs: Any) -> list[Run]:
+        self._count("search_runs")
+        return self.client.search_runs(experiment_ids, **kwargs)
+
+    def create_run(self, experiment_id: str, tags: dict[str, str]) -> Run:
+        self._count("create_run")
+        return self.client.create_run(experiment_id, tags=tags)
+
+    def set_terminated(self, run_id: str, status: RunStatus) -> None:
+        self._count("update_run")
+        self.client.set_terminated(run_id, RunStatus.to_string(status))
+
+    def report(self, run_id: str) -> None:
+        self.log_metric(run_id, REQUEST_COUNT_METRIC, sum(self.request_counts.values()))
+        self.flush()
+        _logger.info("Tracking requests: %s", dict(self.request_counts))
+
+    def _keep(self, run: Run) -> Run:
+        if RunStatus.is_terminated(RunStatus.from_string(run.info.status)):
+            self._runs[run.info.run_id] = run
+
+        return run
+
+    def _count(self, request: str) -> None:
+        self.request_counts[request] += 1
+
+
+def get_experiment_id(
+    project_uri: str,
+    experiment_id: str | None = None,
+    experiment_name: str | None = None,
+) -> str | None:
+    if experiment_id:
+        return experiment_id
+
+    experiment_name = experiment_name or load_project(project_uri).get("name")
+
+    if experiment_name is None:
+        return None
+
+    experiment = mlflow.get_experiment_by_name(experiment_name)
+    if experiment is None:
+        return mlflow.create_experiment(experiment_name)
+
+    return experiment.experiment_id
+
+
+def update_params(active_run: Run, param_dict: dict[str, Any]) -> None:
+    if not param_dict:
+        return
+
+    active_run.data.params.update(param_dict)
+    params = [Param(key, str(value)) for key, value in param_dict.items()]
+    with contextlib.suppress(MlflowException):
+        MlflowClient().log_batch(active_run.info.run_id, params=params)
+
+
+def terminate_run(run_id: str, status: str, overwrite: bool = False) -> None:
+    # For steps that couldn't end their run themselves: killed, crashed or lost. With
+    # `overwrite`, the status is the one of the step's process, whatever the run says.
+    client = MlflowClient()
+    with contextlib.suppress(MlflowException):
+        current = client.get_run(run_id).info.status
+        if current == status:
+            return
+        if overwrite or not RunStatus.is_terminated(RunStatus.from_string(current)):
+            client.set_terminated(run_id, status)
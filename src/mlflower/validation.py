@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from .entry_point import EntryPoint
+from .graph_utils import topological_sort
+from .project import SOURCE_COLLECT_KEY, SOURCE_ID_KEY, SOURCE_TYPE_KEY, SOURCE_TYPES
+
+
+def get_validation_errors(
+    entry_points: dict[str, EntryPoint], root: str | None = None
+) -> list[str]:
+    errors = []
+    for key, entry_point in entry_points.items():
+        for dependency in sorted(entry_point.depends_on - entry_points.keys()):
+            errors.append(f"{key}: depends on unknown entry point {dependency!r}")
+
+        errors.extend(_get_param_errors(key, entry_point, entry_points))
+
+    if errors:
+        return errors
+
+    try:
+        topological_sort(entry_points, root=root)
+    except ValueError as e:
+        return [str(e)]
+
+    return errors
+
+
+def _get_param_errors(
+    key: str, entry_point: EntryPoint, entry_points: dict[str, EntryPoint]
+) -> list[str]:
+    errors = []
+    for name, param in entry_point.workflow_parameters.items():
+        source_type = param.get(SOURCE_TYPE_KEY, "parameter")
+        if source_type not in SOURCE_TYPES:
+            errors.append(f"{key}.{name}: unsupported source type {source_type!r}")
+
+        collected = param.get(SOURCE_COLLECT_KEY, "artifact")
+        if source_type == "collect" and collected not in ("artifact", "parameter"):
+            errors.append(f"{key}.{name}: cannot collect {collected!r}")
+
+        producer = entry_points.get(param.get(SOURCE_ID_KEY))
+        if source_type == "stream" and producer is not None and producer.workflow:
+            errors.append(f"{key}.{name}: cannot stream from a workflow")
+
+    return errors
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import contextlib
+import logging
+import queue
+import subprocess
+import threading
+import time
+
+from mlflow.entities import RunStatus
+from mlflow.projects import SubmittedRun
+
+_logger = logging.getLogger(__name__)
+
+INITIAL_POLL_INTERVAL = 0.5
+MAX_POLL_INTERVAL = 30.0
+POLL_BACKOFF = 1.5
+
+
+# Each submitted run is watched by its own thread, which pushes a completion event as
+# soon as the run terminates: events come out in the order runs actually finish.
+class CompletionWatcher:
+    def __init__(self):
+        self._events: queue.Queue[tuple[str, bool] | None] = queue.Queue()
+        self._pending: set[str] = set()
+        self.timed_out: set[str] = set()
+
+    def __bool__(self) -> bool:
+        return bool(self._pending)
+
+    def watch(
+        self, key: str, submitted_run: SubmittedRun, timeout: float | None = None
+    ) -> None:
+        self._pending.add(key)
+        self.timed_out.discard(key)
+        thread = threading.Thread(
+            target=self._watch,
+            args=(key, submitted_run, timeout),
+            name=f"mlflower-watcher-{key}",
+            daemon=True,
+        )
+        thread.start()
+
+    def next_completed(self, timeout: float | None = None) -> tuple[str, bool] | None:
+        try:
+            event = self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+        if event is None:
+            return None
+
+        self._pending.discard(event[0])
+        return event
+
+    def interrupt(self) -> None:
+        # Wakes up `next_completed` from another thread, as if it had timed out
+        self._events.put(None)
+
+    def _watch(
+        self, key: str, submitted_run: SubmittedRun, timeout: float | None
+    ) -> None:
+        try:
+            succeeded = wait_run(submitted_run, timeout)
+        except TimeoutError:
+            _logger.warning("Step %s timed out after %ss, cancelling it", key, timeout)
+            self.timed_out.add(key)
+            with contextlib.suppress(AttributeError):
+                submitted_run.cancel()
+            succeeded = False
+        except Exception:
+            _logger.exception("Failed to wait for step %s", key)
+            succeeded = False
+
+        self._events.put((key, succeeded))
+
+
+def wait_run(submitted_run: SubmittedRun, timeout: float | None = None) -> bool:
+    command_proc = getattr(submitted_run, "command_proc", None)
+    if command_proc is not None:
+        # Local runs: block on the subprocess itself
+        try:
+            command_proc.wait(timeout)
+        except subprocess.TimeoutExpired as e:
+            raise TimeoutError from e
+
+        return submitted_run.wait()
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    max_interval = getattr(submitted_run, "max_poll_interval", MAX_POLL_INTERVAL)
+    interval = min(INITIAL_POLL_INTERVAL, max_interval)
+    while not RunStatus.is_terminated(get_status(submitted_run)):
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError
+
+        time.sleep(interval)
+        interval = min(interval * POLL_BACKOFF, max_interval)
+
+    return submitted_run.wait()
+
+
+def get_status(submitted_run: SubmittedRun) -> RunStatus:
+    status = submitted_run.get_status()
+    if isinstance(status, str):
+        return RunStatus.from_string(status)
+
+    return status
@@ -1,17 +1,92 @@
 from __future__ import annotations
 
 import contextlib
-from typing import Iterator
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable, Iterator
 
 import mlflow
-from mlflow import MlflowClient
 from mlflow.entities import Run, RunStatus
 from mlflow.projects import SubmittedRun
+from mlflow.utils.mlflow_tags import (
+    MLFLOW_PARENT_RUN_ID,
+    MLFLOW_PROJECT_ENTRY_POINT,
+    MLFLOW_RUN_NAME,
+    MLFLOW_SOURCE_NAME,
+)
 
+from .artifacts import ArtifactPrefetcher, get_declared_artifacts
+from .cache import CACHE_HIT_TAG_PREFIX, StepCache
 from .entry_point import EntryPoint, get_entry_points
-from .graph_utils import get_mermaid_graph, to_link, topological_sort
+from .envs import prewarm_environments
+from .executor import DEFAULT_MAX_MEMORY, DEFAULT_MAX_TASKS, WarmPool
+from .graph_utils import get_mermaid_gantt, get_mermaid_graph, to_link, topological_sort
+from .hooks import (
+    PLAN_BUILT,
+    SETUP_DONE,
+    STEP_FAILED,
+    STEP_FINISHED,
+    STEP_READY,
+    STEP_SUBMITTED,
+    WORKFLOW_ENDED,
+    HookRegistry,
+    load_hook,
+)
+from .journal import PROJECT_URI_TAG, ROOT_ENTRY_POINT_TAG, Journal, find_latest_run_ids
+from .logs import LogMultiplexer, StepLog
+from .nested import (
+    DEFAULT_ROOT,
+    expand_nested_workflows,
+    get_members,
+    get_root_entry_point,
+)
+from .scheduler import (
+    BEST_EFFORT,
+    FAIL_FAST,
+    BudgetShare,
+    ReadyQueue,
+    critical_path,
+    get_limits,
+)
+from .selection import get_boundary, get_referenced, select_steps
+from .streams import POLL_INTERVAL, Channel, delete_streams, get_streams
+from .tracing import (
+    FETCH_SPAN,
+    PREWARM_SPAN,
+    QUEUE_SPAN,
+    RESOLVE_SPAN,
+    RUN_SPAN,
+    SUBMIT_SPAN,
+    Tracer,
+    get_parallelism,
+    to_chrome_trace,
+)
+from .tracking import Tracker
+from .watcher import CompletionWatcher
 from .workflow_run import WorkflowRun
 
+_logger = logging.getLogger(__name__)
+
+SKIPPED_TAG = "mlflower.skipped"
+ATTEMPT_TAG = "mlflower.attempt"
+TIMED_OUT_TAG = "mlflower.timed_out"
+NOTE_TAG = "mlflow.note.content"
+
+TRACE_METRIC_PREFIX = "mlflower.trace."
+PARALLELISM_METRIC = "mlflower.parallelism"
+TRACE_ARTIFACT = "mlflower/trace.json"
+GANTT_ARTIFACT = "mlflower/gantt.mmd"
+TIME_TO_ABORT_METRIC = "mlflower.time_to_abort"
+# Tags are limited in length: the note of a failed step only keeps its last characters
+MAX_NOTE_LENGTH = 5000
+MAX_TAG_LENGTH = 8000
+
+WARM_POOL_ARGS = ("warm_workers", "warm_imports", "warm_max_tasks", "warm_max_memory")
+
 
 class Workflow(SubmittedRun):
     def __init__(
@@ -23,10 +98,44 @@ class Workflow(SubmittedRun):
         self._is_internal = active_run is None
         self.active_run = active_run if active_run else mlflow.start_run()
         root_entry_point = root_entry_point or self.active_run.data.tags.get(
-            "mlflow.project.entryPoint", "root"
+            MLFLOW_PROJECT_ENTRY_POINT, DEFAULT_ROOT
         )
 
+        self.root_entry_point = root_entry_point
         self.runtime_context: dict[str, SubmittedRun] = {}
+        self.spans: dict[str, tuple[float, float]] = {}
+        self.watcher = CompletionWatcher()
+        self._cancel_requested = threading.Event()
+        self.tracer = Tracer()
+        self.hooks = HookRegistry()
+        self._submitted_at: dict[str, float] = {}
+        self._failed: set[str] = set()
+        self._failed_at: float | None = None
+        self._skipped: list[str] = []
+        self._retries: dict[str, float] = {}
+        self.cache: StepCache | None = None
+        self.artifacts: ArtifactPrefetcher | None = None
+        self.executor: WarmPool | None = None
+        self.logs: LogMultiplexer | None = None
+        self._step_logs: dict[str, StepLog] = {}
+        self._declared_artifacts = get_declared_artifacts(entry_points)
+        self._streams = get_streams(entry_points)
+        # Keys of the streams of each producer, and producers yet to publish any
+        self._channels: dict[str, set[str]] = {}
+        for producers in self._streams.values():
+            for producer, names in producers.items():
+                self._channels.setdefault(producer, set()).update(names)
+        self._producing: set[str] = set()
+        self.tracker = Tracker()
+        self.journal = Journal(self.run_id, self.tracker)
+        self._restored: set[str] = set()
+        self._deselected: set[str] = set()
+        self.project_uri: str | None = None
+        self._open_workflows = {
+            key: get_members(entry_points, key)
+            for key, entry_point in entry_points.items()
+            if entry_point.workflow
+        }
         self.workflow_runs = {
             key: WorkflowRun(
                 entry_point, run=self.active_run if key == root_entry_point else None
@@ -34,8 +143,14 @@ class Workflow(SubmittedRun):
             for key, entry_point in entry_points.items()
         }
 
-        graph_repr = to_link(get_mermaid_graph(entry_points, root_entry_point))
-        MlflowClient().set_tag(self.run_id, "mlflow.note.content", graph_repr)
+        self._graph_note = to_link(get_mermaid_graph(entry_points, root_entry_point))
+        self.tracker.set_tags(
+            self.run_id,
+            {
+                NOTE_TAG: self._graph_note,
+                ROOT_ENTRY_POINT_TAG: root_entry_point,
+            },
+        )
 
         self._resolution_order = iter(
             topological_sort(entry_points, root=root_entry_point)
@@ -48,10 +163,98 @@ class Workflow(SubmittedRun):
         project_uri: str,
         active_run: Run | None = None,
         root_entry_point: str | None = None,
+        inline_workflows: bool = True,
     ) -> Workflow:
         entry_points = get_entry_points(project_uri)
+        if root_entry_point is None and active_run is not None:
+            root_entry_point = active_run.data.tags.get(MLFLOW_PROJECT_ENTRY_POINT)
+        root = get_root_entry_point(entry_points, project_uri, root_entry_point)
+        if inline_workflows:
+            entry_points = expand_nested_workflows(entry_points, root, project_uri)
+
+        workflow = cls(entry_points, active_run, root)
+        workflow.project_uri = project_uri
+        workflow.tracker.set_tag(workflow.run_id, PROJECT_URI_TAG, project_uri)
+        return workflow
+
+    def restore(self) -> set[str]:
+        journal = self.journal.load()
+        run_ids = [entry["run_id"] for entry in journal.values()]
+        runs = self.tracker.get_runs(run_ids, [self.active_run.info.experiment_id])
+        for key, entry in journal.items():
+            if key not in self.workflow_runs or key == self.root_entry_point:
+                continue
+
+            if entry["status"] != RunStatus.to_string(RunStatus.FINISHED):
+                continue
+
+            run = runs[entry["run_id"]]
+            if run.info.status != RunStatus.to_string(RunStatus.FINISHED):
+                continue
+
+            self.workflow_runs[key].reuse(run)
+            self._restored.add(key)
+
+        return self._restored
+
+    def select(
+        self,
+        targets: Iterable[str] = (),
+        from_steps: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        reuse: dict[str, str] | None = None,
+    ) -> set[str]:
+        # Steps given a run to reuse are excluded too
+        reuse = dict(reuse or {})
+        entry_points = {
+            key: wrun.entry_point for key, wrun in self.workflow_runs.items()
+        }
+        root = self.root_entry_point
+        selected = select_steps(
+            entry_points, root, targets, from_steps, [*exclude, *reuse]
+        )
+        selected -= self._restored
 
-        return cls(entry_points, active_run, root_entry_point)
+        boundary = get_boundary(entry_points, selected, root) - self._restored
+        self._bind(boundary, reuse, required=get_referenced(entry_points, selected))
+        self._deselected = entry_points.keys() - selected - self._restored - {root}
+
+        for workflow_key in list(self._open_workflows):
+            if workflow_key in selected:
+                self._open_workflows[workflow_key] &= selected
+            else:
+                del self._open_workflows[workflow_key]
+
+        return selected
+
+    def _bind(self, keys: set[str], reuse: dict[str, str], required: set[str]) -> None:
+        experiment_id = self.active_run.info.experiment_id
+        run_ids = {key: reuse[key] for key in keys if key in reuse}
+        run_ids.update(
+            find_latest_run_ids(
+                self.tracker,
+                [experiment_id],
+                keys - run_ids.keys(),
+                tags={
+                    PROJECT_URI_TAG: self.project_uri,
+                    ROOT_ENTRY_POINT_TAG: self.root_entry_point,
+                },
+                exclude_run_id=self.run_id,
+            )
+        )
+        missing = (keys & required) - run_ids.keys()
+        if missing:
+            raise ValueError(
+                f"No finished run to reuse for {', '.join(sorted(missing))}: "
+                "run them first or pass one with --reuse NAME=RUN_ID"
+            )
+
+        runs = self.tracker.get_runs(run_ids.values(), [experiment_id])
+        for key, run_id in run_ids.items():
+            _logger.info("Reusing run %s for step %s", run_id, key)
+            self.workflow_runs[key].reuse(runs[run_id])
+            self.journal.record(key, run_id, RunStatus.FINISHED)
+            self._restored.add(key)
 
     def __iter__(self) -> Iterator[tuple[str, WorkflowRun]]:
         for key in self._resolution_order:
@@ -61,34 +264,490 @@ class Workflow(SubmittedRun):
         if self.get_status() != RunStatus.SCHEDULED:
             return
 
-        run_args = get_run_args(self.active_run, run_args)
+        run_args = dict(run_args or {})
+        max_parallel = run_args.pop("max_parallel", None)
+        budget = run_args.pop("budget", None)
+        on_failure = run_args.pop("on_failure", None) or FAIL_FAST
+        run_args = self._setup(run_args)
+        self.hooks.emit(SETUP_DONE, workflow=self)
 
         self._status = RunStatus.RUNNING
-        for key, wrun in self:
-            if not wrun.wait_dependencies(self.runtime_context):
-                return self.fail()
+        queue = self._get_queue(max_parallel, budget)
+        self.hooks.emit(PLAN_BUILT, workflow=self)
+        started: dict[str, float] = {}
+        while queue:
+            if self._cancel_requested.is_set():
+                return self.cancel()
 
-            current_run_args = {**run_args, "run_name": key}
-            self.runtime_context[key] = wrun.submit(
-                self.workflow_runs, current_run_args
-            )
+            self._release_streams(queue)
+            ready = [*queue.pop_ready(), *self._pop_due_retries()]
+            with self.tracer.span(FETCH_SPAN):
+                self._prefetch_dependencies(ready, run_args)
+            for key in ready:
+                started.setdefault(key, time.monotonic())
+                self._start(key, run_args)
+            self.tracker.flush()
+
+            completed = self._wait_first(timeout=self._get_wait())
+            if completed is None:
+                continue
+
+            key, succeeded = completed
+            self.spans[key] = (started[key], time.monotonic())
+            if self._complete(queue, key, succeeded, on_failure):
+                return self.fail()
 
-        if not self.wait():
+        if self._failed:
             return self.fail()
 
+        self._report_critical_path()
         return self._end_run(RunStatus.FINISHED)
 
+    def _setup(self, run_args: dict[str, Any]) -> dict[str, Any]:
+        for hook in run_args.pop("hooks", ()):
+            self.hooks.register(load_hook(hook))
+        prewarm = run_args.pop("prewarm", True)
+        prefetch_artifacts = run_args.pop("prefetch_artifacts", False)
+        warm_pool = {key: run_args.pop(key, None) for key in WARM_POOL_ARGS}
+        capture_logs = run_args.pop("capture_logs", True)
+        self._setup_cache(run_args)
+        run_args = get_run_args(self.active_run, run_args)
+        self._prewarm(run_args, enabled=prewarm)
+        self._setup_artifacts(run_args, enabled=prefetch_artifacts)
+        self._setup_warm_pool(run_args, **warm_pool)
+        self._setup_logs(run_args, enabled=capture_logs)
+        if self._streams and run_args["backend"] != "local":
+            _logger.warning(
+                "Streams are read while written with the local backend only: "
+                "consumers wait for their producers to finish"
+            )
+            self._streams = {}
+
+        return run_args
+
+    def _setup_cache(self, run_args: dict[str, Any]) -> None:
+        invalidate = run_args.pop("invalidate", ())
+        if not run_args.pop("cache", False):
+            return
+
+        experiment_id = (
+            run_args.get("experiment_id") or self.active_run.info.experiment_id
+        )
+        self.cache = StepCache(experiment_id, self.tracker, invalidate)
+
+    def _prewarm(self, run_args: dict[str, Any], enabled: bool = True) -> None:
+        if not enabled or run_args["backend"] != "local":
+            return
+
+        sources = [
+            wrun.entry_point.source
+            for key, wrun in self.workflow_runs.items()
+            if key != self.root_entry_point
+            and key not in self._restored
+            and key not in self._deselected
+            and not wrun.entry_point.workflow
+        ]
+        with self.tracer.span(PREWARM_SPAN):
+            prewarm_environments(sources, run_args["env_manager"])
+
+    def _setup_artifacts(self, run_args: dict[str, Any], enabled: bool = False) -> None:
+        if not enabled:
+            return
+
+        if run_args["backend"] != "local":
+            _logger.warning("Artifacts are only prefetched with the local backend")
+            return
+
+        self.artifacts = ArtifactPrefetcher()
+        for key in self._restored:
+            self._prefetch_artifacts(key)
+
+    def _setup_warm_pool(
+        self,
+        run_args: dict[str, Any],
+        warm_workers: int | None = None,
+        warm_imports: Iterable[str] | None = None,
+        warm_max_tasks: int | None = None,
+        warm_max_memory: str | None = None,
+    ) -> None:
+        if not warm_workers:
+            return
+
+        if run_args["backend"] != "local" or run_args["env_manager"] != "local":
+            _logger.warning(
+                "Steps only run in warm workers with the local backend and env manager"
+            )
+            return
+
+        self.executor = WarmPool(
+            warm_workers,
+            warm_imports or (),
+            warm_max_tasks or DEFAULT_MAX_TASKS,
+            warm_max_memory or DEFAULT_MAX_MEMORY,
+        )
+
+    def _setup_logs(self, run_args: dict[str, Any], enabled: bool = True) -> None:
+        # Steps of other backends don't run here: pool workers capture their own
+        if enabled and run_args["backend"] == "local":
+            self.logs = LogMultiplexer()
+
+    def _prefetch_artifacts(self, key: str) -> None:
+        if self.artifacts is not None and key in self._declared_artifacts:
+            run_id = self.workflow_runs[key].run_id
+            self.artifacts.prefetch(run_id, self._declared_artifacts[key])
+
+    def _get_queue(
+        self, max_parallel: int | None, budget: BudgetShare | None = None
+    ) -> ReadyQueue:
+        entry_points = {
+            key: wrun.entry_point for key, wrun in self.workflow_runs.items()
+        }
+        return ReadyQueue(
+            self.graph,
+            done={self.root_entry_point, *self._restored, *self._deselected},
+            priorities={key: ep.priority for key, ep in entry_points.items()},
+            limits=get_limits(entry_points, max_parallel, budget),
+            streams=self._streams,
+        )
+
+    def _complete(
+        self, queue: ReadyQueue, key: str, succeeded: bool, on_failure: str
+    ) -> bool:
+        self.tracer.add(RUN_SPAN, self._submitted_at[key], time.time(), key)
+        self._record_attempt(key, succeeded)
+        self._close_log(key, succeeded)
+        self._end_streams(key, succeeded)
+        run_id = self.workflow_runs[key].run_id
+        event = STEP_FINISHED if succeeded else STEP_FAILED
+        self.hooks.emit(event, workflow=self, key=key, run_id=run_id)
+        if succeeded:
+            self._prefetch_artifacts(key)
+            queue.mark_done(key)
+        elif self._schedule_retry(key):
+            return False
+        elif self._handle_failure(queue, key, on_failure):
+            return True
+
+        self._close_workflows(key)
+        return False
+
+    def _record_attempt(self, key: str, succeeded: bool) -> None:
+        run_id = self.workflow_runs[key].run_id
+        status = RunStatus.FINISHED if succeeded else RunStatus.FAILED
+        if key in self.watcher.timed_out:
+            status = RunStatus.KILLED
+            self.tracker.set_terminated(run_id, status)
+            self.tracker.set_tag(run_id, TIMED_OUT_TAG, "true")
+
+        self.journal.record(key, run_id, status)
+
+    def _open_log(self, key: str) -> Path | None:
+        if self.logs is None:
+            return None
+
+        self._step_logs[key] = self.logs.open(key)
+        return self._step_logs[key].path
+
+    def _close_log(self, key: str, succeeded: bool) -> None:
+        step_log = self._step_logs.pop(key, None)
+        if step_log is None:
+            return
+
+        tail = self.logs.close(step_log)
+        if succeeded or not tail:
+            return
+
+        text = "\n".join(tail)
+        _logger.error("Step %s failed, last lines of its output:\n%s", key, text)
+        self.tracker.set_tag(
+            step_log.run_id,
+            NOTE_TAG,
+            f"Last lines of the output:\n\n```\n{text[-MAX_NOTE_LENGTH:]}\n```",
+        )
+
+    def _schedule_retry(self, key: str) -> bool:
+        wrun = self.workflow_runs[key]
+        if not wrun.can_retry:
+            return False
+
+        delay = wrun.retry_delay
+        _logger.warning(
+            "Step %s failed (attempt %d), retrying in %.1fs", key, wrun.attempt, delay
+        )
+        self._retries[key] = time.monotonic() + delay
+        return True
+
+    def _pop_due_retries(self) -> list[str]:
+        now = time.monotonic()
+        due = [key for key, retry_at in self._retries.items() if retry_at <= now]
+        for key in due:
+            del self._retries[key]
+
+        return due
+
+    def _get_retry_wait(self) -> float | None:
+        if not self._retries:
+            return None
+
+        return max(0.0, min(self._retries.values()) - time.monotonic())
+
+    def _get_wait(self) -> float | None:
+        wait = self._get_retry_wait()
+        if not self._producing:
+            return wait
+
+        # Channels are polled for their first partition
+        return POLL_INTERVAL if wait is None else min(wait, POLL_INTERVAL)
+
+    def _release_streams(self, queue: ReadyQueue) -> None:
+        for key in list(self._producing):
+            run_id = self.workflow_runs[key].run_id
+            if not any(
+                Channel.of(run_id, name).has_data for name in self._channels[key]
+            ):
+                continue
+
+            self._producing.discard(key)
+            released = queue.mark_streaming(key)
+            if released:
+                _logger.info(
+                    "Steps reading the stream of %s start: %s", key, ", ".join(released)
+                )
+
+    def _end_streams(self, key: str, succeeded: bool) -> None:
+        run_id = self.workflow_runs[key].run_id
+        self._producing.discard(key)
+        for name in self._channels.get(key, ()):
+            # Consumers end with the stream, even if the producer didn't close it
+            channel = Channel.of(run_id, name)
+            if succeeded:
+                channel.close()
+            else:
+                channel.fail(f"Step {key} failed")
+
+        # A consumer that ended, even killed, no longer holds its producers back
+        for producer, names in self._streams.get(key, {}).items():
+            producer_run_id = self.workflow_runs[producer].run_id
+            for name in names:
+                Channel.of(producer_run_id, name).remove_reader(run_id)
+
+    def _handle_failure(self, queue: ReadyQueue, key: str, on_failure: str) -> bool:
+        self._failed.add(key)
+        self._failed_at = self._failed_at or time.monotonic()
+        if on_failure == FAIL_FAST:
+            return True
+
+        if on_failure == BEST_EFFORT:
+            queue.mark_done(key)
+        else:
+            self._skip_downstream(queue, key)
+
+        return False
+
+    def _skip_downstream(self, queue: ReadyQueue, key: str) -> None:
+        skipped = queue.skip(key)
+        if not skipped:
+            return
+
+        _logger.info("Skipping steps downstream of %s: %s", key, ", ".join(skipped))
+        self._skipped.extend(skipped)
+        self.tracker.set_tag(self.run_id, SKIPPED_TAG, ", ".join(self._skipped))
+
+    def _prefetch_dependencies(self, keys: list[str], run_args: dict[str, Any]) -> None:
+        dependencies = {
+            dependency
+            for key in keys
+            for dependency in self.workflow_runs[key].entry_point.depends_on
+            if dependency in self.spans and dependency in self.workflow_runs
+        }
+        run_ids = {key: self.workflow_runs[key].run_id for key in dependencies}
+        if not run_ids:
+            return
+
+        experiment_ids = [self.active_run.info.experiment_id]
+        if run_args.get("experiment_id"):
+            experiment_ids.append(run_args["experiment_id"])
+
+        runs = self.tracker.get_runs(run_ids.values(), experiment_ids)
+        for key, run_id in run_ids.items():
+            self.workflow_runs[key].set_run(runs[run_id])
+
+    def _start(self, key: str, run_args: dict[str, Any]) -> None:
+        wrun = self.workflow_runs[key]
+        if wrun.attempt == 0:
+            self.tracer.add_queue_wait(key, wrun.entry_point.depends_on)
+        self.hooks.emit(STEP_READY, workflow=self, key=key)
+
+        with self.tracer.span(SUBMIT_SPAN, key):
+            self.runtime_context[key] = self._submit(key, run_args)
+        self._submitted_at[key] = time.time()
+        if key in self._step_logs:
+            self._step_logs[key].run_id = wrun.run_id
+        if any(key in producers for producers in self._streams.values()):
+            self._producing.add(key)
+        self.hooks.emit(STEP_SUBMITTED, workflow=self, key=key, run_id=wrun.run_id)
+        self.watcher.watch(key, self.runtime_context[key], wrun.timeout)
+
+    def _submit(self, key: str, run_args: dict[str, Any]) -> SubmittedRun:
+        wrun = self.workflow_runs[key]
+        with self.tracer.span(RESOLVE_SPAN, key):
+            parameters = wrun.resolve_params(
+                self.workflow_runs, self.hooks, self.artifacts
+            )
+        parent_run_id = self._get_parent_run_id(key)
+
+        if wrun.entry_point.workflow:
+            experiment_id = (
+                run_args.get("experiment_id") or self.active_run.info.experiment_id
+            )
+            tags = {
+                MLFLOW_PARENT_RUN_ID: parent_run_id,
+                MLFLOW_RUN_NAME: key,
+                MLFLOW_PROJECT_ENTRY_POINT: wrun.entry_point.entry,
+                MLFLOW_SOURCE_NAME: wrun.entry_point.source,
+            }
+            return wrun.start_workflow(
+                self.workflow_runs, self.tracker, experiment_id, tags, parameters
+            )
+
+        cache_key = self._get_cache_key(key, parameters, run_args)
+        if cache_key is not None:
+            cached_run = self.cache.lookup(key, wrun.entry_point, cache_key)
+            if cached_run is not None:
+                _logger.info("Reusing run %s for step %s", cached_run.info.run_id, key)
+                self.tracker.set_tag(
+                    self.run_id, CACHE_HIT_TAG_PREFIX + key, cached_run.info.run_id
+                )
+                return wrun.reuse(cached_run)
+
+        submitted_run = wrun.submit(
+            self.workflow_runs,
+            {**run_args, "run_name": key},
+            parameters,
+            executor=self.executor,
+            log_path=self._open_log(key),
+        )
+        self.journal.record(key, submitted_run.run_id, RunStatus.RUNNING)
+        if wrun.entry_point.retries:
+            self.tracker.set_tag(submitted_run.run_id, ATTEMPT_TAG, wrun.attempt)
+        # mlflow.run only makes steps children of the thread's active run, if any
+        self.tracker.set_tag(submitted_run.run_id, MLFLOW_PARENT_RUN_ID, parent_run_id)
+        if cache_key is not None:
+            self.cache.record(submitted_run.run_id, cache_key)
+
+        return submitted_run
+
+    def _get_cache_key(
+        self, key: str, parameters: dict[str, Any], run_args: dict[str, Any]
+    ) -> str | None:
+        # Streams don't outlive the workflow that wrote them: producers always run
+        if self.cache is None or key in self._channels:
+            return None
+
+        # The root and nested workflow runs are new on every invocation: their
+        # parameters are already part of the resolved parameters
+        entry_point = self.workflow_runs[key].entry_point
+        upstream_run_ids = [
+            self.workflow_runs[dependency].run.info.run_id
+            for dependency in entry_point.depends_on
+            if dependency != self.root_entry_point
+            and dependency in self.workflow_runs
+            and not self.workflow_runs[dependency].entry_point.workflow
+        ]
+        return self.cache.get_key(entry_point, parameters, upstream_run_ids, run_args)
+
+    def _get_parent_run_id(self, key: str) -> str:
+        parent = self.workflow_runs[key].entry_point.parent
+        if parent is None:
+            return self.run_id
+
+        return self.workflow_runs[parent].run_id
+
+    def _close_workflows(self, key: str) -> None:
+        for workflow_key, members in list(self._open_workflows.items()):
+            members.discard(key)
+            if members or workflow_key not in self.spans:
+                continue
+
+            del self._open_workflows[workflow_key]
+            failed = self._failed & get_members(self.workflow_runs, workflow_key)
+            run_id = self.workflow_runs[workflow_key].run_id
+            self.tracker.set_terminated(
+                run_id, RunStatus.FAILED if failed else RunStatus.FINISHED
+            )
+
+    @property
+    def graph(self) -> dict[str, set[str]]:
+        return {
+            key: wrun.entry_point.depends_on for key, wrun in self.workflow_runs.items()
+        }
+
     def wait(self) -> bool:
-        for key in list(self.runtime_context):
-            submitted_run = self.runtime_context.pop(key)
-            if not submitted_run.wait():
+        while self.runtime_context:
+            if self._cancel_requested.is_set():
+                self.cancel()
+                return False
+
+            # None when woken up by `request_cancel`
+            completed = self._wait_first()
+            if completed is not None and not completed[1]:
                 return False
 
         return True
 
+    def _wait_first(self, timeout: float | None = None) -> tuple[str, bool] | None:
+        completed = self.watcher.next_completed(timeout)
+        if completed is not None:
+            del self.runtime_context[completed[0]]
+
+        return completed
+
+    def _report_critical_path(self) -> None:
+        path = critical_path(self.graph, self.spans)
+        if not path:
+            return
+
+        duration = self.spans[path[-1]][1] - self.spans[path[0]][0]
+        _logger.info("Critical path (%.1fs): %s", duration, " -> ".join(path))
+        self.tracker.set_tag(self.run_id, "mlflower.critical_path", " -> ".join(path))
+
+    def _report_trace(self) -> None:
+        spans = self.tracer.spans
+        if not spans:
+            return
+
+        for name, duration in self.tracer.get_durations().items():
+            self.tracker.log_metric(self.run_id, TRACE_METRIC_PREFIX + name, duration)
+
+        for step, (time_, running) in enumerate(get_parallelism(spans)):
+            self.tracker.log_metric(
+                self.run_id, PARALLELISM_METRIC, running, int(time_ * 1000), step
+            )
+
+        path = critical_path(self.graph, self.spans)
+        trace = to_chrome_trace(spans, path)
+        self.tracker.log_text(self.run_id, json.dumps(trace), TRACE_ARTIFACT)
+
+        sweeps = {
+            key: wrun.entry_point.parent
+            for key, wrun in self.workflow_runs.items()
+            if wrun.entry_point.sweep is not None
+        }
+        gantt = get_mermaid_gantt(spans, path, (QUEUE_SPAN, RUN_SPAN), sweeps)
+        self.tracker.log_text(self.run_id, gantt, GANTT_ARTIFACT)
+        # Timelines too long for the note are only in the artifact
+        note = f"{self._graph_note}\n\n{to_link(gantt, alt_text='Execution Timeline')}"
+        if len(note) <= MAX_TAG_LENGTH:
+            self.tracker.set_tag(self.run_id, NOTE_TAG, note)
+
     def cancel(self) -> None:
         return self._cleanup(RunStatus.KILLED)
 
+    def request_cancel(self) -> None:
+        # Thread-safe: the thread running the workflow cancels it as soon as it wakes up
+        self._cancel_requested.set()
+        self.watcher.interrupt()
+
     def fail(self) -> None:
         return self._cleanup(RunStatus.FAILED)
 
@@ -103,21 +762,52 @@ class Workflow(SubmittedRun):
         if RunStatus.is_terminated(self.get_status()):
             return
 
-        for job_key in list(self.runtime_context.keys()):
-            submitted_run = self.runtime_context.pop(job_key)
-            with contextlib.suppress(AttributeError):
-                # submitted_run.cancel doesn't work on Windows (mlflow 2.8.0)
-                submitted_run.cancel()
+        # Runs are cancelled concurrently: cancel() waits for the run to terminate
+        submitted_runs = list(self.runtime_context.values())
+        self.runtime_context.clear()
+        if submitted_runs:
+            with ThreadPoolExecutor(max_workers=len(submitted_runs)) as executor:
+                executor.map(_cancel, submitted_runs)
+
+        for workflow_key in list(self._open_workflows):
+            if workflow_key in self.spans:
+                self.tracker.set_terminated(
+                    self.workflow_runs[workflow_key].run_id, status
+                )
+        self._open_workflows.clear()
 
         self._end_run(status)
 
     def _end_run(self, status: RunStatus) -> None:
         self._status = status
+        if status == RunStatus.FINISHED:
+            # Kept otherwise, for a resumed workflow to read them again
+            for key in self._channels.keys() & self.spans.keys():
+                delete_streams(self.workflow_runs[key].run_id)
+        if self.artifacts is not None:
+            self.artifacts.close()
+        if self.executor is not None:
+            self.executor.close()
+        if self.logs is not None:
+            self.logs.shutdown()
+        if self._failed_at is not None:
+            time_to_abort = time.monotonic() - self._failed_at
+            _logger.info("Workflow ended %.1fs after the first failure", time_to_abort)
+            self.tracker.log_metric(self.run_id, TIME_TO_ABORT_METRIC, time_to_abort)
+        self._report_trace()
+        self.hooks.emit(WORKFLOW_ENDED, workflow=self, status=status)
+        self.tracker.report(self.run_id)
 
         if self._is_internal:
             mlflow.end_run(RunStatus.to_string(status))
 
 
+def _cancel(submitted_run: SubmittedRun) -> None:
+    with contextlib.suppress(AttributeError):
+        # submitted_run.cancel doesn't work on Windows (mlflow 2.8.0)
+        submitted_run.cancel()
+
+
 def get_run_args(
     active_run: Run, run_args: dict[str, str | None] | None
 ) -> dict[str, str | None]:
@@ -1,24 +1,60 @@
 from __future__ import annotations
 
+import json
 import os
 from contextlib import contextmanager
+from pathlib import Path
 from typing import Any
 
 import mlflow
-from mlflow.entities import Run
+from mlflow.entities import Run, RunStatus
 from mlflow.projects import SubmittedRun
 
+from . import pool
+from .artifacts import ArtifactPrefetcher
 from .entry_point import EntryPoint
-from .project import SOURCE_CONTENT_KEY, SOURCE_ID_KEY, SOURCE_TYPE_KEY
+from .executor import WarmPool
+from .hooks import PARAM_RESOLVED, HookRegistry
+from .logs import redirect_output
+from .pool import POOL_BACKEND
+from .project import (
+    SOURCE_COLLECT_KEY,
+    SOURCE_CONTENT_KEY,
+    SOURCE_ID_KEY,
+    SOURCE_TYPE_KEY,
+)
+from .settings import parse_duration
+from .streams import Channel
+from .sweep import get_shards
+from .tracking import Tracker
 
 
 class OrchestrationError(Exception):
     pass
 
 
+class FinishedRun(SubmittedRun):
+    def __init__(self, run: Run):
+        self.run = run
+
+    def wait(self) -> bool:
+        return True
+
+    def get_status(self) -> RunStatus:
+        return RunStatus.FINISHED
+
+    def cancel(self) -> None:
+        pass
+
+    @property
+    def run_id(self) -> str:
+        return self.run.info.run_id
+
+
 class WorkflowRun:
     def __init__(self, entry_point: EntryPoint, run: Run | None = None):
         self.entry_point = entry_point
+        self.attempt = 0
 
         self._submitted_run: SubmittedRun | None = None
         self._run = run
@@ -35,51 +71,168 @@ class WorkflowRun:
 
         return self._run
 
-    def wait_dependencies(self, runtime_context: dict[str, SubmittedRun]) -> bool:
-        for dependency in self.entry_point.depends_on:
-            if dependency not in runtime_context:
-                continue
+    @property
+    def run_id(self) -> str:
+        if self._submitted_run is not None:
+            return self._submitted_run.run_id
 
-            run_dependency = runtime_context[dependency]
+        return self.run.info.run_id
 
-            if not run_dependency.wait():
-                return False
+    @property
+    def can_retry(self) -> bool:
+        return self.attempt <= self.entry_point.retries
 
-            runtime_context.pop(dependency)
+    @property
+    def retry_delay(self) -> float:
+        return parse_duration(self.entry_point.retry_backoff) * 2 ** (self.attempt - 1)
 
-        return True
+    @property
+    def timeout(self) -> float | None:
+        if self.entry_point.timeout is None:
+            return None
+
+        return parse_duration(self.entry_point.timeout)
 
     def submit(
-        self, w_runs: dict[str, WorkflowRun], args: dict | None = None
+        self,
+        w_runs: dict[str, WorkflowRun],
+        args: dict | None = None,
+        parameters: dict[str, Any] | None = None,
+        executor: WarmPool | None = None,
+        log_path: Path | None = None,
     ) -> SubmittedRun:
-        if self._submitted_run is not None:
+        if self._submitted_run is not None and not self.can_retry:
             raise OrchestrationError()
 
+        if parameters is None:
+            parameters = self.resolve_params(w_runs)
+
+        self.attempt += 1
+        self._run = None
         source = self.entry_point.source
+        if (args or {}).get("backend") == POOL_BACKEND:
+            self._submitted_run = pool.submit(
+                source,
+                self.entry_point.entry,
+                parameters,
+                args,
+                upstream_run_ids=self.get_upstream_run_ids(w_runs),
+            )
+            return self._submitted_run
+
+        if executor is not None and self.entry_point.warm:
+            self._submitted_run = executor.submit(
+                source, self.entry_point.entry, parameters, args or {}, log_path
+            )
+            if self._submitted_run is not None:
+                return self._submitted_run
+
         # with working_directory(self.entry_point.source) as source:
-        self._submitted_run = mlflow.run(
-            source,
-            self.entry_point.entry,
-            parameters=self._resolve_params(w_runs),
-            **(args or {}),
-        )
+        with redirect_output(log_path):
+            self._submitted_run = mlflow.run(
+                source,
+                self.entry_point.entry,
+                parameters=parameters,
+                **(args or {}),
+            )
+
+        return self._submitted_run
+
+    def start_workflow(
+        self,
+        w_runs: dict[str, WorkflowRun],
+        tracker: Tracker,
+        experiment_id: str,
+        tags: dict[str, str],
+        parameters: dict[str, Any] | None = None,
+    ) -> SubmittedRun:
+        if parameters is None:
+            parameters = self.resolve_params(w_runs)
+
+        run_id = tracker.create_run(experiment_id, tags=tags).info.run_id
+        tracker.log_params(run_id, parameters)
+        tracker.flush()
+
+        return self.reuse(tracker.get_run(run_id))
+
+    def set_run(self, run: Run) -> None:
+        self._run = run
+
+    def reuse(self, run: Run) -> SubmittedRun:
+        if self._submitted_run is not None:
+            raise OrchestrationError()
+
+        self._run = run
+        self._submitted_run = FinishedRun(run)
 
         return self._submitted_run
 
-    def _resolve_params(self, w_runs: dict[str, WorkflowRun]) -> dict[str, Any]:
-        return {
-            key: get_param(param, w_runs)
+    def get_upstream_run_ids(self, w_runs: dict[str, WorkflowRun]) -> list[str]:
+        # Runs of the steps this one depends on or takes parameters or artifacts from
+        keys = set(self.entry_point.depends_on)
+        keys.update(
+            param[SOURCE_ID_KEY]
+            for param in self.entry_point.workflow_parameters.values()
+        )
+        entry_points = {name: wrun.entry_point for name, wrun in w_runs.items()}
+        return [
+            w_runs[step].run_id
+            for key in keys
+            if key in w_runs
+            for step in get_shards(entry_points, key) or [key]
+            if w_runs[step]._submitted_run is not None
+        ]
+
+    def resolve_params(
+        self,
+        w_runs: dict[str, WorkflowRun],
+        hooks: HookRegistry | None = None,
+        artifacts: ArtifactPrefetcher | None = None,
+    ) -> dict[str, Any]:
+        parameters = {
+            key: get_param(param, w_runs, artifacts)
             for key, param in self.entry_point.workflow_parameters.items()
         }
+        parameters.update(self.entry_point.sweep or {})
+
+        if hooks:
+            for name, value in parameters.items():
+                hooks.emit(PARAM_RESOLVED, workflow_run=self, name=name, value=value)
+
+        return parameters
 
 
-def get_param(param: dict, w_runs: dict[str, WorkflowRun]) -> Any:
+def get_param(
+    param: dict,
+    w_runs: dict[str, WorkflowRun],
+    artifacts: ArtifactPrefetcher | None = None,
+) -> Any:
     source_type = param[SOURCE_TYPE_KEY]
     entry_point_id = param[SOURCE_ID_KEY]
     key = param[SOURCE_CONTENT_KEY]
 
+    if source_type == "collect":
+        # Fan-in: a JSON list with the value of each shard of a sweep
+        entry_points = {name: wrun.entry_point for name, wrun in w_runs.items()}
+        shards = get_shards(entry_points, entry_point_id) or [entry_point_id]
+        shard_param = {
+            **param,
+            SOURCE_TYPE_KEY: param.get(SOURCE_COLLECT_KEY, "artifact"),
+        }
+        return json.dumps(
+            [
+                get_param({**shard_param, SOURCE_ID_KEY: shard}, w_runs, artifacts)
+                for shard in shards
+            ]
+        )
+
     if source_type == "artifact":
         run = w_runs[entry_point_id].run
+        if artifacts is not None:
+            local_path = artifacts.get_path(run.info.run_id, key)
+            if local_path is not None:
+                return local_path
+
         return run.info.artifact_uri + "/" + key
 
     if source_type == "parameter":
@@ -91,6 +244,10 @@ def get_param(param: dict, w_runs: dict[str, WorkflowRun]) -> Any:
 
         return wrun.entry_point.defaults[key]
 
+    if source_type == "stream":
+        # The channel of the producer's run, which may still be writing to it
+        return Channel.of(w_runs[entry_point_id].run_id, key).path.as_posix()
+
     raise ValueError(f"Unsupported source type: {source_type}")
 
 
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Iterator
+
+import mlflow
+import pytest
+from mlflow import MlflowClient
+from mlflow.entities import RunStatus
+
+from mlflower.server import FINISHED, KILLED, QUEUED, RUNNING, Job, WorkflowService
+from mlflower.workflow import Workflow
+
+TIMEOUT = 10.0
+
+
+# Stands in for a workflow: each step takes a slot of the job's budget share, and holds
+# it until the test lets it go
+class FakeWorkflow:
+    def __init__(self, job_name: str, steps: int = 0):
+        self.job_name = job_name
+        self.steps = steps
+        self.share: Any = None
+        self.started = threading.Event()
+        self.waiting = threading.Event()
+        self.finish = threading.Event()
+        self.acquired = 0
+        self.cancelled = False
+        self.status = RunStatus.RUNNING
+        self._wake = threading.Event()
+        self.watcher = SimpleNamespace(interrupt=self._wake.set)
+
+    def run(self, run_args: dict[str, Any]) -> None:
+        self.share = run_args["budget"]
+        self.started.set()
+        while self.acquired < self.steps and not self.cancelled:
+            if self.share.acquire():
+                self.acquired += 1
+                acquisitions.append(self.job_name)
+            else:
+                self.waiting.set()
+                self._wake.wait(0.1)
+                self._wake.clear()
+        while not self.finish.wait(0.01) and not self.cancelled:
+            pass
+        self.status = RunStatus.KILLED if self.cancelled else RunStatus.FINISHED
+
+    def get_status(self) -> RunStatus:
+        return self.status
+
+    def request_cancel(self) -> None:
+        self.cancelled = True
+
+    def fail(self) -> None:
+        self.status = RunStatus.FAILED
+
+
+acquisitions: list[str] = []
+
+
+@pytest.fixture(scope="module")
+def experiments(tmp_path_factory: pytest.TempPathFactory) -> Iterator[dict[str, str]]:
+    tracking_uri = f"sqlite:///{tmp_path_factory.mktemp('mlflow')}/mlflow.db"
+    previous = os.environ.get("MLFLOW_TRACKING_URI")
+    os.environ["MLFLOW_TRACKING_URI"] = tracking_uri
+    yield {name: mlflow.create_experiment(name) for name in ("a", "b")}
+    if previous is None:
+        del os.environ["MLFLOW_TRACKING_URI"]
+    else:
+        os.environ["MLFLOW_TRACKING_URI"] = previous
+
+
+@pytest.fixture
+def workflows(
+    monkeypatch: pytest.MonkeyPatch, experiments: dict[str, str]
+) -> dict[str, FakeWorkflow]:
+    # Workflows to run, by run name
+    workflows: dict[str, FakeWorkflow] = {}
+    acquisitions.clear()
+
+    def from_project_uri(uri: str, active_run: Any, entry_point: Any) -> FakeWorkflow:
+        return workflows[active_run.info.run_name]
+
+    monkeypatch.setattr(Workflow, "from_project_uri", from_project_uri)
+    return workflows
+
+
+def submit(
+    service: WorkflowService, name: str, experiment_id: str, **request: Any
+) -> Job:
+    return service.submit(
+        {"uri": "project", "run_name": name, "experiment_id": experiment_id, **request}
+    )
+
+
+def wait_for(condition: Callable[[], bool]) -> None:
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.01)
+
+
+def test_submit(workflows, experiments):
+    service = WorkflowService(max_steps=1)
+    workflows["job"] = FakeWorkflow("job", steps=1)
+    workflows["job"].finish.set()
+
+    job = submit(service, "job", experiments["a"], parameters={"alpha": 0.5})
+    wait_for(lambda: job.ended_at is not None)
+
+    assert job.status == FINISHED
+    assert service.get(job.id) is job
+    run = MlflowClient().get_run(job.run_id)
+    assert run.info.status == FINISHED
+    assert run.info.experiment_id == experiments["a"]
+    assert run.data.params == {"alpha": "0.5"}
+    assert service.budget.running == 0
+
+
+def test_submit_rejects_unknown_fields(workflows, experiments):
+    service = WorkflowService(max_steps=1)
+    with pytest.raises(ValueError, match=r"run_args\.unknown"):
+        submit(service, "job", experiments["a"], run_args={"unknown": 1})
+
+
+def test_cancel(workflows, experiments):
+    service = WorkflowService(max_steps=1, max_workflows=1)
+    workflows["running"] = FakeWorkflow("running")
+    running = submit(service, "running", experiments["a"])
+    queued = submit(service, "queued", experiments["a"])
+    assert workflows["running"].started.wait(TIMEOUT)
+    assert (running.status, queued.status) == (RUNNING, QUEUED)
+
+    # A queued job never starts, a running one is cancelled through its workflow
+    assert service.cancel(queued.id).status == KILLED
+    service.cancel(running.id)
+    wait_for(lambda: running.ended_at is not None)
+
+    assert running.status == KILLED
+    assert queued.run_id is None
+    assert MlflowClient().get_run(running.run_id).info.status == KILLED
+
+
+def test_fair_share(workflows, experiments):
+    # The slot a workflow of `a` releases goes to `b`, which has none, before the
+    # other workflow of `a` gets one
+    service = WorkflowService(max_steps=2)
+    for name, steps in (("a1", 2), ("a2", 1), ("b1", 1)):
+        workflows[name] = FakeWorkflow(name, steps)
+
+    submit(service, "a1", experiments["a"])
+    wait_for(lambda: workflows["a1"].acquired == 2)
+    submit(service, "a2", experiments["a"])
+    submit(service, "b1", experiments["b"])
+    wait_for(
+        lambda: workflows["a2"].waiting.is_set() and workflows["b1"].waiting.is_set()
+    )
+
+    workflows["a1"].share.release()
+    wait_for(lambda: len(acquisitions) == 3)
+    workflows["a1"].share.release()
+    wait_for(lambda: len(acquisitions) == 4)
+
+    assert acquisitions == ["a1", "a1", "b1", "a2"]
+    for workflow in workflows.values():
+        workflow.finish.set()
+    wait_for(lambda: all(job.ended_at for job in service.list()))
+
+
+def test_priority(workflows, experiments):
+    # Higher priorities first, whatever their group's share
+    service = WorkflowService(max_steps=1)
+    for name in ("a1", "a2", "b1"):
+        workflows[name] = FakeWorkflow(name, steps=1)
+
+    submit(service, "a1", experiments["a"])
+    wait_for(lambda: workflows["a1"].acquired == 1)
+    submit(service, "b1", experiments["b"])
+    submit(service, "a2", experiments["a"], priority=1)
+    wait_for(
+        lambda: workflows["a2"].waiting.is_set() and workflows["b1"].waiting.is_set()
+    )
+
+    workflows["a1"].finish.set()
+    wait_for(lambda: len(acquisitions) == 2)
+    workflows["a2"].finish.set()
+    wait_for(lambda: len(acquisitions) == 3)
+
+    assert acquisitions == ["a1", "a2", "b1"]
+    workflows["b1"].finish.set()
+    wait_for(lambda: all(job.ended_at for job in service.list()))